@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Benchmark peak memory and throughput of file hashing.
+
+Compares reading a whole file into memory before hashing it with the chunked hashing
+engine used by FileAPI.calculate_hash, for a range of file sizes.
+"""
+import os
+import tempfile
+import tracemalloc
+from hashlib import sha1
+from pathlib import Path
+from time import perf_counter
+
+import click
+
+from data_pipeline_api.hashing import DEFAULT_BLOCK_SIZE, calculate_file_hash
+
+MB = 1 << 20
+SIZES = (1 * MB, 10 * MB, 100 * MB, 1024 * MB, 10 * 1024 * MB)
+
+
+def whole_file_hash(filename: Path) -> str:
+    with open(filename, "rb") as file:
+        return sha1(file.read()).hexdigest()
+
+
+def write_random_file(filename: Path, size: int):
+    with open(filename, "wb") as file:
+        remaining = size
+        while remaining:
+            block = os.urandom(min(remaining, 16 * MB))
+            file.write(block)
+            remaining -= len(block)
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = perf_counter()
+    result = function(*args)
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+@click.command(context_settings=dict(max_content_width=200))
+@click.option(
+    "--directory",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Directory to write the benchmark files to (defaults to a temporary one).",
+)
+@click.option(
+    "--max-size", type=int, default=SIZES[-1] // MB, help="Largest file size in MB."
+)
+@click.option(
+    "--whole-file-limit",
+    type=int,
+    default=1024,
+    help="Largest file size in MB to hash by reading the whole file into memory.",
+)
+@click.option("--block-size", type=int, default=DEFAULT_BLOCK_SIZE // 1024, help="KB.")
+def benchmark_cli(directory, max_size, whole_file_limit, block_size):
+    """Benchmark hashing files from 1 MB to 10 GB.
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as temporary_directory:
+        filename = Path(temporary_directory) / "benchmark.bin"
+        print(f"{'size':>10} {'method':>10} {'MB/s':>10} {'peak MB':>10}")
+        for size in SIZES:
+            if size > max_size * MB:
+                break
+            write_random_file(filename, size)
+            methods = [
+                ("chunked", calculate_file_hash, filename, None, block_size * 1024)
+            ]
+            if size <= whole_file_limit * MB:
+                methods.append(("whole", whole_file_hash, filename))
+            results = set()
+            for name, function, *args in methods:
+                result, elapsed, peak = measure(function, *args)
+                results.add(result)
+                print(
+                    f"{size // MB:>8}MB {name:>10} {size / MB / elapsed:>10.1f} "
+                    f"{peak / MB:>10.2f}"
+                )
+            assert len(results) == 1, "hashing methods disagree"
+            filename.unlink()
+
+
+if __name__ == "__main__":
+    # pylint: disable=no-value-for-parameter
+    benchmark_cli()
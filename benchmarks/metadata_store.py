@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Benchmark MetadataStore lookups as the size of the store grows.
+
+Compares indexed lookups with literal values against a scan that matches every
+record, and reports the time of a lookup that needs the full glob scan.
+"""
+import random
+from time import perf_counter
+
+import click
+
+from data_pipeline_api.metadata import matches
+from data_pipeline_api.metadata_store import MetadataStore
+
+SIZES = (1_000, 10_000, 100_000, 200_000)
+
+
+def make_metadata(size: int):
+    return [
+        {
+            "data_product": f"product/{index // 10}",
+            "namespace": f"namespace{index % 7}",
+            "component": f"component{index % 10}",
+            "filename": f"product/{index // 10}/{index}.h5",
+            "version": f"{index % 3}.0.0",
+        }
+        for index in range(size)
+    ]
+
+
+def scan(metadata_sequence, pattern):
+    return [metadata for metadata in metadata_sequence if matches(metadata, pattern)]
+
+
+def time_lookups(function, patterns) -> float:
+    start = perf_counter()
+    for pattern in patterns:
+        function(pattern)
+    return (perf_counter() - start) / len(patterns)
+
+
+@click.command(context_settings=dict(max_content_width=200))
+@click.option("--max-size", type=int, default=SIZES[-1], help="Largest store size.")
+@click.option("--lookups", type=int, default=100, help="Lookups per measurement.")
+@click.option("--seed", type=int, default=0, help="Random seed.")
+def benchmark_cli(max_size, lookups, seed):
+    """Benchmark MetadataStore.find on stores of 1k to 200k records.
+    """
+    random_generator = random.Random(seed)
+    print(f"{'size':>10} {'scan ms':>10} {'indexed ms':>10} {'glob ms':>10}")
+    for size in SIZES:
+        if size > max_size:
+            break
+        metadata_sequence = make_metadata(size)
+        store = MetadataStore(metadata_sequence)
+        patterns = [
+            {
+                "data_product": f"product/{index // 10}",
+                "component": f"component{index % 10}",
+            }
+            for index in (random_generator.randrange(size) for _ in range(lookups))
+        ]
+        for pattern in patterns:
+            assert store.find(pattern) in scan(metadata_sequence, pattern)
+        scan_time = time_lookups(lambda p: scan(metadata_sequence, p), patterns)
+        indexed_time = time_lookups(store.find, patterns)
+        glob_time = time_lookups(
+            store.find, [{"data_product": "product/1*"}] * max(1, lookups // 10)
+        )
+        print(
+            f"{size:>10} {scan_time * 1e3:>10.3f} {indexed_time * 1e3:>10.3f} "
+            f"{glob_time * 1e3:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    # pylint: disable=no-value-for-parameter
+    benchmark_cli()
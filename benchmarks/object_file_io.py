@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Benchmark throughput of object file reads and writes through StandardAPI.
+
+Compares HDF5 reading and writing through the Python file objects returned by
+FileAPI.open_for_read and open_for_write with HDF5 opening the files natively through
+the paths returned by FileAPI.get_path_for_read and get_path_for_write, for tables
+and arrays of a range of sizes. Times include hashing and the access log.
+"""
+import logging
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import click
+import numpy as np
+import pandas as pd
+import yaml
+
+from data_pipeline_api.standard_api import Array, StandardAPI
+
+MB = 1 << 20
+SIZES = (1 * MB, 10 * MB, 100 * MB, 1024 * MB)
+
+
+def make_table(size: int) -> pd.DataFrame:
+    rows = size // 16
+    return pd.DataFrame({"a": np.arange(rows), "b": np.random.rand(rows)})
+
+
+def make_array(size: int) -> Array:
+    return Array(np.random.rand(size // 8))
+
+
+def write_config(directory: Path, run_id: str, metadata):
+    with open(directory / "metadata.yaml", "w") as metadata_file:
+        yaml.safe_dump(metadata, metadata_file)
+    with open(directory / "config.yaml", "w") as config_file:
+        yaml.safe_dump(
+            {
+                "data_directory": ".",
+                "run_id": run_id,
+                "fail_on_hash_mismatch": False,
+            },
+            config_file,
+        )
+    return directory / "config.yaml"
+
+
+def time_run(directory: Path, run_id: str, metadata, native_hdf5: bool, function):
+    config_filename = write_config(directory, run_id, metadata)
+    start = perf_counter()
+    with StandardAPI.from_config(
+        config_filename, "benchmark", "benchmark", native_hdf5=native_hdf5
+    ) as api:
+        function(api)
+    return perf_counter() - start
+
+
+@click.command(context_settings=dict(max_content_width=200))
+@click.option(
+    "--directory",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Directory to write the benchmark files to (defaults to a temporary one).",
+)
+@click.option(
+    "--max-size", type=int, default=SIZES[-1] // MB, help="Largest object in MB."
+)
+def benchmark_cli(directory, max_size):
+    """Benchmark table and array reads and writes with and without native HDF5.
+    """
+    logging.getLogger("data_pipeline_api").setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory(dir=directory) as temporary_directory:
+        directory = Path(temporary_directory)
+        print(
+            f"{'object':>8} {'size MB':>8} {'mode':>12} {'write MB/s':>12} "
+            f"{'read MB/s':>12}"
+        )
+        for size in SIZES:
+            if size > max_size * MB:
+                break
+            for kind, make, write, read in (
+                ("table", make_table, "write_table", "read_table"),
+                ("array", make_array, "write_array", "read_array"),
+            ):
+                data = make(size)
+                for native_hdf5 in (False, True):
+                    mode = "native" if native_hdf5 else "file object"
+                    run_id = f"{kind}-{size}-{int(native_hdf5)}"
+                    write_time = time_run(
+                        directory,
+                        run_id,
+                        [],
+                        native_hdf5,
+                        lambda api: getattr(api, write)("output", kind, data),
+                    )
+                    read_metadata = [
+                        {
+                            "data_product": "output",
+                            "component": kind,
+                            "filename": f"output/{run_id}.h5",
+                        }
+                    ]
+                    read_time = time_run(
+                        directory,
+                        f"{run_id}-read",
+                        read_metadata,
+                        native_hdf5,
+                        lambda api: getattr(api, read)("output", kind),
+                    )
+                    print(
+                        f"{kind:>8} {size // MB:>8} {mode:>12} "
+                        f"{size / MB / write_time:>12.1f} "
+                        f"{size / MB / read_time:>12.1f}"
+                    )
+
+
+if __name__ == "__main__":
+    # pylint: disable=no-value-for-parameter
+    benchmark_cli()
@@ -0,0 +1,128 @@
+import json
+import os
+from datetime import date, datetime
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+import yaml
+
+logger = getLogger(__name__)
+
+JSON_LINES_SUFFIX = ".jsonl"
+TIMESTAMP_KEYS = ("timestamp", "last_timestamp", "open_timestamp", "close_timestamp")
+
+
+def is_json_lines(filename: Union[Path, str]) -> bool:
+    """Return True if an access log filename has the JSON lines suffix.
+    """
+    return Path(filename).suffix == JSON_LINES_SUFFIX
+
+
+def _encode(value: Any) -> str:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _decode_timestamps(mapping: Dict[str, Any]) -> Dict[str, Any]:
+    for key in TIMESTAMP_KEYS:
+        if isinstance(mapping.get(key), str):
+            mapping[key] = datetime.fromisoformat(mapping[key])
+    return mapping
+
+
+class JSONLinesAccessLogWriter:
+    def __init__(self, filename: Union[Path, str], header: Dict[str, Any]):
+        """The JSONLinesAccessLogWriter class writes an access log one line at a time.
+
+        The first line is a header holding the config and the run metadata known when
+        the log was opened, each following line is an access record, and the last
+        line is a footer holding the final run metadata. Each line is flushed as it
+        is written, so the log is complete up to the last access if the run fails.
+        """
+        self._file = open(filename, "w")
+        self._write(header)
+
+    def _write(self, line: Dict[str, Any]):
+        self._file.write(json.dumps(line, default=_encode))
+        self._file.write("\n")
+        self._file.flush()
+
+    def write_record(self, record: Dict[str, Any]):
+        self._write(record)
+
+    def close(self, footer: Dict[str, Any]):
+        self._write(footer)
+        self._file.close()
+
+
+class JSONLinesRecords:
+    def __init__(self, filename: Union[Path, str]):
+        """Iterable over the access records of a JSON lines access log.
+
+        The file is read lazily each time the records are iterated over.
+        """
+        self._filename = filename
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with open(self._filename) as access_log_file:
+            for line in access_log_file:
+                if not line.endswith("\n"):
+                    line = _decode_last_line(self._filename, line)
+                    if line is None:
+                        return
+                else:
+                    line = json.loads(line)
+                if "type" in line:
+                    yield _decode_timestamps(line)
+
+
+def _decode_last_line(
+    filename: Union[Path, str], line: Union[str, bytes]
+) -> Optional[Dict[str, Any]]:
+    """Decode the last line of a JSON lines access log, which is truncated if the
+    run failed while it was being written, returning None if it cannot be decoded.
+    """
+    try:
+        return json.loads(line)
+    except ValueError:
+        logger.warning("ignoring truncated last line of access log %s", filename)
+        return None
+
+
+def _read_last_line(filename: Union[Path, str], block_size: int = 1 << 16) -> bytes:
+    with open(filename, "rb") as file:
+        end = file.seek(0, os.SEEK_END)
+        data = b""
+        position = end
+        while position > 0:
+            position = max(0, position - block_size)
+            file.seek(position)
+            data = file.read(end - position)
+            if data.rstrip(b"\n").count(b"\n"):
+                break
+        return data.rstrip(b"\n").rsplit(b"\n", 1)[-1]
+
+
+def read_access_log(filename: Union[Path, str]) -> Dict[str, Any]:
+    """Read an access log in either the YAML or the JSON lines format.
+
+    For a JSON lines log, "io" is an iterable that reads the records from the file
+    as it is iterated over, rather than a list.
+    """
+    if not is_json_lines(filename):
+        with open(filename) as access_log_file:
+            return yaml.safe_load(access_log_file)
+    with open(filename) as access_log_file:
+        header = json.loads(access_log_file.readline())
+    access_log = {
+        "run_metadata": _decode_timestamps(header.get("run_metadata", {})),
+        "config": header.get("config", {}),
+        "io": JSONLinesRecords(filename),
+    }
+    footer = _decode_last_line(filename, _read_last_line(filename)) or {}
+    if "type" not in footer and "run_metadata" in footer:
+        access_log["run_metadata"] = _decode_timestamps(footer["run_metadata"])
+    if "close_timestamp" not in access_log["run_metadata"]:
+        logger.warning("access log %s was not closed", filename)
+    return access_log
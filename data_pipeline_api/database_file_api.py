@@ -1,7 +1,10 @@
 from logging import getLogger
 from io import IOBase
+from pathlib import Path
+from typing import Callable
 import __main__
 from data_pipeline_api.file_api import FileAPI, RunMetadata
+from data_pipeline_api.metadata import Metadata
 from data_pipeline_api.registry.download import download_from_configs
 from data_pipeline_api.registry.access_upload import upload_model_run
 from data_pipeline_api.registry.utils import get_access_token, get_remote_options
@@ -32,11 +35,9 @@ class DatabaseFileAPI(FileAPI):
             return False
         return True
 
-    def open_for_read(self, **call_metadata) -> IOBase:
-        """Attempt a read, and if it fails, attempt a download and try the read again.
-        """
+    def _read_with_download(self, read: Callable, call_metadata: Metadata):
         try:
-            return super().open_for_read(**call_metadata)
+            return read(**call_metadata)
         except (KeyError, FileNotFoundError):
             if self._has_run_metadata(DatabaseFileAPI.RUN_METADATA_NEEDED_FOR_DOWNLOAD):
                 download_from_configs(
@@ -44,11 +45,23 @@ class DatabaseFileAPI(FileAPI):
                     [{"where": self.get_read_metadata(call_metadata)}],
                     get_access_token(),
                     self._root,
+                    append_metadata=True,
                 )
-                self.load_metadata_store()
-                return super().open_for_read(**call_metadata)
+                self.update_metadata_store()
+                return read(**call_metadata)
             raise
 
+    def open_for_read(self, **call_metadata) -> IOBase:
+        """Attempt a read, and if it fails, attempt a download and try the read again.
+        """
+        return self._read_with_download(super().open_for_read, call_metadata)
+
+    def get_path_for_read(self, **call_metadata) -> Path:
+        """Attempt a read through a path, and if it fails, attempt a download and try
+        the read again.
+        """
+        return self._read_with_download(super().get_path_for_read, call_metadata)
+
     def close(self):
         """Close as normal, then attempt to upload the results to the database.
         """
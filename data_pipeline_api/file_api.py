@@ -1,19 +1,80 @@
-from io import IOBase
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import IOBase, BufferedReader, BufferedRandom
 from uuid import uuid4
 from datetime import datetime
+from time import time_ns
 from pathlib import Path
-from typing import Union, Optional, Any, Iterable, Dict, List
-from dataclasses import dataclass
-from hashlib import sha1
+from typing import (
+    Union,
+    Optional,
+    Any,
+    BinaryIO,
+    Callable,
+    Iterable,
+    Dict,
+    List,
+    NamedTuple,
+)
+from dataclasses import dataclass, replace
+from functools import partial
 from logging import getLogger, WARNING, DEBUG
+from weakref import WeakSet
 import yaml
 
-from data_pipeline_api.metadata import Metadata, MetadataKey, log_format_metadata
-from data_pipeline_api.metadata_store import MetadataStore
+from data_pipeline_api.access_log import JSONLinesAccessLogWriter, is_json_lines
+from data_pipeline_api.file_lock import lock_file
+from data_pipeline_api.hashing import (
+    DEFAULT_BLOCK_SIZE,
+    RACY_INTERVAL_NS,
+    HashCache,
+    HashingFileIO,
+    calculate_file_hash,
+    file_identity,
+)
+from data_pipeline_api.metadata import (
+    Metadata,
+    MetadataKey,
+    freeze_metadata,
+    log_format_metadata,
+)
+from data_pipeline_api.metadata_store import (
+    MetadataStore,
+    read_snapshot,
+    write_snapshot,
+)
 from data_pipeline_api.overrides import Overrides
+from data_pipeline_api.sqlite_metadata_store import SQLiteMetadataStore
 
 logger = getLogger(__name__)
 
+YAMLSafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+METADATA_TAIL_SIZE = 4096
+
+
+class MetadataFilePosition(NamedTuple):
+    """The extent of a metadata file that has been loaded, identified by its inode,
+    its size and its last METADATA_TAIL_SIZE bytes.
+    """
+
+    inode: int
+    size: int
+    tail: bytes
+
+
+def read_metadata_file_position(metadata_file: BinaryIO) -> MetadataFilePosition:
+    """Return the position of the end of an open metadata file.
+    """
+    stat_result = os.fstat(metadata_file.fileno())
+    start = max(0, stat_result.st_size - METADATA_TAIL_SIZE)
+    metadata_file.seek(start)
+    return MetadataFilePosition(
+        stat_result.st_ino,
+        stat_result.st_size,
+        metadata_file.read(stat_result.st_size - start),
+    )
+
 
 @dataclass(frozen=True)
 class FileAccess:
@@ -26,7 +87,9 @@ class FileAccess:
     path: Path
 
     def to_access_log_record(
-        self, hash_cache: Optional[Dict[Path, str]] = None
+        self,
+        hash_cache: Optional[Dict[Path, str]] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE,
     ) -> Dict[str, Any]:
         if hash_cache is None:
             hash_cache = {}
@@ -38,7 +101,7 @@ class FileAccess:
             except KeyError:
                 access_metadata[MetadataKey.calculated_hash] = hash_cache[
                     absolute_path
-                ] = FileAPI.calculate_hash(absolute_path)
+                ] = FileAPI.calculate_hash(absolute_path, block_size=block_size)
         return {
             "timestamp": self.timestamp,
             "call_metadata": self.call_metadata,
@@ -46,33 +109,50 @@ class FileAccess:
         }
 
 
+@dataclass(frozen=True)
 class ReadAccess(FileAccess):
-    """Represents a file read.
+    """Represents a file read, or a number of identical reads.
     """
 
+    count: int = 1
+    last_timestamp: Optional[datetime] = None
+
     def to_access_log_record(
-        self, hash_cache: Optional[Dict[Path, str]] = None
+        self,
+        hash_cache: Optional[Dict[Path, str]] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE,
     ) -> Dict[str, Any]:
-        return dict(type="read", **super().to_access_log_record(hash_cache))
+        record = dict(
+            type="read", **super().to_access_log_record(hash_cache, block_size)
+        )
+        if self.count > 1:
+            record["count"] = self.count
+            record["last_timestamp"] = self.last_timestamp
+        return record
 
 
 @dataclass(frozen=True)
 class WriteAccess(FileAccess):
-    """Represents a file write.
+    """Represents a file write, through a file handle, or through the path of the
+    file if file_handle is None.
     """
 
-    file_handle: IOBase
+    file_handle: Optional[IOBase] = None
 
     def to_access_log_record(
-        self, hash_cache: Optional[Dict[Path, str]] = None
+        self,
+        hash_cache: Optional[Dict[Path, str]] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE,
     ) -> Dict[str, Any]:
-        if not self.file_handle.closed:
+        if self.file_handle is not None and not self.file_handle.closed:
             logger.warning(
                 "the file handle to write to %s is still open, attempting to flush",
                 self.path,
             )
             self.file_handle.flush()
-        return dict(type="write", **super().to_access_log_record(hash_cache))
+        return dict(
+            type="write", **super().to_access_log_record(hash_cache, block_size)
+        )
 
 
 class RunMetadata:
@@ -94,6 +174,32 @@ class RunMetadata:
     submission_script = "submission_script"
 
 
+class HashVerification:
+    """Values of the hash_verification config key.
+
+    With open, inputs are hashed and verified before they are opened. With close
+    and session, inputs are hashed as they are read, and verified when the file is
+    closed; a mismatch raises immediately with close, and again when the FileAPI is
+    closed, and only when the FileAPI is closed with session.
+    """
+
+    open = "open"
+    close = "close"
+    session = "session"
+
+
+class MetadataBackend:
+    """Values of the metadata_backend config key.
+
+    With memory, metadata.yaml is loaded into a MetadataStore. With sqlite, it is
+    loaded into an SQLiteMetadataStore in metadata.sqlite, which is only rebuilt
+    when metadata.yaml changes.
+    """
+
+    memory = "memory"
+    sqlite = "sqlite"
+
+
 class FileAPI:
     RESERVED_RUN_METADATA_KEYS = {
         RunMetadata.run_id,
@@ -109,14 +215,19 @@ class FileAPI:
         return path if path.is_absolute() else root / path
 
     @staticmethod
-    def calculate_hash(filename: Path, extra_bytes: Optional[bytes] = None) -> str:
+    def calculate_hash(
+        filename: Path,
+        extra_bytes: Optional[bytes] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        hash_cache: Optional[HashCache] = None,
+    ) -> str:
         """Calculate the SHA1 hash of a file, optionally appending extra bytes.
+
+        The file is read in blocks of block_size bytes, so memory use does not grow
+        with the size of the file. If a hash_cache is given, the hash of a file that
+        has not changed since it was last hashed is taken from the cache.
         """
-        with open(filename, "rb") as file:
-            message = sha1(file.read())
-        if extra_bytes:
-            message.update(extra_bytes)
-        hexdigest = message.hexdigest()
+        hexdigest = calculate_file_hash(filename, extra_bytes, block_size, hash_cache)
         logger.debug(
             "calculated hash of %s as %s", filename, hexdigest,
         )
@@ -132,17 +243,66 @@ class FileAPI:
         )
 
     @staticmethod
-    def construct_metadata_store(metadata_filename: Path) -> MetadataStore:
+    def construct_metadata_store(
+        metadata_filename: Path, use_snapshot: bool = False
+    ) -> MetadataStore:
         """Construct a MetadataStore corresponding to a file.
+
+        If use_snapshot is True, the store is loaded from a snapshot next to the file
+        if one matches the current version of the file, and a new snapshot is
+        written otherwise.
         """
-        metadata_store = None
-        if metadata_filename.exists():
-            logger.debug("loading metadata from %s", metadata_filename)
-            with open(metadata_filename) as metadata_store_file:
-                metadata_store = yaml.safe_load(metadata_store_file)
-        else:
+        if not metadata_filename.exists():
+            logger.warning("could not find metadata.yaml")
+            return MetadataStore(None)
+        snapshot_filename = metadata_filename.with_suffix(".snapshot")
+        if use_snapshot:
+            metadata_store = read_snapshot(snapshot_filename, metadata_filename.stat())
+            if metadata_store is not None:
+                logger.debug("loaded metadata snapshot %s", snapshot_filename)
+                return metadata_store
+        logger.debug("loading metadata from %s", metadata_filename)
+        with open(metadata_filename) as metadata_store_file:
+            stat_result = os.fstat(metadata_store_file.fileno())
+            metadata_store = MetadataStore(
+                yaml.load(metadata_store_file, Loader=YAMLSafeLoader)
+            )
+            unchanged = file_identity(stat_result) == file_identity(
+                os.fstat(metadata_store_file.fileno())
+            )
+        if use_snapshot and unchanged:
+            write_snapshot(snapshot_filename, stat_result, metadata_store)
+        return metadata_store
+
+    @staticmethod
+    def construct_sqlite_metadata_store(metadata_filename: Path) -> SQLiteMetadataStore:
+        """Construct an SQLiteMetadataStore corresponding to a file.
+
+        The store is kept next to the file, and is rebuilt if it was not built from
+        the current version of the file. If the file does not exist, the store is
+        used as it is.
+        """
+        metadata_store = SQLiteMetadataStore(metadata_filename.with_suffix(".sqlite"))
+        if not metadata_filename.exists():
             logger.warning("could not find metadata.yaml")
-        return MetadataStore(metadata_store)
+            return metadata_store
+        with open(metadata_filename, "rb") as metadata_store_file:
+            stat_result = os.fstat(metadata_store_file.fileno())
+            if metadata_store.source == file_identity(stat_result):
+                logger.debug("using metadata store built from %s", metadata_filename)
+                return metadata_store
+            logger.debug("loading metadata from %s", metadata_filename)
+            metadata_sequence = yaml.load(metadata_store_file, Loader=YAMLSafeLoader)
+            unchanged = file_identity(stat_result) == file_identity(
+                os.fstat(metadata_store_file.fileno())
+            )
+        # As with snapshots, the source of a recently modified file is not recorded.
+        racy = time_ns() - stat_result.st_mtime_ns < RACY_INTERVAL_NS
+        metadata_store.replace(
+            metadata_sequence or [],
+            file_identity(stat_result) if unchanged and not racy else None,
+        )
+        return metadata_store
 
     def __init__(self, config_filename: Optional[Union[Path, str]] = None):
         """The FileAPI class provides tracked interaction with the filesystem.
@@ -154,6 +314,7 @@ class FileAPI:
         """
         self._accesses: List[FileAccess] = []
         self._run_metadata = {}
+        self._close_callbacks: List[Callable[[], None]] = []
 
         self._open_timestamp = datetime.now()
         logger.debug("open_timestamp = %s", self._open_timestamp)
@@ -180,6 +341,34 @@ class FileAPI:
             self._fail_on_hash_mismatch,
         )
 
+        self._hash_block_size = int(
+            self._config.get("hash_block_size", DEFAULT_BLOCK_SIZE)
+        )
+        if self._hash_block_size <= 0:
+            raise ValueError(
+                f"hash_block_size must be positive, not {self._hash_block_size}"
+            )
+        logger.debug("hash_block_size = %s", self._hash_block_size)
+
+        self._hash_workers = int(self._config.get("hash_workers", 1))
+        if self._hash_workers <= 0:
+            raise ValueError(f"hash_workers must be positive, not {self._hash_workers}")
+        logger.debug("hash_workers = %s", self._hash_workers)
+
+        self._hash_verification = self._config.get(
+            "hash_verification", HashVerification.open
+        )
+        if self._hash_verification not in (
+            HashVerification.open,
+            HashVerification.close,
+            HashVerification.session,
+        ):
+            raise ValueError(f"invalid hash_verification {self._hash_verification}")
+        logger.debug("hash_verification = %s", self._hash_verification)
+        self._hashing_files = WeakSet()
+        self._hash_mismatches: List[str] = []
+        self._writers: Dict[Path, HashingFileIO] = {}
+
         data_directory = self._config.get("data_directory", self._root)
         self._unnormalised_data_directory = Path(data_directory)
 
@@ -188,6 +377,12 @@ class FileAPI:
         )
         logger.debug("data_directory = %s", self._data_directory)
 
+        if self._config.get("use_hash_cache", True):
+            self._hash_cache = HashCache(self._data_directory / "hash_cache.json")
+        else:
+            self._hash_cache = None
+            logger.warning("disabled hash cache")
+
         access_log = self._config.get("access_log", "access-{run_id}.yaml")
         if access_log is False:
             self._access_log_path = None
@@ -197,6 +392,16 @@ class FileAPI:
                 self._root, Path(access_log.format(run_id=self._run_id)),
             )
         logger.debug("access_log_path = %s", self._access_log_path)
+        self._stream_access_log = self._access_log_path is not None and is_json_lines(
+            self._access_log_path
+        )
+        logger.debug("stream_access_log = %s", self._stream_access_log)
+        self._access_log_writer: Optional[JSONLinesAccessLogWriter] = None
+        self._pending_accesses: Dict[HashingFileIO, List[FileAccess]] = {}
+
+        self._aggregate_reads = self._config.get("aggregate_reads", False)
+        logger.debug("aggregate_reads = %s", self._aggregate_reads)
+        self._aggregated_read_indices: Dict[Any, int] = {}
 
         # Carefully set up the run metadata, preferring overrides from config.
         self._run_metadata["run_id"] = self._run_id
@@ -212,45 +417,322 @@ class FileAPI:
             self._config.get("write", ())
         )
 
-        self.load_metadata_store()
+        self._use_metadata_snapshot = self._config.get("use_metadata_snapshot", True)
+        logger.debug("use_metadata_snapshot = %s", self._use_metadata_snapshot)
+
+        self._metadata_backend = self._config.get(
+            "metadata_backend", MetadataBackend.memory
+        )
+        if self._metadata_backend not in (
+            MetadataBackend.memory,
+            MetadataBackend.sqlite,
+        ):
+            raise ValueError(f"invalid metadata_backend {self._metadata_backend}")
+        logger.debug("metadata_backend = %s", self._metadata_backend)
+
+        # The metadata store is loaded when it is first needed.
+        self._metadata_store: Optional[
+            Union[MetadataStore, SQLiteMetadataStore]
+        ] = None
+        self._metadata_position: Optional[MetadataFilePosition] = None
+        self._read_metadata_cache: Dict[Any, Metadata] = {}
 
     def load_metadata_store(self):
         metadata_store_filename = self._data_directory / "metadata.yaml"
         logger.debug("loading metadata store from %s", metadata_store_filename)
-        self._metadata_store = FileAPI.construct_metadata_store(metadata_store_filename)
+        self._close_metadata_store()
+        self._metadata_position = None
+        self._read_metadata_cache.clear()
+        try:
+            metadata_file = open(metadata_store_filename, "rb")
+        except FileNotFoundError:
+            self._metadata_store = self._construct_metadata_store(
+                metadata_store_filename
+            )
+            return
+        # Hold a shared lock so that no metadata is appended while it is loaded.
+        with metadata_file, lock_file(metadata_file, exclusive=False):
+            self._metadata_store = self._construct_metadata_store(
+                metadata_store_filename
+            )
+            self._metadata_position = read_metadata_file_position(metadata_file)
+
+    def _construct_metadata_store(
+        self, metadata_store_filename: Path
+    ) -> Union[MetadataStore, SQLiteMetadataStore]:
+        if self._metadata_backend == MetadataBackend.sqlite:
+            return FileAPI.construct_sqlite_metadata_store(metadata_store_filename)
+        return FileAPI.construct_metadata_store(
+            metadata_store_filename, self._use_metadata_snapshot
+        )
+
+    def invalidate_metadata_store(self):
+        """Discard the metadata store, so that it is loaded again when next needed.
+        """
+        logger.debug("invalidating metadata store")
+        self._close_metadata_store()
+        self._metadata_position = None
+        self._read_metadata_cache.clear()
+
+    def _close_metadata_store(self):
+        if isinstance(self._metadata_store, SQLiteMetadataStore):
+            self._metadata_store.close()
+        self._metadata_store = None
+
+    def _read_appended_metadata(self, metadata_file: BinaryIO) -> Optional[bytes]:
+        """Return the bytes appended to an open metadata file since the metadata store
+        was loaded, or None if the file has been changed in any other way.
+        """
+        position = self._metadata_position
+        if position is None:
+            return None
+        stat_result = os.fstat(metadata_file.fileno())
+        if stat_result.st_ino != position.inode or stat_result.st_size < position.size:
+            return None
+        metadata_file.seek(position.size - len(position.tail))
+        if metadata_file.read(len(position.tail)) != position.tail:
+            return None
+        return metadata_file.read()
+
+    def update_metadata_store(self):
+        """Add any metadata appended to metadata.yaml since the metadata store was
+        loaded, or invalidate the store if metadata.yaml has been changed in any
+        other way.
+        """
+        if self._metadata_store is None:
+            return
+        metadata_store_filename = self._data_directory / "metadata.yaml"
+        try:
+            with open(metadata_store_filename, "rb") as metadata_file, lock_file(
+                metadata_file, exclusive=False
+            ):
+                appended = self._read_appended_metadata(metadata_file)
+                if appended is not None:
+                    position = read_metadata_file_position(metadata_file)
+        except FileNotFoundError:
+            appended = None
+        if appended is None:
+            logger.debug("metadata.yaml has been replaced")
+            self.invalidate_metadata_store()
+            return
+        try:
+            metadata_sequence = yaml.load(appended, Loader=YAMLSafeLoader) or []
+        except yaml.YAMLError as exception:
+            logger.debug("could not parse appended metadata: %s", exception)
+            self.invalidate_metadata_store()
+            return
+        if not isinstance(metadata_sequence, list):
+            self.invalidate_metadata_store()
+            return
+        logger.debug("adding %s appended metadata records", len(metadata_sequence))
+        self._metadata_store.extend(metadata_sequence)
+        self._metadata_position = position
+        self._read_metadata_cache.clear()
+
+    def get_metadata_store(self) -> Union[MetadataStore, SQLiteMetadataStore]:
+        """Return the metadata store, loading it if necessary.
+        """
+        if self._metadata_store is None:
+            self.load_metadata_store()
+        return self._metadata_store
 
     def get_read_metadata(self, metadata: Metadata) -> Metadata:
-        read_metadata = metadata.copy()
-        self._read_overrides.apply(read_metadata)
-        return self._metadata_store.find(read_metadata) or read_metadata
+        """Return the metadata of the file to read for some call metadata.
+
+        Resolutions are cached for the session, keyed on the call metadata, until the
+        metadata store is next loaded, invalidated or updated.
+        """
+        try:
+            key = freeze_metadata(metadata)
+        except TypeError:
+            key = None
+        read_metadata = self._read_metadata_cache.get(key)
+        if read_metadata is None:
+            read_metadata = metadata.copy()
+            self._read_overrides.apply(read_metadata)
+            read_metadata = dict(
+                self.get_metadata_store().find(read_metadata) or read_metadata
+            )
+            if key is not None:
+                self._read_metadata_cache[key] = read_metadata
+        return dict(read_metadata)
+
+    def _verify_hash(self, read_metadata: Metadata):
+        if not self._fail_on_hash_mismatch:
+            return
+        if (
+            read_metadata[MetadataKey.calculated_hash]
+            == read_metadata[MetadataKey.verified_hash]
+        ):
+            logger.debug("verified hash")
+            return
+        message = (
+            "calculated hash {calculated_hash} != verified hash {verified_hash}"
+        ).format(**read_metadata)
+        if self._hash_verification == HashVerification.session:
+            logger.error("%s, will fail on close", message)
+            self._hash_mismatches.append(message)
+        else:
+            raise ValueError(message)
+
+    def _on_read_hashed(self, read_metadata: Metadata, hashing_file: HashingFileIO):
+        read_metadata[MetadataKey.calculated_hash] = hashing_file.hexdigest()
+        if self._hash_cache is not None and hashing_file.unchanged:
+            self._hash_cache.set(
+                hashing_file.name, hashing_file.stat_result, hashing_file.hexdigest()
+            )
+        self._write_pending_accesses(hashing_file)
+        try:
+            self._verify_hash(read_metadata)
+        except ValueError as exception:
+            # The file may be being closed by garbage collection, which ignores the
+            # exception, so the mismatch is raised again when the FileAPI is closed.
+            self._hash_mismatches.append(str(exception))
+            raise
+
+    def _get_access_log_writer(self) -> JSONLinesAccessLogWriter:
+        if self._access_log_writer is None:
+            self._access_log_writer = JSONLinesAccessLogWriter(
+                self._access_log_path,
+                {"run_metadata": self._run_metadata, "config": self._config},
+            )
+        return self._access_log_writer
+
+    def _write_access_log_record(
+        self, access: FileAccess, hash_cache: Optional[Dict[Path, str]] = None
+    ):
+        self._get_access_log_writer().write_record(
+            access.to_access_log_record(hash_cache, self._hash_block_size)
+        )
+
+    def _write_pending_accesses(self, hashing_file: HashingFileIO):
+        """Write the records of the accesses waiting for a file to be hashed.
+        """
+        accesses = self._pending_accesses.pop(hashing_file, ())
+        hash_cache = {}
+        if hashing_file.hexdigest() is not None:
+            hash_cache[Path(hashing_file.name).resolve()] = hashing_file.hexdigest()
+        for access in accesses:
+            self._write_access_log_record(access, hash_cache)
+
+    def _aggregate_read(self, access: ReadAccess) -> bool:
+        """Add a read to the record of an identical earlier read, or start a new
+        record for it. Return False if the read could not be aggregated.
+        """
+        try:
+            key = (
+                freeze_metadata(access.call_metadata),
+                freeze_metadata(access.access_metadata),
+            )
+        except TypeError:
+            return False
+        index = self._aggregated_read_indices.get(key)
+        if index is None:
+            self._aggregated_read_indices[key] = len(self._accesses)
+            self._accesses.append(access)
+        else:
+            aggregated = self._accesses[index]
+            self._accesses[index] = replace(
+                aggregated,
+                count=aggregated.count + 1,
+                last_timestamp=access.timestamp,
+            )
+        return True
+
+    def _record_access(
+        self, access: FileAccess, hashing_file: Optional[HashingFileIO] = None
+    ):
+        """Record an access, either in memory until the access log is written, or by
+        streaming it to the access log once the file it refers to has been hashed.
+
+        If aggregate_reads is set, reads whose hash is known are held in memory, and
+        repeated reads with identical metadata are collapsed into a single record.
+        Writes are held in memory, as a file may be written again later in the
+        session, so they are only hashed when the access log is closed.
+        """
+        if (
+            self._aggregate_reads
+            and isinstance(access, ReadAccess)
+            and hashing_file is None
+            and self._aggregate_read(access)
+        ):
+            return
+        if not self._stream_access_log or isinstance(access, WriteAccess):
+            self._accesses.append(access)
+        elif hashing_file is None:
+            self._write_access_log_record(access)
+        else:
+            self._pending_accesses.setdefault(hashing_file, []).append(access)
 
     def open_for_read(self, **call_metadata) -> IOBase:
         """Return a file open for reading corresponding to the given metadata.
 
-        The file contents are hashed, and a record is made of the read.
+        The file contents are hashed, and a record is made of the read. Depending on
+        the hash_verification config key, the hash is either calculated before the
+        file is opened, or as it is read.
         """
         logger.debug("starting open_for_read(%s)", log_format_metadata(call_metadata))
         read_metadata = self.get_read_metadata(call_metadata)
         path = self._data_directory / read_metadata[MetadataKey.filename]
-        read_metadata[MetadataKey.calculated_hash] = FileAPI.calculate_hash(path)
-
-        if self._fail_on_hash_mismatch:
+        if self._hash_verification == HashVerification.open:
+            calculated_hash = FileAPI.calculate_hash(
+                path, block_size=self._hash_block_size, hash_cache=self._hash_cache
+            )
+        elif self._hash_cache is not None:
+            calculated_hash = self._hash_cache.get(path)
+        else:
+            calculated_hash = None
+
+        if calculated_hash is not None:
+            read_metadata[MetadataKey.calculated_hash] = calculated_hash
+            self._verify_hash(read_metadata)
+            logger.debug("open('%s', mode='rb')", path)
+            hashing_file = None
+            file = open(path, mode="rb")
+        else:
             if (
-                read_metadata[MetadataKey.calculated_hash]
-                == read_metadata[MetadataKey.verified_hash]
+                self._fail_on_hash_mismatch
+                and MetadataKey.verified_hash not in read_metadata
             ):
-                logger.debug("verified hash")
-            else:
-                raise ValueError(
-                    (
-                        "calculated hash {calculated_hash} != "
-                        "verified hash {verified_hash}"
-                    ).format(**read_metadata)
-                )
+                # Fail now rather than on close if there is nothing to verify against.
+                raise KeyError(MetadataKey.verified_hash)
+            logger.debug("open('%s', mode='rb') hashing while reading", path)
+            hashing_file = HashingFileIO(
+                path,
+                partial(self._on_read_hashed, read_metadata),
+                self._hash_block_size,
+            )
+            self._hashing_files.add(hashing_file)
+            file = BufferedReader(hashing_file)
+        self._record_access(
+            ReadAccess(
+                timestamp=datetime.now(),
+                call_metadata=call_metadata,
+                access_metadata=read_metadata,
+                path=path,
+            ),
+            hashing_file,
+        )
+        logger.info("recorded read(%s)", log_format_metadata(call_metadata))
+        return file
+
+    def get_path_for_read(self, **call_metadata) -> Path:
+        """Return the path of the file corresponding to the given metadata, for it to
+        be read by a library that opens files itself.
 
-        logger.debug("open('%s', mode='rb')", path)
-        file = open(path, mode="rb")
-        self._accesses.append(
+        The file is hashed and verified before the path is returned, whatever the
+        hash_verification config key, and a record is made of the read.
+        """
+        logger.debug(
+            "starting get_path_for_read(%s)", log_format_metadata(call_metadata)
+        )
+        read_metadata = self.get_read_metadata(call_metadata)
+        path = self._data_directory / read_metadata[MetadataKey.filename]
+        read_metadata[MetadataKey.calculated_hash] = FileAPI.calculate_hash(
+            path, block_size=self._hash_block_size, hash_cache=self._hash_cache
+        )
+        self._verify_hash(read_metadata)
+        self._record_access(
             ReadAccess(
                 timestamp=datetime.now(),
                 call_metadata=call_metadata,
@@ -259,7 +741,7 @@ class FileAPI:
             )
         )
         logger.info("recorded read(%s)", log_format_metadata(call_metadata))
-        return file
+        return path
 
     def get_write_metadata(self, metadata: Metadata) -> Metadata:
         write_metadata = metadata.copy()
@@ -275,8 +757,9 @@ class FileAPI:
     def open_for_write(self, **call_metadata) -> IOBase:
         """Return a file open for update corresponding to the given metadata.
 
-        When the file is closed the file contents are hashed, and a record is made of
-        the write.
+        The file contents are hashed as they are written, and a record is made of the
+        write. If the file is not written sequentially, it is hashed again when the
+        access log is generated.
         """
         logger.debug("starting open_for_write(%s)", log_format_metadata(call_metadata))
         write_metadata = self.get_write_metadata(call_metadata)
@@ -288,19 +771,76 @@ class FileAPI:
             path.parent.mkdir(parents=True, exist_ok=True)
             mode = "w+b"
         logger.debug("open('%s', mode='%s')", path, mode)
-        file = open(path, mode=mode)
-        self._accesses.append(
+        hashing_file = HashingFileIO(path, None, self._hash_block_size, mode)
+        self._writers[path.resolve()] = hashing_file
+        file = BufferedRandom(hashing_file)
+        self._record_access(
             WriteAccess(
                 timestamp=datetime.now(),
                 call_metadata=call_metadata,
                 access_metadata=write_metadata,
                 path=path,
                 file_handle=file,
-            )
+            ),
+            hashing_file,
         )
         logger.info("recorded write(%s)", log_format_metadata(call_metadata))
         return file
 
+    def get_path_for_write(self, **call_metadata) -> Path:
+        """Return the path of the file corresponding to the given metadata, for it to
+        be written by a library that opens files itself.
+
+        A record is made of the write, and the file is hashed when the access log is
+        written, so it must be closed before the FileAPI is.
+        """
+        logger.debug(
+            "starting get_path_for_write(%s)", log_format_metadata(call_metadata)
+        )
+        write_metadata = self.get_write_metadata(call_metadata)
+        path = self._data_directory / write_metadata[MetadataKey.filename]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._record_access(
+            WriteAccess(
+                timestamp=datetime.now(),
+                call_metadata=call_metadata,
+                access_metadata=write_metadata,
+                path=path,
+            )
+        )
+        logger.info("recorded write(%s)", log_format_metadata(call_metadata))
+        return path
+
+    def record_write(self, file: IOBase, **call_metadata):
+        """Record a further write to a file returned by open_for_write, for call
+        metadata that corresponds to the same file.
+
+        This allows several components to be written to a file while opening it
+        only once.
+        """
+        logger.debug("starting record_write(%s)", log_format_metadata(call_metadata))
+        write_metadata = self.get_write_metadata(call_metadata)
+        path = self._data_directory / write_metadata[MetadataKey.filename]
+        hashing_file = getattr(file, "raw", None)
+        if file.closed or self._writers.get(path.resolve()) is not hashing_file:
+            raise ValueError(f"{path} is not open for writing as {file}")
+        self._record_access(
+            WriteAccess(
+                timestamp=datetime.now(),
+                call_metadata=call_metadata,
+                access_metadata=write_metadata,
+                path=path,
+                file_handle=file,
+            ),
+            hashing_file,
+        )
+        logger.info("recorded write(%s)", log_format_metadata(call_metadata))
+
+    def get_config(self, key: str, default: Any = None) -> Any:
+        """Get the value of a config key, or default if it is not set.
+        """
+        return self._config.get(key, default)
+
     def set_run_metadata(self, key: str, value: Any):
         """Set the value for a run-level metadata key.
         """
@@ -313,21 +853,102 @@ class FileAPI:
         """
         return self._run_metadata[key]
 
+    def _get_written_path_hashes(self) -> Dict[Path, str]:
+        """Return the hashes calculated while writing files that have not changed
+        since they were closed.
+        """
+        written_path_hashes = {}
+        for path, hashing_file in self._writers.items():
+            hexdigest = hashing_file.hexdigest()
+            if hexdigest is None:
+                logger.debug("could not hash %s while writing", path)
+            elif file_identity(hashing_file.stat_result) != file_identity(path.stat()):
+                logger.debug("%s has changed since it was written", path)
+            else:
+                written_path_hashes[path] = hexdigest
+        return written_path_hashes
+
+    def _calculate_path_hashes(self, calculated_path_hashes: Dict[Path, str]):
+        """Hash every distinct path that has been accessed without a known hash,
+        using a pool of hash_workers threads.
+        """
+        paths = []
+        for access in self._accesses:
+            if (
+                isinstance(access, WriteAccess)
+                and access.file_handle is not None
+                and not access.file_handle.closed
+            ):
+                access.file_handle.flush()
+            if MetadataKey.calculated_hash not in access.access_metadata:
+                paths.append(access.path.resolve())
+        paths = [
+            path for path in dict.fromkeys(paths) if path not in calculated_path_hashes
+        ]
+        if not paths:
+            return
+        logger.debug("hashing %s paths with %s workers", len(paths), self._hash_workers)
+        calculate_hash = partial(
+            FileAPI.calculate_hash, block_size=self._hash_block_size
+        )
+        with ThreadPoolExecutor(max_workers=self._hash_workers) as executor:
+            calculated_path_hashes.update(
+                zip(paths, executor.map(calculate_hash, paths))
+            )
+
+    def _get_path_hashes(self) -> Dict[Path, str]:
+        """Return the hashes of the files written in the session as they are now,
+        and of any other accessed files if they are hashed in parallel.
+        """
+        calculated_path_hashes = self._get_written_path_hashes()
+        if self._hash_workers > 1:
+            self._calculate_path_hashes(calculated_path_hashes)
+        return calculated_path_hashes
+
     def _generate_access_log(self) -> Dict[str, Any]:
-        calculated_path_hashes = {}
+        calculated_path_hashes = self._get_path_hashes()
         return {
             "run_metadata": dict(close_timestamp=datetime.now(), **self._run_metadata),
             "config": self._config,
             "io": [
-                access.to_access_log_record(calculated_path_hashes)
+                access.to_access_log_record(
+                    calculated_path_hashes, self._hash_block_size
+                )
                 for access in self._accesses
             ],
         }
 
+    def add_close_callback(self, callback: Callable[[], None]):
+        """Add a function to be called when the session is closed, before any files
+        are hashed or the access log is written.
+        """
+        self._close_callbacks.append(callback)
+
     def close(self):
         """Close the session and write the access log.
         """
-        if self._access_log_path:
+        for callback in self._close_callbacks:
+            callback()
+        for hashing_file in list(self._hashing_files):
+            hashing_file.close()
+        if self._hash_cache is not None:
+            self._hash_cache.save()
+        self._close_metadata_store()
+        if self._stream_access_log:
+            for hashing_file in list(self._pending_accesses):
+                self._write_pending_accesses(hashing_file)
+            calculated_path_hashes = self._get_path_hashes()
+            for access in self._accesses:
+                self._write_access_log_record(access, calculated_path_hashes)
+            self._get_access_log_writer().close(
+                {
+                    "run_metadata": dict(
+                        close_timestamp=datetime.now(), **self._run_metadata
+                    )
+                }
+            )
+            logger.info("wrote access log")
+        elif self._access_log_path:
             with open(self._access_log_path, "w") as output_file:
                 yaml.dump(
                     self._generate_access_log(), output_file, sort_keys=False,
@@ -335,6 +956,8 @@ class FileAPI:
             logger.info("wrote access log")
         else:
             logger.warning("did not write access log")
+        if self._hash_mismatches:
+            raise ValueError("; ".join(self._hash_mismatches))
 
     def __enter__(self):
         return self
@@ -1,10 +1,11 @@
 from io import IOBase
+from numbers import Integral
 import h5py
 import pandas as pd
 import numpy as np
 from functools import reduce
 from operator import getitem
-from typing import Union, List, NamedTuple, Optional, Any
+from typing import Union, Dict, List, NamedTuple, Optional, Any, Sequence, Tuple
 
 
 Table = pd.DataFrame
@@ -44,26 +45,100 @@ class Array(NamedTuple):
             return False
 
 
-def get_components(file: IOBase) -> List[str]:
+ObjectFile = Union[IOBase, h5py.File]
+
+
+def open_object_file(file: ObjectFile, mode: str) -> h5py.File:
+    """Open a file object as an HDF5 file, unless it is already one.
+    """
+    if isinstance(file, h5py.File):
+        return file
+    return h5py.File(file, mode=mode)
+
+
+def get_components(file: ObjectFile) -> List[str]:
     components = []
 
     def add_dataset_parent(name, obj):
         if isinstance(obj, h5py.Dataset):
             components.append(obj.parent.name)
 
-    h5py.File(file, mode="r").visititems(add_dataset_parent)
+    open_object_file(file, "r").visititems(add_dataset_parent)
     return components
 
 
-def get_read_group(file: IOBase, component: str) -> h5py.Group:
-    return h5py.File(file, mode="r").get(component)
+def get_read_group(file: ObjectFile, component: str) -> h5py.Group:
+    return open_object_file(file, "r").get(component)
 
 
-def get_write_group(file: IOBase, component: str) -> h5py.Group:
-    return h5py.File(file, mode="a").require_group(component)
+def get_write_group(file: ObjectFile, component: str) -> h5py.Group:
+    return open_object_file(file, "a").require_group(component)
 
 
-def read_table(file: IOBase, component: str) -> Table:
+# Options for creating the datasets of tables and arrays.
+DATASET_OPTION_KEYS = ("chunks", "compression", "compression_opts", "shuffle")
+COMPRESSION_FILTERS = ("gzip", "lzf")
+DEFAULT_DATASET_OPTIONS = {"chunks": True, "compression": None, "shuffle": False}
+
+
+def validate_dataset_options(dataset_options: Dict[str, Any]) -> Dict[str, Any]:
+    """Check that dataset options are known, and return a copy of them that can be
+    serialised, with any chunk shape as a list.
+
+    The options are chunks, which is a chunk shape, True to choose one from the
+    shape of the data, or None to store the data contiguously, compression, which is
+    gzip, lzf or None, compression_opts, which is the gzip compression level from 0
+    to 9, and can only be given with gzip compression, and shuffle, which is True to
+    enable the shuffle filter.
+    """
+    unknown_keys = set(dataset_options) - set(DATASET_OPTION_KEYS)
+    if unknown_keys:
+        raise ValueError(f"unknown dataset options {sorted(unknown_keys)}")
+    compression = dataset_options.get("compression")
+    if compression is not None and compression not in COMPRESSION_FILTERS:
+        raise ValueError(f"invalid compression {compression}")
+    compression_opts = dataset_options.get("compression_opts")
+    if compression_opts is not None:
+        if compression != "gzip":
+            raise ValueError(
+                f"compression_opts cannot be given with compression {compression}"
+            )
+        if (
+            not isinstance(compression_opts, Integral)
+            or isinstance(compression_opts, (bool, np.bool_))
+            or not 0 <= compression_opts <= 9
+        ):
+            raise ValueError(f"invalid gzip compression level {compression_opts}")
+    shuffle = dataset_options.get("shuffle", False)
+    if not isinstance(shuffle, (bool, np.bool_)):
+        raise ValueError(f"invalid shuffle {shuffle}")
+    dataset_options = dict(dataset_options)
+    if compression_opts is not None:
+        dataset_options["compression_opts"] = int(compression_opts)
+    if "shuffle" in dataset_options:
+        dataset_options["shuffle"] = bool(shuffle)
+    if isinstance(dataset_options.get("chunks"), (list, tuple)):
+        dataset_options["chunks"] = [int(size) for size in dataset_options["chunks"]]
+    return dataset_options
+
+
+def get_dataset_keywords(
+    data: np.ndarray, dataset_options: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Return the create_dataset keyword arguments for dataset options.
+    """
+    if dataset_options is None:
+        dataset_options = DEFAULT_DATASET_OPTIONS
+    if data.ndim == 0:
+        # Scalar datasets cannot be chunked or filtered.
+        return {}
+    keywords = dict(dataset_options)
+    if isinstance(keywords.get("chunks"), list):
+        keywords["chunks"] = tuple(keywords["chunks"])
+    return keywords
+
+
+def read_table(file: ObjectFile, component: str) -> Table:
     return pd.DataFrame(get_read_group(file, component)["table"][()]).apply(
         lambda s: s.str.decode("utf-8")
         if pd.api.types.is_object_dtype(s.infer_objects())
@@ -71,7 +146,15 @@ def read_table(file: IOBase, component: str) -> Table:
     )
 
 
-def write_table(file: IOBase, component: str, table: Table):
+def write_table(
+    file: ObjectFile,
+    component: str,
+    table: Table,
+    dataset_options: Optional[Dict[str, Any]] = None,
+):
+    """Write a table, creating its dataset with dataset_options, as described in
+    validate_dataset_options, or DEFAULT_DATASET_OPTIONS if they are None.
+    """
     # Assumes all object columns are strings.
     records = table.to_records(
         index=False,
@@ -85,7 +168,12 @@ def write_table(file: IOBase, component: str, table: Table):
     group = get_write_group(file, component)
     for dataset in group:
         del group[dataset]
-    group.create_dataset("table", data=records, track_times=False)
+    group.create_dataset(
+        "table",
+        data=records,
+        track_times=False,
+        **get_dataset_keywords(records, dataset_options),
+    )
 
 
 DIMENSION_PREFIX = "Dimension_"
@@ -115,9 +203,130 @@ def get_single_string(array) -> str:
     raise ValueError(f"Cannot get a single string from a {string_array.shape} array")
 
 
-def read_array(file: IOBase, component: str) -> Array:
+AxisSelection = Union[int, slice, Sequence[int], Sequence[bool], np.ndarray]
+Selection = Union[AxisSelection, Tuple[AxisSelection, ...]]
+
+
+def normalise_selection(
+    selection: Selection, shape: Tuple[int, ...]
+) -> List[Union[int, slice, np.ndarray]]:
+    """Convert a selection into one int, slice with a positive step, or array of
+    non-negative indices for each axis of an array of shape.
+    """
+    if not isinstance(selection, tuple):
+        selection = (selection,)
+    if len(selection) > len(shape):
+        raise IndexError(f"too many indices for an array of shape {shape}")
+    selection += (slice(None),) * (len(shape) - len(selection))
+    normalised = []
+    for axis_selection, length in zip(selection, shape):
+        if isinstance(axis_selection, slice):
+            start, stop, step = axis_selection.indices(length)
+            if step > 0:
+                normalised.append(slice(start, stop, step))
+                continue
+            axis_selection = np.arange(start, stop, step)
+        elif isinstance(axis_selection, (int, np.integer)):
+            if not -length <= axis_selection < length:
+                raise IndexError(f"index {axis_selection} is out of bounds")
+            normalised.append(int(axis_selection) % length)
+            continue
+        indices = np.asarray(axis_selection)
+        if indices.size == 0:
+            indices = indices.astype(np.intp)
+        if indices.dtype == np.bool_ and indices.shape == (length,):
+            indices = np.flatnonzero(indices)
+        elif indices.ndim != 1 or not np.issubdtype(indices.dtype, np.integer):
+            raise IndexError(f"invalid index {axis_selection}")
+        if np.any((indices < -length) | (indices >= length)):
+            raise IndexError(f"index {axis_selection} is out of bounds")
+        normalised.append(indices % length)
+    return normalised
+
+
+def read_selection(
+    dataset: h5py.Dataset, selection: List[Union[int, slice, np.ndarray]]
+) -> np.ndarray:
+    """Read a normalised selection from a dataset, reading only the hyperslab it
+    covers.
+
+    HDF5 only accepts one increasing list of indices in a selection, so the first
+    array of indices is read as its sorted unique indices, any others are read as
+    the slice that bounds them, and the result is then reordered to match.
+    """
+    hdf5_selection = []
+    reorderings = []
+    indices_read = False
+    axis = 0
+    for axis_selection in selection:
+        if isinstance(axis_selection, int):
+            hdf5_selection.append(axis_selection)
+            continue
+        if isinstance(axis_selection, slice):
+            hdf5_selection.append(axis_selection)
+        elif axis_selection.size == 0:
+            hdf5_selection.append(slice(0, 0))
+        elif not indices_read:
+            indices_read = True
+            unique_indices, inverse = np.unique(axis_selection, return_inverse=True)
+            hdf5_selection.append(unique_indices)
+            if not np.array_equal(inverse, np.arange(len(unique_indices))):
+                reorderings.append((axis, inverse))
+        else:
+            start = int(axis_selection.min())
+            hdf5_selection.append(slice(start, int(axis_selection.max()) + 1))
+            reorderings.append((axis, axis_selection - start))
+        axis += 1
+    data = dataset[tuple(hdf5_selection)]
+    for axis, positions in reorderings:
+        data = np.take(data, positions, axis=axis)
+    return data
+
+
+def select_dimensions(
+    dimensions: List[Dimension], selection: List[Union[int, slice, np.ndarray]]
+) -> Optional[List[Dimension]]:
+    """Cut the names and values of dimensions to match a normalised selection,
+    dropping the dimensions of axes selected by a single index.
+    """
+
+    def select(items: Optional[List[Any]], axis_selection) -> Optional[List[Any]]:
+        if items is None:
+            return None
+        if isinstance(axis_selection, slice):
+            return items[axis_selection]
+        return [items[index] for index in axis_selection]
+
+    selected_dimensions = []
+    for axis, dimension in enumerate(dimensions):
+        axis_selection = selection[axis] if axis < len(selection) else slice(None)
+        if isinstance(axis_selection, int):
+            continue
+        selected_dimensions.append(
+            dimension._replace(
+                names=select(dimension.names, axis_selection),
+                values=select(dimension.values, axis_selection),
+            )
+        )
+    return selected_dimensions or None
+
+
+def read_array(
+    file: ObjectFile, component: str, selection: Optional[Selection] = None
+) -> Array:
+    """Read an array, or if selection is given, only the part of it selected.
+
+    A selection is an index, slice or array of indices or booleans for each axis of
+    the array, with the same meaning as in numpy, except that arrays of indices
+    select along each axis independently. Only the selected part of the array is
+    read from the file, and the dimensions are cut to match.
+    """
     group = get_read_group(file, component)
-    data = group["array"][()]
+    if selection is None:
+        data = group["array"][()]
+    else:
+        selection = normalise_selection(selection, group["array"].shape)
+        data = read_selection(group["array"], selection)
     dimension_title = {}
     dimension_names = {}
     dimension_values = {}
@@ -160,6 +369,8 @@ def read_array(file: IOBase, component: str) -> Array:
             )
             for dimension in range(1, max_dimension + 1)
         ]
+        if selection is not None:
+            dimensions = select_dimensions(dimensions, selection)
     if "units" in group:
         units = get_single_string(group["units"][()])
     else:
@@ -168,14 +379,36 @@ def read_array(file: IOBase, component: str) -> Array:
     return Array(data=data, dimensions=dimensions, units=units)
 
 
-def write_array(file: IOBase, component: str, array: Array):
+def write_array(
+    file: ObjectFile,
+    component: str,
+    array: Array,
+    dataset_options: Optional[Dict[str, Any]] = None,
+):
+    """Write an array, creating its dataset with dataset_options, as described in
+    validate_dataset_options, or DEFAULT_DATASET_OPTIONS if they are None.
+    """
     # TODO : More validation on the inputs?
     group = get_write_group(file, component)
     for dataset in group:
         del group[dataset]
-    group.create_dataset("array", data=array.data, track_times=False)
-    if array.dimensions is not None:
-        for i, dimension in enumerate(array.dimensions, start=1):
+    data = np.asarray(array.data)
+    group.create_dataset(
+        "array",
+        data=data,
+        track_times=False,
+        **get_dataset_keywords(data, dataset_options),
+    )
+    write_array_metadata(group, array.dimensions, array.units)
+
+
+def write_array_metadata(
+    group: h5py.Group, dimensions: Optional[List[Dimension]], units: Optional[str]
+):
+    """Write the dimensions and units of an array to its group.
+    """
+    if dimensions is not None:
+        for i, dimension in enumerate(dimensions, start=1):
             if dimension.title is not None:
                 group.create_dataset(
                     f"Dimension_{i}_title",
@@ -210,11 +443,226 @@ def write_array(file: IOBase, component: str, array: Array):
                     data=dimension.units,
                     track_times=False,
                 )
-    if array.units is not None:
+    if units is not None:
         group.create_dataset(
             "units",
             dtype=h5py.string_dtype(),
             shape=(),
-            data=array.units,
+            data=units,
+            track_times=False,
+        )
+
+
+class DatasetAppender:
+    dataset_name: str
+
+    def __init__(
+        self,
+        file: ObjectFile,
+        component: str,
+        dataset_options: Optional[Dict[str, Any]] = None,
+    ):
+        """The DatasetAppender class is the base of classes that write a component
+        in parts, appending each to a resizable dataset along its first axis, so
+        that the whole component need not be held in memory.
+
+        Any datasets already in the component are deleted. The dataset is created
+        with dataset_options, as described in validate_dataset_options, and is always
+        chunked. Parts must have the shape of the entries of the dataset, and a dtype
+        that can be cast to its dtype within the same kind. If the appender opened
+        the HDF5 file, it closes it when it is closed.
+        """
+        self._file = open_object_file(file, "a")
+        self._owns_file = self._file is not file
+        self._component = component
+        self._group = self._file.require_group(component)
+        for dataset in self._group:
+            del self._group[dataset]
+        self._dataset_options = dataset_options
+        self._dataset: Optional[h5py.Dataset] = None
+        self.closed = False
+
+    def _create_dataset(self, records: np.ndarray):
+        keywords = get_dataset_keywords(records, self._dataset_options)
+        if not keywords.get("chunks"):
+            keywords["chunks"] = True
+        self._dataset = self._group.create_dataset(
+            self.dataset_name,
+            shape=(0,) + records.shape[1:],
+            maxshape=(None,) + records.shape[1:],
+            dtype=records.dtype,
             track_times=False,
+            **keywords,
         )
+
+    def _change_dtype(self, dtype: np.dtype):
+        """Replace the dataset with one of a new dtype that the entries already
+        appended are cast to, copying them a chunk at a time.
+        """
+        old_dataset = self._dataset
+        self._group.move(self.dataset_name, f"{self.dataset_name}_old")
+        self._create_dataset(np.empty((0,) + old_dataset.shape[1:], dtype=dtype))
+        self._dataset.resize(len(old_dataset), axis=0)
+        step = old_dataset.chunks[0]
+        for start in range(0, len(old_dataset), step):
+            self._dataset[start : start + step] = old_dataset[
+                start : start + step
+            ].astype(dtype)
+        del self._group[f"{self.dataset_name}_old"]
+
+    def _append_records(self, records: np.ndarray):
+        if self.closed:
+            raise ValueError("cannot append to a closed appender")
+        if self._dataset is None:
+            self._create_dataset(records)
+        elif records.shape[1:] != self._dataset.shape[1:]:
+            raise ValueError(
+                f"cannot append entries of shape {records.shape[1:]} to a dataset "
+                f"of entries of shape {self._dataset.shape[1:]}"
+            )
+        elif not np.can_cast(records.dtype, self._dataset.dtype, "same_kind"):
+            raise ValueError(
+                f"cannot append entries of dtype {records.dtype} to a dataset of "
+                f"dtype {self._dataset.dtype}"
+            )
+        size = self._dataset.shape[0]
+        self._dataset.resize(size + len(records), axis=0)
+        self._dataset[size:] = records
+
+    def _finish(self):
+        pass
+
+    def _close(self, require_dataset: bool):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self._dataset is not None:
+                self._finish()
+            elif require_dataset:
+                raise ValueError(f"nothing was appended to {self._component}")
+        finally:
+            if self._owns_file:
+                self._file.close()
+
+    def close(self):
+        """Close the appender, raising ValueError if its dataset was never created,
+        as the component could not then be read.
+        """
+        self._close(require_dataset=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # An empty component is not reported over an exception already raised.
+        self._close(require_dataset=exc_type is None)
+
+
+class TableAppender(DatasetAppender):
+    """Writes a table to a component a number of rows at a time.
+
+    String columns are stored as fixed length byte strings, as write_table stores
+    them. If later rows hold longer strings than a column can, the dataset is
+    rewritten with the column at least twice as wide.
+    """
+
+    dataset_name = "table"
+
+    def __init__(
+        self,
+        file: ObjectFile,
+        component: str,
+        dataset_options: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__(file, component, dataset_options)
+        self._dtype: Optional[np.dtype] = None
+
+    def append(self, table: Table):
+        """Append the rows of a table, which must have the same columns as any
+        appended before, with dtypes that can be cast to theirs.
+        """
+        if self._dtype is not None and tuple(table.columns) != self._dtype.names:
+            raise ValueError(
+                f"columns {list(table.columns)} != {list(self._dtype.names)}"
+            )
+        # Assumes all object columns are strings.
+        columns = {
+            column: table[column].values.astype(np.string_)
+            if dtype == "O"
+            else table[column].values
+            for column, dtype in table.dtypes.items()
+        }
+        dtype = []
+        for column, values in columns.items():
+            is_string = values.dtype.kind == "S"
+            if self._dtype is None:
+                column_dtype = np.dtype("S1") if is_string else values.dtype
+            else:
+                column_dtype = self._dtype[column]
+                if is_string != (column_dtype.kind == "S") or (
+                    not is_string
+                    and not np.can_cast(values.dtype, column_dtype, "same_kind")
+                ):
+                    raise ValueError(
+                        f"cannot append column {column} of dtype {values.dtype} to "
+                        f"a column of dtype {column_dtype}"
+                    )
+            if is_string and values.itemsize > column_dtype.itemsize:
+                column_dtype = np.dtype(
+                    f"S{max(values.itemsize, 2 * column_dtype.itemsize)}"
+                )
+            dtype.append((column, column_dtype))
+        dtype = np.dtype(dtype)
+        if dtype != self._dtype:
+            if self._dataset is not None:
+                self._change_dtype(dtype)
+            self._dtype = dtype
+        records = np.empty(len(table), dtype=self._dtype)
+        for column, values in columns.items():
+            records[column] = values
+        self._append_records(records)
+
+
+class ArrayAppender(DatasetAppender):
+    """Writes an array to a component a number of entries along its first axis at a
+    time, writing its dimensions and units when it is closed.
+
+    If dtype is given, the dataset is created with it and entries of the given
+    shape straight away, so the array is written even if nothing is appended.
+    Otherwise it is created with the dtype and shape of the first entries appended.
+    """
+
+    dataset_name = "array"
+
+    def __init__(
+        self,
+        file: ObjectFile,
+        component: str,
+        dimensions: Optional[List[Dimension]] = None,
+        units: Optional[str] = None,
+        dataset_options: Optional[Dict[str, Any]] = None,
+        dtype: Optional[Any] = None,
+        shape: Sequence[int] = (),
+    ):
+        super().__init__(file, component, dataset_options)
+        self.dimensions = dimensions
+        self.units = units
+        if dtype is not None:
+            self._create_dataset(np.empty((0,) + tuple(shape), dtype=dtype))
+
+    def append(self, entry: np.ndarray):
+        """Append a single entry along the first axis of the array.
+        """
+        self._append_records(np.expand_dims(np.asarray(entry), 0))
+
+    def extend(self, entries: np.ndarray):
+        """Append a number of entries along the first axis of the array.
+        """
+        entries = np.asarray(entries)
+        if entries.ndim == 0:
+            raise ValueError("cannot extend an array with a scalar")
+        self._append_records(entries)
+
+    def _finish(self):
+        write_array_metadata(self._group, self.dimensions, self.units)
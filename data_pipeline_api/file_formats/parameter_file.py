@@ -1,11 +1,30 @@
-from io import TextIOBase
+import os
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from copy import copy
+from hashlib import sha1
+from io import BytesIO, TextIOBase
 from enum import Enum
+from functools import lru_cache
 from numbers import Real
-from typing import Union, Dict, Any, Tuple
+from time import time_ns
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 import toml
 import numpy as np
 from scipy import stats
-from math import sqrt
+from math import isclose, sqrt
+from data_pipeline_api.hashing import RACY_INTERVAL_NS, file_identity
 
 # ======================================================================================
 # Common
@@ -23,19 +42,105 @@ class ParameterType(Enum):
     SAMPLES = "samples"
 
 
+# Probabilities of the quantiles stored in summaries.
+SUMMARY_QUANTILES = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.975, 0.99)
+
+# Parsed documents, keyed by the hash of their contents, in least recently used order.
+PARSED_DOCUMENT_CACHE_SIZE = 64
+_parsed_documents: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+# Content hashes of files, keyed by file identity.
+_content_hashes: Dict[Tuple, bytes] = {}
+
+
+def _file_identity(file: TextIOBase) -> Optional[Tuple]:
+    """Return the identity of the version of an open file, or None if it has none or
+    was modified too recently for its identity to be trusted.
+    """
+    try:
+        stat_result = os.fstat(file.fileno())
+    except (AttributeError, OSError):
+        return None
+    if time_ns() - stat_result.st_mtime_ns < RACY_INTERVAL_NS:
+        return None
+    return (stat_result.st_dev, *file_identity(stat_result))
+
+
+def _parse_document(file: TextIOBase) -> Dict[str, Any]:
+    """Return the parsed contents of a TOML file, which must not be modified.
+
+    Documents are cached by the hash of their contents, so each version of a file is
+    only parsed once. The contents of an unchanged file are not read again.
+    """
+    identity = _file_identity(file)
+    content_hash = _content_hashes.get(identity)
+    if content_hash is None or content_hash not in _parsed_documents:
+        file.seek(0)
+        text = file.read()
+        content_hash = sha1(text.encode()).digest()
+        if content_hash not in _parsed_documents:
+            _parsed_documents[content_hash] = toml.loads(text)
+            if len(_parsed_documents) > PARSED_DOCUMENT_CACHE_SIZE:
+                _parsed_documents.popitem(last=False)
+        if identity is not None:
+            if len(_content_hashes) >= PARSED_DOCUMENT_CACHE_SIZE:
+                _content_hashes.clear()
+            _content_hashes[identity] = content_hash
+    _parsed_documents.move_to_end(content_hash)
+    return _parsed_documents[content_hash]
+
+
+def clear_parsed_document_cache():
+    """Discard all cached parsed documents.
+    """
+    _parsed_documents.clear()
+    _content_hashes.clear()
+
+
 def read_parameter(file: TextIOBase, component: str) -> ParameterComponent:
-    file.seek(0)
-    return toml.load(file)[component]
+    return copy(_parse_document(file)[component])
 
 
 def write_parameter(file: TextIOBase, component: str, parameter: ParameterComponent):
-    parameter_data = toml.load(file)
-    parameter_data[component] = parameter
+    write_parameters(file, {component: parameter})
+
+
+def write_parameters(file: TextIOBase, parameters: Dict[str, ParameterComponent]):
+    """Write several components to a file, loading and dumping it only once.
+    """
+    parameter_data = dict(_parse_document(file))
+    parameter_data.update(parameters)
     file.seek(0)
     file.truncate()
     toml.dump(parameter_data, file)
 
 
+def read_summary(file: TextIOBase, component: str) -> Optional[Dict[str, Any]]:
+    """Read the summary statistics stored with a component, if any.
+    """
+    return read_parameter(file, component).get("summary")
+
+
+def summary_quantile(summary: Dict[str, Any], probability: float) -> Optional[float]:
+    """Return the quantile for probability from a summary, or None if it is not one
+    of the quantiles the summary holds.
+    """
+    for summary_probability, value in zip(
+        summary["quantile_probabilities"], summary["quantile_values"]
+    ):
+        if isclose(summary_probability, probability):
+            return value
+    return None
+
+
+def _summary(mean: float, variance: float, quantiles: Sequence[float]):
+    return {
+        "mean": float(mean),
+        "variance": float(variance),
+        "quantile_probabilities": list(SUMMARY_QUANTILES),
+        "quantile_values": [float(quantile) for quantile in quantiles],
+    }
+
+
 def read_type(file: TextIOBase, component: str) -> ParameterType:
     parameter = read_parameter(file, component)
     return ParameterType(parameter["type"])
@@ -55,10 +160,13 @@ def read_estimate(file: TextIOBase, component: str) -> Estimate:
         raise ValueError(f"{parameter['type']} != 'point-estimate'")
 
 
+def encode_estimate(estimate: Estimate) -> ParameterComponent:
+    """Encode estimate into a serialisable format."""
+    return {"type": "point-estimate", "value": float(estimate)}
+
+
 def write_estimate(file: TextIOBase, component: str, estimate: Estimate):
-    write_parameter(
-        file, component, {"type": "point-estimate", "value": float(estimate)}
-    )
+    write_parameter(file, component, encode_estimate(estimate))
 
 
 # ======================================================================================
@@ -112,8 +220,22 @@ distribution_parameter_encoders = {
 }
 
 
-def encode_distribution(distribution: Distribution) -> Dict[str, Any]:
-    """Encode distribution into a serialisable format."""
+def summarise_distribution(distribution: Distribution) -> Dict[str, Any]:
+    """Calculate the mean, variance and quantiles of a univariate distribution.
+    """
+    if not isinstance(distribution, stats.distributions.rv_frozen):
+        raise ValueError(f"cannot summarise {distribution}")
+    return _summary(
+        distribution.mean(), distribution.var(), distribution.ppf(SUMMARY_QUANTILES)
+    )
+
+
+def encode_distribution(
+    distribution: Distribution, summary: bool = False
+) -> Dict[str, Any]:
+    """Encode distribution into a serialisable format, with its summary statistics
+    if summary is True.
+    """
     if isinstance(distribution, Categorical):
         name = "categorical"
         encoded_parameters = {
@@ -133,45 +255,145 @@ def encode_distribution(distribution: Distribution) -> Dict[str, Any]:
         )
     else:
         raise ValueError(f"Do not have a codec for {distribution}")
-    return dict(type="distribution", distribution=name, **encoded_parameters)
-
-
-# Functions to decode serialised distributions.
-distribution_decoders = {
-    "categorical": [lambda data: Categorical(data["bins"], data["weights"])],
-    "gamma": [lambda data: stats.gamma(data["k"], scale=data["theta"]),
-              lambda data: stats.gamma(data["k"], scale=data["θ"]),
-              lambda data: stats.gamma(data["shape"], scale=data["scale"]),
-              lambda data: stats.gamma(data["alpha"], scale=1 / data["beta"]),
-              lambda data: stats.gamma(data["α"], scale=1 / data["β"]),
-              lambda data: stats.gamma(data["shape"], scale=1 / data["rate"])],
-    "normal": [lambda data: stats.norm(data["mu"], data["sigma"]),
-               lambda data: stats.norm(data["μ"], data["σ"]),
-               lambda data: stats.norm(data["μ"], sqrt(data["σ²"])),
-               lambda data: stats.norm(data["mu"], 1 / sqrt(data["tau"])),
-               lambda data: stats.norm(data["μ"], 1 / sqrt(data["τ"]))],
-    "uniform": [lambda data: stats.uniform(data["a"], data["b"] - data["a"])],
-    "poisson": [lambda data: stats.poisson(data["lambda"]),
-                lambda data: stats.poisson(data["λ"])],
-    "exponential": [lambda data: stats.expon(scale=1 / data["lambda"]),
-                    lambda data: stats.expon(scale=1 / data["λ"]),
-                    lambda data: stats.expon(scale=data["scale"])],
-    "beta": [lambda data: stats.beta(data["alpha"], data["beta"]),
-             lambda data: stats.beta(data["α"], data["β"])],
-    "binomial": [lambda data: stats.binom(data["n"], data["p"])],
-    "multinomial": [lambda data: stats.multinomial(data["n"], data["p"])],
+    encoded_distribution = dict(
+        type="distribution", distribution=name, **encoded_parameters
+    )
+    if summary:
+        encoded_distribution["summary"] = summarise_distribution(distribution)
+    return encoded_distribution
+
+
+# Functions to decode serialised distributions, each with the keys it requires, in
+# order of preference.
+distribution_decoders: Dict[str, List[Tuple[Tuple[str, ...], Callable]]] = {
+    "categorical": [
+        (("bins", "weights"), lambda data: Categorical(data["bins"], data["weights"]))
+    ],
+    "gamma": [
+        (("k", "theta"), lambda data: stats.gamma(data["k"], scale=data["theta"])),
+        (("k", "θ"), lambda data: stats.gamma(data["k"], scale=data["θ"])),
+        (
+            ("shape", "scale"),
+            lambda data: stats.gamma(data["shape"], scale=data["scale"]),
+        ),
+        (
+            ("alpha", "beta"),
+            lambda data: stats.gamma(data["alpha"], scale=1 / data["beta"]),
+        ),
+        (("α", "β"), lambda data: stats.gamma(data["α"], scale=1 / data["β"])),
+        (
+            ("shape", "rate"),
+            lambda data: stats.gamma(data["shape"], scale=1 / data["rate"]),
+        ),
+    ],
+    "normal": [
+        (("mu", "sigma"), lambda data: stats.norm(data["mu"], data["sigma"])),
+        (("μ", "σ"), lambda data: stats.norm(data["μ"], data["σ"])),
+        (("μ", "σ²"), lambda data: stats.norm(data["μ"], sqrt(data["σ²"]))),
+        (("mu", "tau"), lambda data: stats.norm(data["mu"], 1 / sqrt(data["tau"]))),
+        (("μ", "τ"), lambda data: stats.norm(data["μ"], 1 / sqrt(data["τ"]))),
+    ],
+    "uniform": [
+        (("a", "b"), lambda data: stats.uniform(data["a"], data["b"] - data["a"]))
+    ],
+    "poisson": [
+        (("lambda",), lambda data: stats.poisson(data["lambda"])),
+        (("λ",), lambda data: stats.poisson(data["λ"])),
+    ],
+    "exponential": [
+        (("lambda",), lambda data: stats.expon(scale=1 / data["lambda"])),
+        (("λ",), lambda data: stats.expon(scale=1 / data["λ"])),
+        (("scale",), lambda data: stats.expon(scale=data["scale"])),
+    ],
+    "beta": [
+        (("alpha", "beta"), lambda data: stats.beta(data["alpha"], data["beta"])),
+        (("α", "β"), lambda data: stats.beta(data["α"], data["β"])),
+    ],
+    "binomial": [(("n", "p"), lambda data: stats.binom(data["n"], data["p"]))],
+    "multinomial": [
+        (("n", "p"), lambda data: stats.multinomial(data["n"], data["p"]))
+    ],
 }
+# Keys of an encoded distribution that are not parameters of the distribution.
+DISTRIBUTION_RESERVED_KEYS = frozenset(("type", "distribution", "summary"))
+DECODED_DISTRIBUTION_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=256)
+def _select_decoder(name: str, keys: FrozenSet[str]) -> Callable:
+    """Return the first decoder for the named distribution whose keys are all in keys.
+
+    Decoders are selected once for each set of keys, so distribution_decoders should
+    not be changed once distributions have been decoded.
+    """
+    for decoder_keys, decoder in distribution_decoders[name]:
+        if keys.issuperset(decoder_keys):
+            return decoder
+    raise KeyError(name)
+
+
+def _canonical_value(value: Any) -> Hashable:
+    if isinstance(value, list):
+        return tuple(_canonical_value(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(
+            sorted((key, _canonical_value(item)) for key, item in value.items())
+        )
+    return value
+
+
+@lru_cache(maxsize=DECODED_DISTRIBUTION_CACHE_SIZE)
+def _decode_canonical_distribution(
+    name: str, parameters: Tuple[Tuple[str, Hashable], ...]
+) -> Distribution:
+    data = dict(parameters)
+    return _select_decoder(name, frozenset(data))(data)
+
+
+def _copy_distribution(distribution: Distribution) -> Distribution:
+    """Return a copy of a frozen distribution with its own copy of the scipy
+    distribution it freezes, which holds its random_state.
+
+    Copying the scipy distribution through its pickling support is several times
+    faster than freezing a new distribution.
+    """
+    copied_distribution = copy(distribution)
+    for attribute in ("dist", "_dist"):
+        generator = getattr(distribution, attribute, None)
+        if generator is not None:
+            setattr(copied_distribution, attribute, copy(generator))
+    return copied_distribution
 
 
 def decode_distribution(encoded_distribution: Dict[str, Any]) -> Distribution:
     """Decode distribution from serialised format.
+
+    Decoded distributions are cached by their parameters, and each call returns a
+    copy of the cached distribution, so that callers may modify it, for example by
+    setting its random_state.
+    """
+    name = encoded_distribution["distribution"]
+    parameters = tuple(
+        sorted(
+            (key, _canonical_value(value))
+            for key, value in encoded_distribution.items()
+            if key not in DISTRIBUTION_RESERVED_KEYS
+        )
+    )
+    try:
+        hash(parameters)
+    except TypeError:
+        # Parameters that are not hashable cannot be cached.
+        data = dict(parameters)
+        return _select_decoder(name, frozenset(data))(data)
+    return _copy_distribution(_decode_canonical_distribution(name, parameters))
+
+
+def clear_decoded_distribution_cache():
+    """Discard all cached decoded distributions.
     """
-    for decoder in distribution_decoders[encoded_distribution["distribution"]]:
-        try:
-            return decoder(encoded_distribution)
-        except KeyError:
-            continue
-    raise KeyError(encoded_distribution["distribution"])
+    _decode_canonical_distribution.cache_clear()
+
 
 def read_distribution(file: TextIOBase, component: str) -> Distribution:
     parameter = read_parameter(file, component)
@@ -180,10 +402,15 @@ def read_distribution(file: TextIOBase, component: str) -> Distribution:
     raise ValueError(f"{parameter['type']} != 'distribution'")
 
 
-def write_distribution(file: TextIOBase, component: str, distribution: Distribution):
+def write_distribution(
+    file: TextIOBase,
+    component: str,
+    distribution: Distribution,
+    summary: bool = False,
+):
     """Write distribution to file under component."""
     write_parameter(
-        file, component, encode_distribution(distribution),
+        file, component, encode_distribution(distribution, summary),
     )
 
 
@@ -192,13 +419,70 @@ def write_distribution(file: TextIOBase, component: str, distribution: Distribut
 # ======================================================================================
 
 
+# Samples stored as a base64 encoded npy array rather than a list.
+NPY_SAMPLES_ENCODING = "npy-base64"
+
+
+def decode_samples(encoded_samples: ParameterComponent) -> Samples:
+    """Decode samples from serialised format.
+    """
+    encoding = encoded_samples.get("encoding")
+    if encoding is None:
+        return np.array(encoded_samples["samples"])
+    if encoding == NPY_SAMPLES_ENCODING:
+        return np.load(
+            BytesIO(b64decode(encoded_samples["samples"])), allow_pickle=False
+        )
+    raise ValueError(f"unrecognised samples encoding {encoding}")
+
+
 def read_samples(file: TextIOBase, component: str) -> Samples:
     parameter = read_parameter(file, component)
     if ParameterType(parameter["type"]) is ParameterType.SAMPLES:
-        return np.array(parameter["samples"])
+        return decode_samples(parameter)
     else:
         raise ValueError(f"{parameter['type']} != 'samples'")
 
 
-def write_samples(file: TextIOBase, component: str, samples: Samples):
-    write_parameter(file, component, {"type": "samples", "samples": samples.tolist()})
+def summarise_samples(samples: Samples) -> Dict[str, Any]:
+    """Calculate the mean, variance and quantiles of samples.
+    """
+    samples = np.asarray(samples)
+    return _summary(
+        samples.mean(), samples.var(), np.quantile(samples, SUMMARY_QUANTILES)
+    )
+
+
+def encode_samples(
+    samples: Samples, binary: bool = False, summary: bool = False
+) -> ParameterComponent:
+    """Encode samples into a serialisable format, with their summary statistics if
+    summary is True.
+
+    If binary is True, the samples are stored as a base64 encoded npy array, which
+    keeps their dtype and shape, and is smaller and quicker to write and read than a
+    list, but can only be read by this API.
+    """
+    if not binary:
+        encoded_samples = {"type": "samples", "samples": np.asarray(samples).tolist()}
+    else:
+        buffer = BytesIO()
+        np.save(buffer, np.asarray(samples), allow_pickle=False)
+        encoded_samples = {
+            "type": "samples",
+            "encoding": NPY_SAMPLES_ENCODING,
+            "samples": b64encode(buffer.getvalue()).decode("ascii"),
+        }
+    if summary:
+        encoded_samples["summary"] = summarise_samples(samples)
+    return encoded_samples
+
+
+def write_samples(
+    file: TextIOBase,
+    component: str,
+    samples: Samples,
+    binary: bool = False,
+    summary: bool = False,
+):
+    write_parameter(file, component, encode_samples(samples, binary, summary))
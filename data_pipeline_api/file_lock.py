@@ -0,0 +1,28 @@
+from contextlib import contextmanager
+from logging import getLogger
+from typing import IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = getLogger(__name__)
+
+
+@contextmanager
+def lock_file(file: IO, exclusive: bool = True) -> Iterator[IO]:
+    """Hold an advisory lock on an open file.
+
+    The lock is exclusive by default, or shared if exclusive is False. Where file
+    locking is not supported, no lock is taken.
+    """
+    if fcntl is None:
+        logger.debug("file locking is not supported, not locking %s", file.name)
+        yield file
+        return
+    fcntl.flock(file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield file
+    finally:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,278 @@
+import json
+import os
+from hashlib import sha1
+from io import FileIO, RawIOBase
+from logging import getLogger
+from pathlib import Path
+from time import time_ns
+from typing import Optional, BinaryIO, Callable, Dict, List, Union
+
+logger = getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+RACY_INTERVAL_NS = 2 * 10 ** 9
+
+
+def hash_file(file: BinaryIO, message=None, block_size: int = DEFAULT_BLOCK_SIZE):
+    """Update a hash object with the remaining contents of a binary file.
+
+    The file is consumed in blocks of block_size bytes, read into a single reused
+    buffer, so memory use is bounded regardless of the size of the file.
+    """
+    if message is None:
+        message = sha1()
+    if block_size <= 0:
+        raise ValueError(f"block_size must be positive, not {block_size}")
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    while True:
+        size = file.readinto(buffer)
+        if not size:
+            break
+        message.update(view[:size])
+    return message
+
+
+def file_identity(stat_result: os.stat_result) -> List[int]:
+    """Return the parts of a stat result that identify a version of a file.
+    """
+    return [stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns]
+
+
+class HashCache:
+    def __init__(self, filename: Union[Path, str]):
+        """The HashCache class provides a persistent cache of file hashes.
+
+        Hashes are keyed by absolute path, and are only returned while the inode,
+        size and modification time of the file are unchanged. The cache is loaded
+        lazily, and new entries are merged into the file on disk by save.
+        """
+        self._filename = Path(filename)
+        self._entries: Optional[Dict[str, List]] = None
+        self._updates: Dict[str, List] = {}
+
+    def _read(self) -> Dict[str, List]:
+        try:
+            with open(self._filename) as cache_file:
+                entries = json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exception:
+            logger.warning(
+                "ignoring unreadable hash cache %s: %s", self._filename, exception
+            )
+            return {}
+        if not isinstance(entries, dict):
+            logger.warning("ignoring invalid hash cache %s", self._filename)
+            return {}
+        return entries
+
+    @property
+    def entries(self) -> Dict[str, List]:
+        if self._entries is None:
+            logger.debug("loading hash cache from %s", self._filename)
+            self._entries = self._read()
+        return self._entries
+
+    def get(self, filename: Union[Path, str]) -> Optional[str]:
+        """Return the cached hash of a file, or None if it is missing or stale.
+        """
+        path = Path(filename).resolve()
+        entry = self.entries.get(str(path))
+        if entry is None:
+            return None
+        if entry[:-1] != file_identity(path.stat()):
+            logger.debug("hash cache entry for %s is stale", path)
+            return None
+        return entry[-1]
+
+    def set(
+        self, filename: Union[Path, str], stat_result: os.stat_result, hexdigest: str
+    ):
+        """Record the hash of the version of a file described by stat_result.
+
+        Files modified within the last RACY_INTERVAL_NS are not cached, as a further
+        modification within the resolution of the filesystem timestamps would go
+        unnoticed.
+        """
+        if time_ns() - stat_result.st_mtime_ns < RACY_INTERVAL_NS:
+            logger.debug("not caching hash of recently modified %s", filename)
+            return
+        key = str(Path(filename).resolve())
+        entry = file_identity(stat_result) + [hexdigest]
+        self.entries[key] = self._updates[key] = entry
+
+    def save(self):
+        """Merge any new entries into the cache file.
+        """
+        if not self._updates:
+            return
+        entries = self._read()
+        entries.update(self._updates)
+        temporary_filename = self._filename.with_name(
+            f".{self._filename.name}.{os.getpid()}"
+        )
+        try:
+            with open(temporary_filename, "w") as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(temporary_filename, self._filename)
+        except OSError as exception:
+            logger.warning(
+                "could not save hash cache %s: %s", self._filename, exception
+            )
+            return
+        logger.debug(
+            "saved %s hash cache entries to %s", len(self._updates), self._filename
+        )
+        self._updates.clear()
+
+
+def calculate_file_hash(
+    filename,
+    extra_bytes: Optional[bytes] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    hash_cache: Optional[HashCache] = None,
+) -> str:
+    """Calculate the SHA1 hash of a file, optionally appending extra bytes.
+
+    If a hash_cache is given, the hash of an unchanged file is taken from it, and
+    newly calculated hashes are added to it.
+    """
+    use_cache = hash_cache is not None and not extra_bytes
+    if use_cache:
+        hexdigest = hash_cache.get(filename)
+        if hexdigest is not None:
+            logger.debug("found hash of %s in hash cache", filename)
+            return hexdigest
+    with open(filename, "rb", buffering=0) as file:
+        stat_result = os.fstat(file.fileno())
+        message = hash_file(file, block_size=block_size)
+        unchanged = file_identity(stat_result) == file_identity(
+            os.fstat(file.fileno())
+        )
+    if extra_bytes:
+        message.update(extra_bytes)
+    hexdigest = message.hexdigest()
+    if use_cache and unchanged:
+        hash_cache.set(filename, stat_result, hexdigest)
+    return hexdigest
+
+
+class HashingFileIO(RawIOBase):
+    def __init__(
+        self,
+        filename: Union[Path, str],
+        on_close: Optional[Callable[["HashingFileIO"], None]] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        mode: str = "rb",
+    ):
+        """The HashingFileIO class is a raw binary file that hashes its contents as
+        they are read or written.
+
+        Bytes are added to the hash as long as they are read or written in order from
+        the start of the file; other reads and writes are passed through, and a write
+        over bytes that have already been hashed invalidates the hash (truncating the
+        file to zero length starts it again). When a file opened for reading is
+        closed, any part of it that has not been hashed is read and hashed. When a
+        file opened for writing is closed, the hash is only kept if it covers the
+        whole file. In both cases on_close is then called with the file.
+        """
+        super().__init__()
+        self._file = FileIO(filename, mode)
+        self._on_close = on_close
+        self._block_size = block_size
+        self._message = sha1()
+        self._hashed = 0
+        self._valid = True
+        self._hexdigest = None
+        self.stat_result = os.fstat(self._file.fileno())
+        self.unchanged = True
+
+    @property
+    def name(self):
+        return self._file.name
+
+    @property
+    def mode(self):
+        return self._file.mode
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def readable(self) -> bool:
+        return self._file.readable()
+
+    def writable(self) -> bool:
+        return self._file.writable()
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def _update(self, position: int, data: memoryview):
+        end = position + len(data)
+        if position <= self._hashed < end:
+            self._message.update(data[self._hashed - position :])
+            self._hashed = end
+
+    def readinto(self, buffer) -> int:
+        position = self._file.tell()
+        size = self._file.readinto(buffer)
+        if size:
+            self._update(position, memoryview(buffer).cast("B")[:size])
+        return size
+
+    def write(self, buffer) -> int:
+        position = self._file.tell()
+        size = self._file.write(buffer)
+        if size:
+            if position < self._hashed:
+                logger.debug("overwrite of %s invalidated its hash", self.name)
+                self._valid = False
+            self._update(position, memoryview(buffer).cast("B")[:size])
+        return size
+
+    def truncate(self, size: Optional[int] = None) -> int:
+        size = self._file.truncate(size)
+        if size == 0:
+            self._message = sha1()
+            self._hashed = 0
+            self._valid = True
+        elif size < self._hashed:
+            logger.debug("truncation of %s invalidated its hash", self.name)
+            self._valid = False
+        return size
+
+    def hexdigest(self) -> Optional[str]:
+        """Return the hash of the whole file once it has been closed, or None if it
+        could not be calculated as the file was read or written.
+        """
+        return self._hexdigest
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._file.writable():
+                stat_result = os.fstat(self._file.fileno())
+                if self._valid and self._hashed == stat_result.st_size:
+                    self._hexdigest = self._message.hexdigest()
+                self.stat_result = stat_result
+            else:
+                self._file.seek(self._hashed)
+                hash_file(self._file, self._message, self._block_size)
+                self._hexdigest = self._message.hexdigest()
+                self.unchanged = file_identity(self.stat_result) == file_identity(
+                    os.fstat(self._file.fileno())
+                )
+        finally:
+            self._file.close()
+            super().close()
+        logger.debug("calculated hash of %s as %s", self.name, self._hexdigest)
+        if self._on_close is not None:
+            self._on_close(self)
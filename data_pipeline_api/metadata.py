@@ -1,8 +1,13 @@
-from fnmatch import fnmatch
-from typing import Mapping, Any
+import os
+import re
+from fnmatch import fnmatch, translate
+from functools import lru_cache
+from typing import Mapping, Any, Hashable, Optional, Tuple
 
 Metadata = Mapping[str, Any]
 
+WILDCARD_CHARACTERS = frozenset("*?[")
+
 
 class MetadataKey:
     """Metadata key constants.
@@ -22,6 +27,85 @@ class MetadataKey:
     title = "title"
 
 
+class Pattern:
+    def __init__(self, pattern: Any):
+        """The Pattern class is a precompiled equivalent of value_matches.
+
+        A string pattern without wildcards is compared for equality after the same
+        case normalisation as fnmatch, and is available as literal. A string pattern
+        whose only wildcard is a trailing * is compared as a prefix, available as
+        prefix. Other string patterns are translated to a regular expression once.
+        Patterns of other types are compared for equality, and hashable ones are
+        available as literal.
+        """
+        self.pattern = pattern
+        self.literal: Optional[Hashable] = None
+        self.prefix: Optional[str] = None
+        self._is_string = isinstance(pattern, str)
+        if self._is_string:
+            normalised = os.path.normcase(pattern)
+            if WILDCARD_CHARACTERS.isdisjoint(pattern):
+                self.literal = normalised
+                self._test = normalised.__eq__
+            elif pattern.endswith("*") and WILDCARD_CHARACTERS.isdisjoint(
+                pattern[:-1]
+            ):
+                self.prefix = normalised[:-1]
+                self._test = self._starts_with_prefix
+            else:
+                self._test = re.compile(translate(normalised)).match
+        elif isinstance(pattern, (bytes, os.PathLike)):
+            self._test = self._fnmatch
+        else:
+            self._test = self._equals
+            try:
+                hash(pattern)
+                self.literal = pattern
+            except TypeError:
+                pass
+
+    def _starts_with_prefix(self, value: str) -> bool:
+        return value.startswith(self.prefix)
+
+    def _fnmatch(self, value: Any) -> bool:
+        return value_matches(value, self.pattern)
+
+    def _equals(self, value: Any) -> bool:
+        return value == self.pattern
+
+    def __call__(self, value: Any) -> bool:
+        """Return True if value matches the pattern.
+        """
+        if not self._is_string:
+            return self._test(value)
+        if isinstance(value, str):
+            return bool(self._test(os.path.normcase(value)))
+        return value_matches(value, self.pattern)
+
+
+@lru_cache(maxsize=4096)
+def _compile_hashable_pattern(pattern: Hashable) -> Pattern:
+    return Pattern(pattern)
+
+
+def compile_pattern(pattern: Any) -> Pattern:
+    """Return a Pattern for a value, reusing a previously compiled one if possible.
+    """
+    try:
+        return _compile_hashable_pattern(pattern)
+    except TypeError:
+        return Pattern(pattern)
+
+
+CompiledMetadata = Tuple[Tuple[str, Pattern], ...]
+
+
+def compile_metadata(pattern: Metadata) -> CompiledMetadata:
+    """Compile the values of a metadata pattern, for use with compiled_matches.
+    """
+    return tuple((key, compile_pattern(value)) for key, value in pattern.items())
+
+
 def value_matches(value_a: Any, value_b: Any) -> bool:
     try:
         return fnmatch(value_a, value_b)
@@ -29,6 +113,12 @@ def value_matches(value_a: Any, value_b: Any) -> bool:
         return value_a == value_b
 
 
+def compiled_matches(metadata: Metadata, pattern: CompiledMetadata) -> bool:
+    """Return True if metadata matches a pattern compiled with compile_metadata.
+    """
+    return all(key in metadata and value(metadata[key]) for key, value in pattern)
+
+
 def matches(metadata: Metadata, pattern: Metadata) -> bool:
     """Return True if metadata matches pattern.
 
@@ -36,10 +126,28 @@ def matches(metadata: Metadata, pattern: Metadata) -> bool:
     values in pattern may be globs, in which case the corresponding key would be
     considered to match if the value in metadata matches the glob.
     """
-    return all(
-        key in metadata and value_matches(metadata[key], value)
-        for key, value in pattern.items()
-    )
+    return compiled_matches(metadata, compile_metadata(pattern))
+
+
+def freeze_value(value: Any) -> Hashable:
+    """Return a hashable equivalent of a metadata value.
+    """
+    if isinstance(value, Mapping):
+        return frozenset((key, freeze_value(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_value(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze_value(item) for item in value)
+    hash(value)
+    return value
+
+
+def freeze_metadata(metadata: Metadata) -> Hashable:
+    """Return a hashable equivalent of metadata, for use as a dictionary key.
+
+    Raises TypeError if the metadata contains a value that cannot be made hashable.
+    """
+    return freeze_value(metadata)
 
 
 def log_format_metadata(metadata):
@@ -1,16 +1,45 @@
-from logging import getLogger
-from typing import Sequence, Optional, NamedTuple
-from operator import attrgetter
+import json
+import os
+from bisect import bisect_left, insort
+from logging import getLogger, DEBUG
+from pathlib import Path
+from time import time_ns
+from typing import Any, Dict, Hashable, List, Sequence, Optional, NamedTuple, Tuple
 from semver import VersionInfo
 from data_pipeline_api.metadata import (
+    CompiledMetadata,
     Metadata,
     MetadataKey,
-    matches,
+    compile_metadata,
+    compiled_matches,
     log_format_metadata,
 )
+from data_pipeline_api.hashing import RACY_INTERVAL_NS, file_identity
 
 logger = getLogger(__name__)
 
+# Bumped whenever the layout of a snapshot or a MetadataStore changes, so that
+# snapshots written by other versions are ignored.
+SNAPSHOT_FORMAT = 4
+
+INDEXED_KEYS = (
+    MetadataKey.data_product,
+    MetadataKey.namespace,
+    MetadataKey.component,
+    MetadataKey.filename,
+)
+BUCKET_KEYS = (MetadataKey.namespace, MetadataKey.data_product, MetadataKey.component)
+
+
+def _index_key(value: Any) -> Hashable:
+    """Return the key under which a value is indexed, normalised in the same way as
+    fnmatch normalises the values it compares.
+    """
+    if isinstance(value, (str, os.PathLike)):
+        return os.path.normcase(value)
+    hash(value)
+    return value
+
 
 class MetadataRecord(NamedTuple):
     """A versioned Metadata object.
@@ -19,6 +48,12 @@ class MetadataRecord(NamedTuple):
     version: Optional[VersionInfo]
 
 
+def _version_order(record: MetadataRecord) -> Tuple[bool, Optional[VersionInfo]]:
+    """Return a key that orders records by version, with unversioned records first.
+    """
+    return record.version is not None, record.version
+
+
 class MetadataStore:
     def __init__(self, metadata_sequence: Optional[Sequence[Metadata]] = None):
         """The MetadataStore class provides a simple metadata lookup mechanism.
@@ -26,37 +61,262 @@ class MetadataStore:
         A MetadataStore is initialised with a Sequence of Metadata objects, which can
         then be searched by matching against Metadata fragments.
         """
-        if metadata_sequence is None:
-            self._metadata_records = ()
-        else:
-            try:
-                self._metadata_records = tuple(
-                    MetadataRecord(
-                        metadata=metadata,
-                        version=VersionInfo.parse(metadata[MetadataKey.version])
-                        if MetadataKey.version in metadata
-                        else None,
-                    )
-                    for metadata in metadata_sequence
+        self._metadata_records: List[MetadataRecord] = []
+        self._indexes: Dict[str, Dict[Hashable, List[int]]] = {
+            key: {} for key in INDEXED_KEYS
+        }
+        self._sorted_values: Dict[str, List[str]] = {}
+        self._buckets: Optional[Dict[Tuple, List[int]]] = {}
+        if metadata_sequence is not None:
+            self.extend(metadata_sequence)
+
+    def extend(self, metadata_sequence: Sequence[Metadata]):
+        """Add Metadata objects to the store, updating the indexes in place.
+        """
+        try:
+            records = [
+                MetadataRecord(
+                    metadata=metadata,
+                    version=VersionInfo.parse(metadata[MetadataKey.version])
+                    if MetadataKey.version in metadata
+                    else None,
                 )
-            except Exception as exception:
-                raise ValueError("invalid metadata") from exception
+                for metadata in metadata_sequence
+            ]
+        except Exception as exception:
+            raise ValueError("invalid metadata") from exception
+        start = len(self._metadata_records)
+        self._metadata_records.extend(records)
+        self._index_records(start)
+        self._bucket_records(start)
 
-    def find(self, metadata: Metadata) -> Optional[Metadata]:
+    def _index_records(self, start: int):
+        """Add the records from start onwards to the index for each of INDEXED_KEYS.
+
+        Records without a key are left out of its index, as they cannot match a
+        pattern that contains it. A key is no longer indexed once any of its values
+        are not hashable.
+        """
+        for key in list(self._indexes):
+            index = self._indexes[key]
+            sorted_values = self._sorted_values.get(key)
+            try:
+                for position in range(start, len(self._metadata_records)):
+                    metadata = self._metadata_records[position].metadata
+                    if key not in metadata:
+                        continue
+                    value = _index_key(metadata[key])
+                    if value not in index:
+                        index[value] = []
+                        if sorted_values is not None and isinstance(value, str):
+                            insort(sorted_values, value)
+                    index[value].append(position)
+            except TypeError:
+                logger.debug("not indexing %s as it has unhashable values", key)
+                del self._indexes[key]
+                self._sorted_values.pop(key, None)
+
+    def _position_version_order(
+        self, position: int
+    ) -> Tuple[bool, Optional[VersionInfo]]:
+        return _version_order(self._metadata_records[position])
+
+    def _bucket_records(self, start: int):
+        """Add the records from start onwards to the buckets, which group the
+        positions of the records with each combination of BUCKET_KEYS values in
+        descending version order.
+
+        The sort is stable, so records with the same version stay in their original
+        order. Buckets are not used once any of the values are not hashable.
+        """
+        if self._buckets is None:
+            return
+        updated_buckets = set()
         try:
+            for position in range(start, len(self._metadata_records)):
+                metadata = self._metadata_records[position].metadata
+                if any(key not in metadata for key in BUCKET_KEYS):
+                    continue
+                bucket_key = tuple(_index_key(metadata[key]) for key in BUCKET_KEYS)
+                self._buckets.setdefault(bucket_key, []).append(position)
+                updated_buckets.add(bucket_key)
+        except TypeError:
+            logger.debug("not bucketing records as they have unhashable values")
+            self._buckets = None
+            return
+        for bucket_key in updated_buckets:
+            self._buckets[bucket_key].sort(
+                key=self._position_version_order, reverse=True
+            )
+
+    def _bucket(self, pattern: CompiledMetadata) -> Optional[List[int]]:
+        """Return the bucket of records that could match pattern, in descending
+        version order, or None if pattern does not have a literal value for each of
+        BUCKET_KEYS.
+        """
+        if self._buckets is None:
+            return None
+        literals = {key: value.literal for key, value in pattern if key in BUCKET_KEYS}
+        if len(literals) < len(BUCKET_KEYS) or None in literals.values():
+            return None
+        return self._buckets.get(tuple(literals[key] for key in BUCKET_KEYS), [])
+
+    def _prefix_positions(self, key: str, prefix: str) -> List[int]:
+        """Return the positions of the records with a string value for key that
+        starts with prefix, in order.
+        """
+        index = self._indexes[key]
+        if key not in self._sorted_values:
+            self._sorted_values[key] = sorted(
+                value for value in index if isinstance(value, str)
+            )
+        values = self._sorted_values[key]
+        positions = []
+        for value in values[bisect_left(values, prefix) :]:
+            if not value.startswith(prefix):
+                break
+            positions.extend(index[value])
+        positions.sort()
+        return positions
+
+    def _candidates(self, pattern: CompiledMetadata) -> Sequence[MetadataRecord]:
+        """Return the records that could match pattern, in their original order.
+
+        If pattern has a literal or prefix value for any indexed key, the records
+        are taken from the smallest set of matching index entries, otherwise all
+        records are returned.
+        """
+        positions = None
+        for key, value in pattern:
+            index = self._indexes.get(key)
+            if index is None:
+                continue
+            if value.literal is not None:
+                entry = index.get(value.literal, ())
+            elif value.prefix is not None:
+                entry = self._prefix_positions(key, value.prefix)
+            else:
+                continue
+            if positions is None or len(entry) < len(positions):
+                positions = entry
+        if positions is None:
+            return self._metadata_records
+        return [self._metadata_records[position] for position in positions]
+
+    def find(self, metadata: Metadata) -> Optional[Metadata]:
+        """Return the matching Metadata object with the highest version, or None.
+
+        Unversioned records rank below all versioned ones, and the first of several
+        records with the same version is selected.
+        """
+        pattern = compile_metadata(metadata)
+        selected = None
+        bucket = self._bucket(pattern)
+        if bucket is not None:
+            # The first match in a bucket has the highest version.
+            for position in bucket:
+                record = self._metadata_records[position]
+                if compiled_matches(record.metadata, pattern):
+                    selected = record
+                    break
+        else:
             results = tuple(
                 filter(
-                    lambda record: matches(record.metadata, metadata),
-                    self._metadata_records,
+                    lambda record: compiled_matches(record.metadata, pattern),
+                    self._candidates(pattern),
                 )
             )
-            for result in results:
-                logger.debug(
-                    "found matching metadata %s", log_format_metadata(result.metadata)
-                )
-            selected = max(results, key=attrgetter("version"),).metadata
-            logger.debug("selected metadata %s", log_format_metadata(selected))
-            return selected
-        except ValueError:
+            if logger.isEnabledFor(DEBUG):
+                for result in results:
+                    logger.debug(
+                        "found matching metadata %s",
+                        log_format_metadata(result.metadata),
+                    )
+            selected = max(results, key=_version_order, default=None)
+        if selected is None:
             logger.debug("could not find any matching metadata")
             return None
+        if logger.isEnabledFor(DEBUG):
+            logger.debug("selected metadata %s", log_format_metadata(selected.metadata))
+        return selected.metadata
+
+
+def read_snapshot(
+    snapshot_filename: Path, source_stat: os.stat_result
+) -> Optional[MetadataStore]:
+    """Return the MetadataStore saved in a snapshot, or None if there is no valid
+    snapshot of the version of the source file described by source_stat.
+
+    Snapshots are JSON, holding the metadata of the store, from which the store and
+    its indexes are rebuilt.
+    """
+    try:
+        with open(snapshot_filename, "rb") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except Exception as exception:  # pylint: disable=broad-except
+        logger.warning(
+            "ignoring unreadable metadata snapshot %s: %s", snapshot_filename, exception
+        )
+        return None
+    if (
+        not isinstance(snapshot, dict)
+        or snapshot.get("format") != SNAPSHOT_FORMAT
+        or snapshot.get("source") != file_identity(source_stat)
+        or not isinstance(snapshot.get("metadata"), list)
+    ):
+        logger.debug("metadata snapshot %s is stale", snapshot_filename)
+        return None
+    try:
+        return MetadataStore(snapshot["metadata"])
+    except ValueError as exception:
+        logger.warning(
+            "ignoring invalid metadata snapshot %s: %s", snapshot_filename, exception
+        )
+        return None
+
+
+def write_snapshot(
+    snapshot_filename: Path, source_stat: os.stat_result, store: MetadataStore
+):
+    """Save a MetadataStore built from the version of the source file described by
+    source_stat to a snapshot.
+
+    Snapshots of source files modified within the last RACY_INTERVAL_NS are not
+    written, as a further modification within the resolution of the filesystem
+    timestamps would go unnoticed. Nor are snapshots of metadata that JSON cannot
+    represent exactly.
+    """
+    if time_ns() - source_stat.st_mtime_ns < RACY_INTERVAL_NS:
+        logger.debug("not writing snapshot of recently modified metadata")
+        return
+    # pylint: disable=protected-access
+    metadata = [record.metadata for record in store._metadata_records]
+    try:
+        snapshot = json.dumps(
+            dict(
+                format=SNAPSHOT_FORMAT,
+                source=file_identity(source_stat),
+                metadata=metadata,
+            )
+        )
+    except (TypeError, ValueError) as exception:
+        logger.debug("not writing snapshot of metadata: %s", exception)
+        return
+    if json.loads(snapshot)["metadata"] != metadata:
+        logger.debug("not writing snapshot of metadata that JSON would change")
+        return
+    temporary_filename = snapshot_filename.with_name(
+        f".{snapshot_filename.name}.{os.getpid()}"
+    )
+    try:
+        with open(temporary_filename, "w") as snapshot_file:
+            snapshot_file.write(snapshot)
+        os.replace(temporary_filename, snapshot_filename)
+    except OSError as exception:
+        logger.warning(
+            "could not write metadata snapshot %s: %s", snapshot_filename, exception
+        )
+        return
+    logger.debug("wrote metadata snapshot %s", snapshot_filename)
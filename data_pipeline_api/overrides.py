@@ -1,9 +1,18 @@
-from logging import getLogger
-from typing import Iterable, NamedTuple, Sequence, Tuple
-from data_pipeline_api.metadata import Metadata, matches, log_format_metadata
+import os
+from logging import getLogger, DEBUG
+from typing import Any, Dict, Hashable, Iterator, List, NamedTuple, Sequence, Tuple
+from data_pipeline_api.metadata import (
+    Metadata,
+    Pattern,
+    compile_pattern,
+    log_format_metadata,
+)
 
 logger = getLogger(__name__)
 
+_TERMINAL = None
+_MISSING = object()
+
 
 class Override(NamedTuple):
     """A metadata override.
@@ -12,6 +21,50 @@ class Override(NamedTuple):
     use: Metadata
 
 
+class _PatternIndex:
+    def __init__(self):
+        """Index of the override patterns for a single metadata key.
+
+        Literal string patterns are looked up by value, prefix patterns are found by
+        walking a trie of their prefixes, and other patterns are tested one by one.
+        """
+        self._patterns: List[Tuple[int, Pattern]] = []
+        self._literals: Dict[Hashable, List[int]] = {}
+        self._prefixes: Dict[Any, Any] = {}
+        self._others: List[Tuple[int, Pattern]] = []
+
+    def add(self, position: int, pattern: Pattern):
+        self._patterns.append((position, pattern))
+        if pattern.prefix is not None:
+            node = self._prefixes
+            for character in pattern.prefix:
+                node = node.setdefault(character, {})
+            node.setdefault(_TERMINAL, []).append(position)
+        elif pattern.literal is not None and isinstance(pattern.pattern, str):
+            self._literals.setdefault(pattern.literal, []).append(position)
+        else:
+            self._others.append((position, pattern))
+
+    def find(self, value: Any) -> List[int]:
+        """Return the positions of the patterns that match value, in no fixed order.
+        """
+        if not isinstance(value, str):
+            return [position for position, pattern in self._patterns if pattern(value)]
+        normalised = os.path.normcase(value)
+        positions = list(self._literals.get(normalised, ()))
+        node = self._prefixes
+        positions.extend(node.get(_TERMINAL, ()))
+        for character in normalised:
+            node = node.get(character)
+            if node is None:
+                break
+            positions.extend(node.get(_TERMINAL, ()))
+        positions.extend(
+            position for position, pattern in self._others if pattern(value)
+        )
+        return positions
+
+
 class Overrides:
     def __init__(self, overrides: Sequence[Tuple[Metadata, Metadata]]):
         """The Overrides class provides a simple metadata override mechanism.
@@ -21,13 +74,61 @@ class Overrides:
         additional metadata to use as an override once a match has been found.
         """
         self._overrides = tuple(Override(*override) for override in overrides)
+        self._indexes: Dict[str, _PatternIndex] = {}
+        self._unconditional: List[int] = []
+        for position, override in enumerate(self._overrides):
+            if not override.where:
+                self._unconditional.append(position)
+            for key, value in override.where.items():
+                self._indexes.setdefault(key, _PatternIndex()).add(
+                    position, compile_pattern(value)
+                )
 
-    def find(self, metadata: Metadata) -> Iterable[Override]:
-        return filter(
-            lambda override: matches(metadata, override.where), self._overrides,
-        )
+    def _find_positions(self, metadata: Metadata, start: int) -> List[int]:
+        """Return the positions of the overrides from start onwards that match
+        metadata, in order.
+
+        An override matches if each of the values in its where is matched, which is
+        counted using the index for each key of metadata.
+        """
+        counts: Dict[int, int] = {}
+        for key, index in self._indexes.items():
+            if key in metadata:
+                for position in index.find(metadata[key]):
+                    counts[position] = counts.get(position, 0) + 1
+        positions = [
+            position
+            for position, count in counts.items()
+            if count == len(self._overrides[position].where)
+        ]
+        positions.extend(self._unconditional)
+        return sorted(position for position in positions if position >= start)
+
+    def _indexed_values(self, metadata: Metadata) -> List[Any]:
+        return [metadata.get(key, _MISSING) for key in self._indexes]
+
+    def find(self, metadata: Metadata) -> Iterator[Override]:
+        """Return the overrides whose where matches metadata, in order.
+
+        The matches are found lazily, so that an override applied to metadata while
+        iterating is taken into account when matching the overrides after it.
+        """
+        positions = self._find_positions(metadata, 0)
+        values = self._indexed_values(metadata)
+        next_position = 0
+        while next_position < len(positions):
+            position = positions[next_position]
+            yield self._overrides[position]
+            updated_values = self._indexed_values(metadata)
+            if any(a is not b for a, b in zip(values, updated_values)):
+                positions = self._find_positions(metadata, position + 1)
+                values = updated_values
+                next_position = 0
+            else:
+                next_position += 1
 
     def apply(self, metadata: Metadata):
         for override in self.find(metadata):
-            logger.debug("applying override %s", log_format_metadata(override.use))
+            if logger.isEnabledFor(DEBUG):
+                logger.debug("applying override %s", log_format_metadata(override.use))
             metadata.update(override.use)
@@ -6,7 +6,6 @@ from typing import Dict, Union, List, Any, Optional
 from datetime import datetime as dt
 
 import click
-import yaml
 
 from data_pipeline_api.registry.common import (
     configure_cli_logging,
@@ -23,6 +22,7 @@ from data_pipeline_api.registry.common import (
     upload_to_storage,
 )
 from data_pipeline_api.registry.upload import upload_from_config, upload_to_text_table
+from data_pipeline_api.access_log import read_access_log
 from data_pipeline_api.file_api import FileAPI, RunMetadata
 from data_pipeline_api.metadata import MetadataKey
 from data_pipeline_api.registry.utils import (
@@ -471,8 +471,7 @@ def upload_model_run(
     :param text_file_table: If true, model_config and submission_script are uploaded to the text_file table in the data_registry
     """
     config_filename = Path(config_filename)
-    with open(config_filename, "r") as cf:
-        config = yaml.safe_load(cf)
+    config = read_access_log(config_filename)
 
     accessibility = _get_accessibility(config)
     run_metadata = config["run_metadata"]
@@ -507,6 +506,8 @@ def upload_model_run(
 
     for event in config["io"]:
         read = event["type"] == "read"
+        # Aggregated reads stand for count identical reads.
+        count = event.get("count", 1)
         metadata = event["access_metadata"]
         component = metadata.get(MetadataKey.component)
         version = metadata.get(MetadataKey.version, "")
@@ -518,15 +519,18 @@ def upload_model_run(
             if event_namespace is None:
                 raise ValueError(f"No namespace specified for {event}")
             if read:
-                inputs.append(
-                    _get_data_product_url(
-                        data_product_name,
-                        event_namespace,
-                        version,
-                        component,
-                        data_registry_url,
-                        token,
-                    )
+                inputs.extend(
+                    [
+                        _get_data_product_url(
+                            data_product_name,
+                            event_namespace,
+                            version,
+                            component,
+                            data_registry_url,
+                            token,
+                        )
+                    ]
+                    * count
                 )
             else:
                 _verify_hash(filename, access_calculated_hash)
@@ -549,10 +553,17 @@ def upload_model_run(
         elif MetadataKey.doi_or_unique_name in metadata:
             doi_or_unique_name = metadata[MetadataKey.doi_or_unique_name]
             if read:
-                inputs.append(
-                    _get_external_object_url(
-                        doi_or_unique_name, version, component, data_registry_url, token
-                    )
+                inputs.extend(
+                    [
+                        _get_external_object_url(
+                            doi_or_unique_name,
+                            version,
+                            component,
+                            data_registry_url,
+                            token,
+                        )
+                    ]
+                    * count
                 )
             else:
                 raise ValueError("can only read external objects")
@@ -598,7 +609,7 @@ def upload_model_run(
     "--config",
     required=True,
     type=click.Path(exists=True),
-    help="Path to the access yaml file.",
+    help="Path to the access yaml (or jsonl) file.",
 )
 @click.option(
     "--model-config",
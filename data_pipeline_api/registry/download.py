@@ -66,6 +66,7 @@ def download_from_configs(
     read_configs: ReadConfigs,
     token: str,
     root_dir: Optional[Union[Path, str]] = None,
+    append_metadata: bool = False,
 ) -> None:
     """
     Iterates through the config read blocks and downloads the relevant data for each block
@@ -74,6 +75,7 @@ def download_from_configs(
     :param read_configs: list of read blocks
     :param token: personal access token
     :param root_dir: root directory to instantiate the data in, defaults to current working directory
+    :param append_metadata: If True the metadata is appended to any existing metadata.yaml rather than replacing it
     """
     unnormalised_data_directory = Path(run_metadata[RunMetadata.data_directory])
     root_dir = Path(root_dir) if root_dir is not None else Path.cwd()
@@ -105,7 +107,7 @@ def download_from_configs(
                 parsed_config.version,
             )
 
-    downloader.download()
+    downloader.download(append_metadata=append_metadata)
 
 
 def download_from_config_file(config_filename: Union[Path, str], token: str) -> None:
@@ -1,4 +1,5 @@
 import fnmatch
+import io
 import itertools
 import logging
 import os
@@ -8,7 +9,7 @@ from collections import defaultdict
 from functools import partial
 from pathlib import Path
 
-from typing import Dict, Optional, List, Tuple, Any, Union, IO
+from typing import Dict, Optional, List, Tuple, Any, Union, IO, Iterable
 
 import yaml
 from fsspec.implementations.sftp import SFTPFileSystem
@@ -25,6 +26,7 @@ from data_pipeline_api.registry.common import (
     get_remote_filesystem_and_path,
     unique_dicts,
 )
+from data_pipeline_api.file_lock import lock_file
 from data_pipeline_api.metadata import MetadataKey
 
 logger = logging.getLogger(__name__)
@@ -35,6 +37,19 @@ OUTPUT_FILENAME = "output_filename"
 FULL_OUTPUT_FILENAME = "full_output_filename"
 
 
+def _is_block_sequence(lines: Iterable[bytes]) -> bool:
+    """
+    Returns True if YAML lines are empty, or start a block sequence that further block sequence entries can be appended
+    to. Only the lines up to the first significant one are read.
+    """
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith(b"#") or stripped == b"---":
+            continue
+        return line.startswith(b"-") and line[1:2] in (b" ", b"\t", b"\r", b"\n", b"")
+    return True
+
+
 class Downloader:
     """
     Class to handle downloading data products and external objects from the data registry to disk
@@ -393,24 +408,51 @@ class Downloader:
                 self._external_objects.insert(0, block)
                 raise
 
-    def write_metadata(self):
+    def write_metadata(self, append: bool = False):
         """
         Writes metadata for the resolved data products and external objects to metadata.yaml
+
+        :param append: If True the metadata is appended to any existing metadata.yaml under an exclusive file lock,
+                       rather than replacing it
         """
         logger.info("Writing metadata")
         self._data_directory.mkdir(parents=True, exist_ok=True)
         metadata_file = self._data_directory / "metadata.yaml"
 
-        with open(metadata_file, "w") as stream:
-            self._write_metadata_data_product(stream)
-            self._write_metadata_external_object(stream)
-
-    def download(self, write_metadata: bool = True):
+        if not append:
+            with open(metadata_file, "w") as stream:
+                self._write_metadata_data_product(stream)
+                self._write_metadata_external_object(stream)
+            return
+
+        new_metadata = io.StringIO()
+        self._write_metadata_data_product(new_metadata)
+        self._write_metadata_external_object(new_metadata)
+        with open(metadata_file, "a+b") as stream, lock_file(stream):
+            stream.seek(0)
+            if _is_block_sequence(stream):
+                end = stream.seek(0, os.SEEK_END)
+                if end:
+                    stream.seek(end - 1)
+                    if stream.read(1) != b"\n":
+                        stream.write(b"\n")
+                stream.write(new_metadata.getvalue().encode())
+            else:
+                logger.debug("metadata.yaml is not a block sequence, rewriting it")
+                stream.seek(0)
+                metadatas = yaml.safe_load(stream) or []
+                metadatas.extend(yaml.safe_load(new_metadata.getvalue()) or [])
+                stream.seek(0)
+                stream.truncate()
+                stream.write(yaml.safe_dump(metadatas).encode())
+
+    def download(self, write_metadata: bool = True, append_metadata: bool = False):
         """
         Resolves, downloads and optionally writes metadata for data products and external objects that have been
         registered on this downloader
 
         :param write_metadata: If True the metadata.yaml file is written
+        :param append_metadata: If True the metadata is appended to any existing metadata.yaml
         """
         logger.info("Starting download")
         logger.info("Resolving data registry references")
@@ -419,7 +461,7 @@ class Downloader:
         self._data_directory.mkdir(parents=True, exist_ok=True)
 
         if write_metadata:
-            self.write_metadata()
+            self.write_metadata(append_metadata)
         else:
             logger.info("Not writing metadata")
         logger.info("Downloading data")
@@ -0,0 +1,241 @@
+import json
+import os
+import sqlite3
+from datetime import date, datetime
+from logging import getLogger, DEBUG
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from semver import VersionInfo
+from data_pipeline_api.metadata import (
+    CompiledMetadata,
+    Metadata,
+    MetadataKey,
+    compile_metadata,
+    compiled_matches,
+    log_format_metadata,
+)
+
+logger = getLogger(__name__)
+
+COLUMNS = (
+    MetadataKey.filename,
+    MetadataKey.data_product,
+    MetadataKey.namespace,
+    MetadataKey.component,
+    MetadataKey.extension,
+    MetadataKey.run_id,
+    MetadataKey.version,
+    MetadataKey.verified_hash,
+    MetadataKey.calculated_hash,
+    MetadataKey.accessibility,
+    MetadataKey.doi_or_unique_name,
+    MetadataKey.title,
+)
+# Bumped whenever the schema or the encoding of the records changes, so that stores
+# built by other versions are rebuilt.
+SCHEMA_VERSION = 1
+# Values are compared in SQL only where fnmatch compares them case sensitively.
+CASE_SENSITIVE = os.path.normcase("A") == "A"
+
+
+def _column_value(value: Any) -> Optional[str]:
+    """Return the value stored in the column for a metadata value, which is only
+    set for strings, as other values are never matched by string patterns.
+    """
+    return value if isinstance(value, str) else None
+
+
+def _encode_value(value: Any) -> Dict[str, str]:
+    """Encode the dates and datetimes that YAML metadata may hold as JSON objects.
+    """
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"cannot encode {type(value).__name__} in metadata")
+
+
+def _decode_value(mapping: Dict[str, Any]) -> Any:
+    if mapping.keys() == {"$datetime"}:
+        return datetime.fromisoformat(mapping["$datetime"])
+    if mapping.keys() == {"$date"}:
+        return date.fromisoformat(mapping["$date"])
+    return mapping
+
+
+class SQLiteMetadataStore:
+    def __init__(
+        self,
+        filename: Union[Path, str],
+        metadata_sequence: Optional[Sequence[Metadata]] = None,
+    ):
+        """The SQLiteMetadataStore class is a MetadataStore kept in an SQLite file.
+
+        Each record is stored as JSON, alongside an indexed column for each of the
+        MetadataKey fields, and is indexed by the major, minor and patch parts of
+        its version. An existing file of another SCHEMA_VERSION is emptied. find
+        narrows the records down in SQL, comparing literal values for equality and
+        translating globs without character classes to GLOB, and then matches and
+        selects the highest version as MetadataStore.find does.
+        """
+        self._filename = Path(filename)
+        self._connection = sqlite3.connect(str(self._filename))
+        self._create_schema()
+        if metadata_sequence is not None:
+            self.extend(metadata_sequence)
+
+    def _create_schema(self):
+        columns = ", ".join(f"{column} TEXT" for column in COLUMNS)
+        (schema_version,) = self._connection.execute("PRAGMA user_version").fetchone()
+        with self._connection:
+            if schema_version != SCHEMA_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS metadata")
+                self._connection.execute("DROP TABLE IF EXISTS source")
+                self._connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS metadata (id INTEGER PRIMARY KEY, "
+                f"{columns}, major INTEGER, minor INTEGER, patch INTEGER, "
+                "record TEXT NOT NULL)"
+            )
+            for column in COLUMNS:
+                self._connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS metadata_{column} "
+                    f"ON metadata ({column})"
+                )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS metadata_semver "
+                "ON metadata (major DESC, minor DESC, patch DESC)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS source (id INTEGER PRIMARY KEY, "
+                "identity TEXT)"
+            )
+
+    @staticmethod
+    def _rows(metadata_sequence: Sequence[Metadata]) -> List[Tuple]:
+        try:
+            rows = []
+            for metadata in metadata_sequence:
+                if MetadataKey.version in metadata:
+                    version = VersionInfo.parse(metadata[MetadataKey.version])
+                    version_columns = (version.major, version.minor, version.patch)
+                else:
+                    version_columns = (None, None, None)
+                rows.append(
+                    tuple(_column_value(metadata.get(column)) for column in COLUMNS)
+                    + version_columns
+                    + (json.dumps(dict(metadata), default=_encode_value),)
+                )
+            return rows
+        except Exception as exception:
+            raise ValueError("invalid metadata") from exception
+
+    def _insert(self, rows: List[Tuple]):
+        placeholders = ", ".join("?" for _ in range(len(COLUMNS) + 4))
+        self._connection.executemany(
+            f"INSERT INTO metadata ({', '.join(COLUMNS)}, major, minor, patch, record) "
+            f"VALUES ({placeholders})",
+            rows,
+        )
+
+    def extend(self, metadata_sequence: Sequence[Metadata]):
+        """Add Metadata objects to the store.
+        """
+        rows = self._rows(metadata_sequence)
+        with self._connection:
+            self._insert(rows)
+
+    def replace(
+        self, metadata_sequence: Sequence[Metadata], source: Optional[List] = None
+    ):
+        """Replace the contents of the store, recording the identity of the source
+        they were read from.
+        """
+        rows = self._rows(metadata_sequence)
+        with self._connection:
+            self._connection.execute("DELETE FROM metadata")
+            self._insert(rows)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO source (id, identity) VALUES (0, ?)",
+                (None if source is None else json.dumps(source),),
+            )
+        logger.debug("wrote %s records to %s", len(rows), self._filename)
+
+    @property
+    def source(self) -> Optional[List]:
+        """The identity of the source of the store, if known.
+        """
+        row = self._connection.execute(
+            "SELECT identity FROM source WHERE id = 0"
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    @staticmethod
+    def _where(pattern: CompiledMetadata) -> Tuple[str, List[str]]:
+        clauses = []
+        parameters = []
+        for key, value in pattern:
+            if (
+                key not in COLUMNS
+                or not CASE_SENSITIVE
+                or not isinstance(value.pattern, str)
+            ):
+                continue
+            if value.literal is not None:
+                clauses.append(f"{key} = ?")
+            elif "[" not in value.pattern:
+                clauses.append(f"{key} GLOB ?")
+            else:
+                continue
+            parameters.append(value.pattern)
+        if not clauses:
+            return "", parameters
+        return " WHERE " + " AND ".join(clauses), parameters
+
+    def find(self, metadata: Metadata) -> Optional[Metadata]:
+        pattern = compile_metadata(metadata)
+        where, parameters = self._where(pattern)
+        cursor = self._connection.execute(
+            "SELECT major, minor, patch, record FROM metadata"
+            f"{where} ORDER BY major DESC, minor DESC, patch DESC, id",
+            parameters,
+        )
+        # Records are ordered by major, minor and patch version, so only those with
+        # the first matching triple need their full versions comparing.
+        selected = None
+        selected_triple = None
+        selected_version = None
+        for major, minor, patch, record in cursor:
+            if selected is not None and (major, minor, patch) != selected_triple:
+                break
+            record_metadata = json.loads(record, object_hook=_decode_value)
+            if not compiled_matches(record_metadata, pattern):
+                continue
+            if logger.isEnabledFor(DEBUG):
+                logger.debug(
+                    "found matching metadata %s", log_format_metadata(record_metadata)
+                )
+            version = (
+                VersionInfo.parse(record_metadata[MetadataKey.version])
+                if MetadataKey.version in record_metadata
+                else None
+            )
+            if selected is None or (version is not None and version > selected_version):
+                selected = record_metadata
+                selected_triple = (major, minor, patch)
+                selected_version = version
+        cursor.close()
+        if selected is None:
+            logger.debug("could not find any matching metadata")
+            return None
+        if logger.isEnabledFor(DEBUG):
+            logger.debug("selected metadata %s", log_format_metadata(selected))
+        return selected
+
+    def close(self):
+        self._connection.close()
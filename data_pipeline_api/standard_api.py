@@ -1,10 +1,25 @@
+from collections import Counter
 from io import TextIOWrapper
 from pathlib import Path
 from contextlib import contextmanager
-from typing import Union, NamedTuple, Optional, Sequence, Type
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Union,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+import h5py
+import numpy as np
 from data_pipeline_api.file_api import FileAPI, RunMetadata
-from data_pipeline_api.metadata import Metadata
+from data_pipeline_api.metadata import Metadata, MetadataKey
 from data_pipeline_api.file_formats.parameter_file import (
+    ParameterComponent,
     ParameterType,
     Estimate,
     Distribution,
@@ -13,17 +28,29 @@ from data_pipeline_api.file_formats.parameter_file import (
     read_estimate,
     read_distribution,
     read_samples,
+    read_summary,
+    summary_quantile,
     write_estimate,
     write_distribution,
     write_samples,
+    write_parameters,
+    encode_estimate,
+    encode_distribution,
+    encode_samples,
 )
 from data_pipeline_api.file_formats.object_file import (
+    DEFAULT_DATASET_OPTIONS,
     Array,
+    ArrayAppender,
+    Dimension,
+    TableAppender,
+    Selection,
     Table,
     read_array,
     read_table,
     write_array,
     write_table,
+    validate_dataset_options,
 )
 
 
@@ -35,6 +62,74 @@ class Issue(NamedTuple):
     severity: int
 
 
+class ParameterWriter:
+    def __init__(self, data_product: str):
+        """The ParameterWriter class gathers parameter components to be written to a
+        data product, so that the parameter file can be written once for all of them.
+        """
+        self.data_product = data_product
+        self.components: Dict[str, ParameterComponent] = {}
+        self.additional_metadata: Dict[str, Metadata] = {}
+
+    def _add(
+        self,
+        component: str,
+        parameter: ParameterComponent,
+        description: Optional[str],
+        issues: Optional[Sequence[Issue]],
+    ):
+        self.components[component] = parameter
+        self.additional_metadata[component] = StandardAPI.get_additional_metadata(
+            description, issues
+        )
+
+    def write_estimate(
+        self,
+        component: str,
+        estimate: Estimate,
+        *,
+        description: Optional[str] = None,
+        issues: Optional[Sequence[Issue]] = None,
+    ):
+        """Add an estimate to be written to the data product component.
+        """
+        self._add(component, encode_estimate(estimate), description, issues)
+
+    def write_distribution(
+        self,
+        component: str,
+        distribution: Distribution,
+        *,
+        description: Optional[str] = None,
+        issues: Optional[Sequence[Issue]] = None,
+        summary: bool = False,
+    ):
+        """Add a distribution to be written to the data product component, with its
+        summary statistics if summary is True.
+        """
+        self._add(
+            component, encode_distribution(distribution, summary), description, issues
+        )
+
+    def write_samples(
+        self,
+        component: str,
+        samples: Samples,
+        *,
+        description: Optional[str] = None,
+        issues: Optional[Sequence[Issue]] = None,
+        binary: bool = False,
+        summary: bool = False,
+    ):
+        """Add samples to be written to the data product component, in the binary
+        samples encoding if binary is True, and with their summary statistics if
+        summary is True.
+        """
+        self._add(
+            component, encode_samples(samples, binary, summary), description, issues
+        )
+
+
 class StandardAPI:
     """The StandardAPI class provides access to data products conforming to the Standard
     API specification.
@@ -47,11 +142,31 @@ class StandardAPI:
         uri: str,
         git_sha: str,
         file_api_class: Type[FileAPI] = FileAPI,
+        *,
+        native_hdf5: bool = False,
     ):
-        return cls(file_api_class(config_filename), uri, git_sha)
+        return cls(
+            file_api_class(config_filename), uri, git_sha, native_hdf5=native_hdf5
+        )
 
-    def __init__(self, file_api: FileAPI, uri: str, git_sha: str):
+    def __init__(
+        self, file_api: FileAPI, uri: str, git_sha: str, *, native_hdf5: bool = False
+    ):
+        """If native_hdf5 is True, object files are opened by HDF5 through their paths,
+        which is faster than reading and writing them through Python file objects.
+        Each object file is then opened once per session, and the open file is
+        shared by all the components read from or written to it. A file open for
+        reading is closed before it is opened for writing, which raises ValueError if
+        the file is still being read.
+        """
         self.file_api = file_api
+        self.native_hdf5 = native_hdf5
+        self._object_files: Dict[Tuple[Path, str], h5py.File] = {}
+        self._object_file_users: Dict[Tuple[Path, str], int] = Counter()
+        self.config_dataset_options = validate_dataset_options(
+            self.file_api.get_config("dataset_options") or {}
+        )
+        self.file_api.add_close_callback(self.close_object_files)
         self.file_api.set_run_metadata(RunMetadata.git_repo, uri)
         self.file_api.set_run_metadata(RunMetadata.git_sha, git_sha)
 
@@ -60,6 +175,7 @@ class StandardAPI:
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        self.close_object_files()
         return self.file_api.__exit__(exc_type, exc_value, traceback)
 
     @staticmethod
@@ -111,17 +227,60 @@ class StandardAPI:
         ) as parameter_file:
             yield parameter_file
 
+    @contextmanager
+    def parameter_writer(self, data_product: str) -> Iterator[ParameterWriter]:
+        """Gather estimates, distributions and samples written to a data product, and
+        write them when the context exits without an exception.
+
+        Each parameter file is loaded and written once, however many components are
+        written to it, and one write is recorded in the access log per component.
+        """
+        writer = ParameterWriter(data_product)
+        yield writer
+        files: Dict[str, Dict[str, Metadata]] = {}
+        for component, additional_metadata in writer.additional_metadata.items():
+            call_metadata = dict(
+                data_product=data_product,
+                component=component,
+                extension="toml",
+                **additional_metadata,
+            )
+            filename = self.file_api.get_write_metadata(call_metadata)[
+                MetadataKey.filename
+            ]
+            files.setdefault(filename, {})[component] = call_metadata
+        for file_call_metadata in files.values():
+            first_call_metadata, *other_call_metadata = file_call_metadata.values()
+            with TextIOWrapper(
+                self.file_api.open_for_write(**first_call_metadata)
+            ) as file:
+                write_parameters(
+                    file,
+                    {
+                        component: writer.components[component]
+                        for component in file_call_metadata
+                    },
+                )
+                for call_metadata in other_call_metadata:
+                    self.file_api.record_write(file.buffer, **call_metadata)
+
     # ----------------------------------------------------------------------------------
     # Estimate
     # ----------------------------------------------------------------------------------
 
     def read_estimate(self, data_product: str, component: str) -> Estimate:
         """Read an estimate from the data product component.
+
+        The mean of a distribution or samples is read from their summary statistics
+        if they were written with them.
         """
         with self.open_parameter_file_for_read(data_product, component) as file:
             parameter_type = read_type(file, component)
             if parameter_type is ParameterType.POINT_ESTIMATE:
                 return read_estimate(file, component)
+            summary = read_summary(file, component)
+            if summary is not None:
+                return summary["mean"]
             if parameter_type is ParameterType.DISTRIBUTION:
                 return read_distribution(file, component).mean()
             if parameter_type is ParameterType.SAMPLES:
@@ -169,13 +328,18 @@ class StandardAPI:
         *,
         description: Optional[str] = None,
         issues: Optional[Sequence[Issue]] = None,
+        summary: bool = False,
     ):
         """Write a distribution to the data product component.
+
+        If summary is True, its mean, variance and quantiles are stored with it, so
+        that read_estimate and read_quantile need not construct the distribution.
+        Only univariate distributions can be summarised.
         """
         with self.open_parameter_file_for_write(
             data_product, component, description, issues
         ) as file:
-            write_distribution(file, component, distribution)
+            write_distribution(file, component, distribution, summary)
 
     # ----------------------------------------------------------------------------------
     # Samples
@@ -202,22 +366,132 @@ class StandardAPI:
         *,
         description: Optional[str] = None,
         issues: Optional[Sequence[Issue]] = None,
+        binary: bool = False,
+        summary: bool = False,
     ):
         """Write samples to the data product component.
+
+        If summary is True, their mean, variance and quantiles are stored with them, so
+        that read_estimate and read_quantile need not decode the samples.
+
+        If binary is True, the samples are stored as a base64 encoded npy array, which
+        keeps their dtype and shape and is smaller and quicker to write and read for
+        large sample sets, but is not understood by the other language implementations.
         """
         with self.open_parameter_file_for_write(
             data_product, component, description, issues
         ) as file:
-            write_samples(file, component, samples)
+            write_samples(file, component, samples, binary, summary)
+
+    # ----------------------------------------------------------------------------------
+    # Quantile
+    # ----------------------------------------------------------------------------------
+
+    def read_quantile(
+        self, data_product: str, component: str, probability: float
+    ) -> float:
+        """Read the quantile for probability of the distribution or samples in the data
+        product component.
+
+        The quantile is read from their summary statistics if it is one of the
+        quantiles stored there, and otherwise calculated.
+        """
+        with self.open_parameter_file_for_read(data_product, component) as file:
+            parameter_type = read_type(file, component)
+            if parameter_type is ParameterType.POINT_ESTIMATE:
+                raise ValueError("point-estimate does not have quantiles")
+            summary = read_summary(file, component)
+            if summary is not None:
+                quantile = summary_quantile(summary, probability)
+                if quantile is not None:
+                    return quantile
+            if parameter_type is ParameterType.DISTRIBUTION:
+                return float(read_distribution(file, component).ppf(probability))
+            if parameter_type is ParameterType.SAMPLES:
+                return float(np.quantile(read_samples(file, component), probability))
+            raise ValueError(f"unrecognised type {parameter_type}")
 
     # ==================================================================================
     # Object (hdf5) files
     # ==================================================================================
 
+    def get_dataset_options(
+        self, dataset_options: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Return the options to create the dataset of a table or array with.
+
+        These are DEFAULT_DATASET_OPTIONS, updated with the dataset_options config
+        key, and then with dataset_options, with the keys described in
+        object_file.validate_dataset_options. Setting compression discards any
+        compression_opts set before it. By default, the chunk shape is chosen from the
+        shape of the data, and no compression is used.
+        """
+        options = dict(DEFAULT_DATASET_OPTIONS)
+        for overrides in (self.config_dataset_options, dataset_options or {}):
+            if "compression" in overrides:
+                options.pop("compression_opts", None)
+            options.update(overrides)
+        return validate_dataset_options(options)
+
+    @contextmanager
+    def _open_object_file(self, path: Path, mode: str) -> Iterator[h5py.File]:
+        """Yield an HDF5 file open on path in mode, reusing one opened earlier in the
+        session.
+
+        A file open for writing is also used for reading. HDF5 cannot open a file for
+        writing while it is open for reading, so a file open for reading is closed
+        first, unless it is still in use, when ValueError is raised.
+        """
+        path = path.resolve()
+        key = (path, mode)
+        if mode == "r" and (path, "a") in self._object_files:
+            key = (path, "a")
+        object_file = self._object_files.get(key)
+        if object_file is None or not object_file.id.valid:
+            if key[1] == "a" and (path, "r") in self._object_files:
+                if self._object_file_users[(path, "r")] > 0:
+                    raise ValueError(
+                        f"cannot open {path} for writing while it is being read"
+                    )
+                self._object_files.pop((path, "r")).close()
+            object_file = self._object_files[key] = h5py.File(path, mode=key[1])
+        self._object_file_users[key] += 1
+        try:
+            yield object_file
+        finally:
+            self._object_file_users[key] -= 1
+
+    def flush_object_files(self):
+        """Flush the object files opened for writing through their paths in the
+        session.
+        """
+        for (_, mode), object_file in self._object_files.items():
+            if mode == "a" and object_file.id.valid:
+                object_file.flush()
+
+    def close_object_files(self):
+        """Close the object files opened through their paths in the session.
+        """
+        for object_file in self._object_files.values():
+            object_file.close()
+        self._object_files.clear()
+        self._object_file_users.clear()
+
     @contextmanager
     def open_object_file_for_read(self, data_product: str, component: str):
-        """Open an parameter file for reading.
+        """Open an object file for reading.
         """
+        if self.native_hdf5:
+            # The file is hashed as it is read, including anything written to it.
+            self.flush_object_files()
+            with self._open_object_file(
+                self.file_api.get_path_for_read(
+                    data_product=data_product, component=component
+                ),
+                "r",
+            ) as object_file:
+                yield object_file
+            return
         with self.file_api.open_for_read(
             data_product=data_product, component=component
         ) as object_file:
@@ -230,15 +504,26 @@ class StandardAPI:
         component: str,
         description: Optional[str] = None,
         issues: Optional[Sequence[Issue]] = None,
+        dataset_options: Optional[Dict[str, Any]] = None,
     ):
-        """Open an parameter file for writing.
+        """Open an object file for writing, recording the dataset options the
+        component is written with, if given.
         """
-        with self.file_api.open_for_write(
+        call_metadata = dict(
             data_product=data_product,
             component=component,
             extension="h5",
             **self.get_additional_metadata(description, issues),
-        ) as object_file:
+        )
+        if dataset_options is not None:
+            call_metadata["dataset_options"] = dataset_options
+        if self.native_hdf5:
+            with self._open_object_file(
+                self.file_api.get_path_for_write(**call_metadata), "a"
+            ) as object_file:
+                yield object_file
+            return
+        with self.file_api.open_for_write(**call_metadata) as object_file:
             yield object_file
 
     def read_table(self, data_product: str, component: str) -> Table:
@@ -255,19 +540,31 @@ class StandardAPI:
         *,
         description: Optional[str] = None,
         issues: Optional[Sequence[Issue]] = None,
+        dataset_options: Optional[Dict[str, Any]] = None,
     ):
         """Write a table to the data product component.
+
+        dataset_options override those from the config for this table, as described
+        in get_dataset_options.
         """
+        dataset_options = self.get_dataset_options(dataset_options)
         with self.open_object_file_for_write(
-            data_product, component, description, issues
+            data_product, component, description, issues, dataset_options
         ) as file:
-            write_table(file, component, table)
+            write_table(file, component, table, dataset_options)
 
-    def read_array(self, data_product: str, component: str) -> Array:
-        """Read an array from the data product component.
+    def read_array(
+        self,
+        data_product: str,
+        component: str,
+        *,
+        selection: Optional[Selection] = None,
+    ) -> Array:
+        """Read an array from the data product component, or if selection is given,
+        only the part of it selected, as described in object_file.read_array.
         """
         with self.open_object_file_for_read(data_product, component) as file:
-            return read_array(file, component)
+            return read_array(file, component, selection)
 
     def write_array(
         self,
@@ -277,10 +574,68 @@ class StandardAPI:
         *,
         description: Optional[str] = None,
         issues: Optional[Sequence[Issue]] = None,
+        dataset_options: Optional[Dict[str, Any]] = None,
     ):
         """Write an array to the data product component.
+
+        dataset_options override those from the config for this array, as described
+        in get_dataset_options.
         """
+        dataset_options = self.get_dataset_options(dataset_options)
         with self.open_object_file_for_write(
-            data_product, component, description, issues
+            data_product, component, description, issues, dataset_options
         ) as file:
-            write_array(file, component, array)
+            write_array(file, component, array, dataset_options)
+
+    @contextmanager
+    def open_table_appender(
+        self,
+        data_product: str,
+        component: str,
+        *,
+        description: Optional[str] = None,
+        issues: Optional[Sequence[Issue]] = None,
+        dataset_options: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[TableAppender]:
+        """Open a table in the data product component to be written a number of rows
+        at a time, by appending tables to the TableAppender yielded.
+
+        The rows are written to a resizable dataset as they are appended, so the
+        whole table need not be held in memory, and a single write is recorded.
+        ValueError is raised if no table is appended.
+        """
+        dataset_options = self.get_dataset_options(dataset_options)
+        with self.open_object_file_for_write(
+            data_product, component, description, issues, dataset_options
+        ) as file, TableAppender(file, component, dataset_options) as appender:
+            yield appender
+
+    @contextmanager
+    def open_array_appender(
+        self,
+        data_product: str,
+        component: str,
+        *,
+        dimensions: Optional[List[Dimension]] = None,
+        units: Optional[str] = None,
+        description: Optional[str] = None,
+        issues: Optional[Sequence[Issue]] = None,
+        dataset_options: Optional[Dict[str, Any]] = None,
+        dtype: Optional[Any] = None,
+        shape: Sequence[int] = (),
+    ) -> Iterator[ArrayAppender]:
+        """Open an array in the data product component to be written a number of
+        entries along its first axis at a time, through the ArrayAppender yielded.
+
+        The entries are written to a resizable dataset as they are appended, so the
+        whole array need not be held in memory, and a single write is recorded. If
+        dtype is given, entries have that dtype and shape, and an empty array is
+        written if none are appended.
+        """
+        dataset_options = self.get_dataset_options(dataset_options)
+        with self.open_object_file_for_write(
+            data_product, component, description, issues, dataset_options
+        ) as file, ArrayAppender(
+            file, component, dimensions, units, dataset_options, dtype, shape
+        ) as appender:
+            yield appender
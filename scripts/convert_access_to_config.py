@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import click
 import yaml
+from data_pipeline_api.access_log import read_access_log
 
 
 @click.command(context_settings=dict(max_content_width=200))
@@ -21,46 +22,46 @@ import yaml
     ),
 )
 def convert_cli(access_filename, config_filename, use_filenames):
-    """Convert an access.yaml file into a config.yaml that will reproduce the same run.
+    """Convert an access.yaml (or access.jsonl) file into a config.yaml that will
+    reproduce the same run.
     """
     print(f"converting {access_filename} to {config_filename}")
-    with open(access_filename, "r") as access_file:
-        access = yaml.safe_load(access_file)
-        config = {}
-        # Copy top-level configuration.
-        for key in ("data_directory", "access_log", "run_id", "fail_on_hash_mismatch"):
-            if key in access["config"]:
-                config[key] = access["config"][key]
-        # Copy run metadata.
-        if "run_metadata" in access:
-            config["run_metadata"] = access["run_metadata"]
-        # Copy reads.
-        reads = [
-            {
-                "where": io["call_metadata"],
-                "use": {
-                    key: value
-                    for key, value in io["access_metadata"].items()
-                    if key
-                    in (
-                        ("filename",)
-                        if use_filenames
-                        else ("namespace", "data_product", "component", "version")
-                    )
-                    and value != io["call_metadata"].get(key)
-                },
-            }
-            for io in access["io"]
-            if io["type"] == "read"
-        ]
-        if reads:
-            config["read"] = reads
-        # Copy writes.
-        if "write" in access["config"]:
-            config["write"] = access["config"]["write"]
-        # Write config file.
-        with open(config_filename, "w") as config_file:
-            yaml.safe_dump(config, config_file, sort_keys=False)
+    access = read_access_log(access_filename)
+    config = {}
+    # Copy top-level configuration.
+    for key in ("data_directory", "access_log", "run_id", "fail_on_hash_mismatch"):
+        if key in access["config"]:
+            config[key] = access["config"][key]
+    # Copy run metadata.
+    if "run_metadata" in access:
+        config["run_metadata"] = access["run_metadata"]
+    # Copy reads.
+    reads = [
+        {
+            "where": io["call_metadata"],
+            "use": {
+                key: value
+                for key, value in io["access_metadata"].items()
+                if key
+                in (
+                    ("filename",)
+                    if use_filenames
+                    else ("namespace", "data_product", "component", "version")
+                )
+                and value != io["call_metadata"].get(key)
+            },
+        }
+        for io in access["io"]
+        if io["type"] == "read"
+    ]
+    if reads:
+        config["read"] = reads
+    # Copy writes.
+    if "write" in access["config"]:
+        config["write"] = access["config"]["write"]
+    # Write config file.
+    with open(config_filename, "w") as config_file:
+        yaml.safe_dump(config, config_file, sort_keys=False)
 
 
 if __name__ == "__main__":
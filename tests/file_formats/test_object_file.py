@@ -1,5 +1,7 @@
 # pylint: disable=missing-function-docstring,import-error
 from pathlib import Path
+import h5py
+import pytest
 import pandas as pd
 import numpy as np
 from data_pipeline_api.file_formats import object_file
@@ -46,3 +48,193 @@ def test_table_write_two_different_data_types(tmp_path):
         object_file.write_table(
             file, "test", pd.DataFrame({"a": ["x", "y"], "b": ["c", "d"]})
         )
+
+
+def test_read_array_selection(tmp_path):
+    array = object_file.Array(
+        data=np.arange(12).reshape(3, 4),
+        dimensions=[
+            object_file.Dimension(title="rows", names=["a", "b", "c"]),
+            object_file.Dimension(title="columns", values=[10, 20, 30, 40]),
+        ],
+        units="array units",
+    )
+    with open(tmp_path / "test.h5", "w+b") as file:
+        object_file.write_array(file, "test", array)
+    with open(tmp_path / "test.h5", "rb") as file:
+        assert object_file.read_array(file, "test", (slice(1, 3), [3, 0, 0])) == (
+            object_file.Array(
+                data=np.array([[7, 4, 4], [11, 8, 8]]),
+                dimensions=[
+                    object_file.Dimension(title="rows", names=["b", "c"]),
+                    object_file.Dimension(title="columns", values=[40, 10, 10]),
+                ],
+                units="array units",
+            )
+        )
+        assert object_file.read_array(file, "test", 1) == object_file.Array(
+            data=np.array([4, 5, 6, 7]),
+            dimensions=[
+                object_file.Dimension(title="columns", values=[10, 20, 30, 40])
+            ],
+            units="array units",
+        )
+        assert object_file.read_array(
+            file, "test", ([True, False, True], [1, 2])
+        ).data.tolist() == [[1, 2], [9, 10]]
+        assert object_file.read_array(file, "test", (-1, slice(None, None, -2))) == (
+            object_file.Array(
+                data=np.array([11, 9]),
+                dimensions=[object_file.Dimension(title="columns", values=[40, 20])],
+                units="array units",
+            )
+        )
+
+
+@pytest.mark.parametrize("selection", [(0, 0, 0), 3, [0, 3], [[0]], [0.5]])
+def test_read_array_invalid_selection(tmp_path, selection):
+    with open(tmp_path / "test.h5", "w+b") as file:
+        object_file.write_array(
+            file, "test", object_file.Array(np.arange(12).reshape(3, 4))
+        )
+    with open(tmp_path / "test.h5", "rb") as file:
+        with pytest.raises(IndexError):
+            object_file.read_array(file, "test", selection)
+
+
+def test_dataset_options(tmp_path):
+    with open(tmp_path / "test.h5", "w+b") as file:
+        object_file.write_array(
+            file,
+            "array",
+            object_file.Array(np.arange(100).reshape(10, 10)),
+            {"chunks": [5, 10], "compression": "gzip", "shuffle": True},
+        )
+        object_file.write_array(file, "scalar", object_file.Array(np.array(1)))
+        object_file.write_table(
+            file, "table", pd.DataFrame({"a": [1, 2]}), {"compression": "lzf"}
+        )
+    with h5py.File(tmp_path / "test.h5", "r") as file:
+        assert file["array/array"].chunks == (5, 10)
+        assert file["array/array"].compression == "gzip"
+        assert file["array/array"].shuffle
+        assert file["scalar/array"].chunks is None
+        assert file["table/table"].chunks is not None
+        assert file["table/table"].compression == "lzf"
+
+
+@pytest.mark.parametrize(
+    "dataset_options",
+    [
+        {"compression": "zip"},
+        {"chunk": True},
+        {"compression_opts": 4},
+        {"compression": "lzf", "compression_opts": 4},
+        {"compression": "gzip", "compression_opts": 10},
+        {"compression": "gzip", "compression_opts": "9"},
+        {"shuffle": "yes"},
+    ],
+)
+def test_invalid_dataset_options(dataset_options):
+    with pytest.raises(ValueError):
+        object_file.validate_dataset_options(dataset_options)
+
+
+def test_table_appender(tmp_path):
+    with open(tmp_path / "test.h5", "w+b") as file:
+        object_file.write_table(file, "test", pd.DataFrame({"old": [1]}))
+        with object_file.TableAppender(file, "test", {"chunks": [2]}) as appender:
+            appender.append(pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]}))
+            appender.append(pd.DataFrame({"a": [4], "b": ["longer"]}))
+            appender.append(pd.DataFrame({"a": [5], "b": ["longest"]}))
+            with pytest.raises(ValueError):
+                appender.append(pd.DataFrame({"a": [6]}))
+        object_file.write_table(file, "written", pd.DataFrame({"b": ["x"]}))
+        pd.testing.assert_frame_equal(
+            object_file.read_table(file, "test"),
+            pd.DataFrame(
+                {"a": [1, 2, 3, 4, 5], "b": ["x", "y", "z", "longer", "longest"]}
+            ),
+        )
+    with h5py.File(tmp_path / "test.h5", "r") as file:
+        assert list(file["test"]) == ["table"]
+        assert file["test/table"].chunks == (2,)
+        assert file["test/table"].maxshape == (None,)
+        # String columns have the same fixed length layout as write_table gives.
+        assert file["test/table"].dtype["b"] == np.dtype("S12")
+        assert file["written/table"].dtype["b"].kind == "S"
+
+
+def test_array_appender(tmp_path):
+    dimensions = [
+        object_file.Dimension(title="rows"),
+        object_file.Dimension(title="columns", values=[10, 20]),
+    ]
+    with open(tmp_path / "test.h5", "w+b") as file:
+        with object_file.ArrayAppender(
+            file, "test", dimensions, "array units"
+        ) as appender:
+            appender.append([1, 2])
+            appender.extend(np.array([[3, 4], [5, 6]]))
+            with pytest.raises(ValueError):
+                appender.append([7, 8, 9])
+            with pytest.raises(ValueError):
+                appender.extend(7)
+        with pytest.raises(ValueError):
+            appender.append([7, 8])
+        assert object_file.read_array(file, "test") == object_file.Array(
+            data=np.array([[1, 2], [3, 4], [5, 6]]),
+            dimensions=dimensions,
+            units="array units",
+        )
+    with h5py.File(tmp_path / "test.h5", "r") as file:
+        assert file["test/array"].maxshape == (None, 2)
+
+
+def test_appenders_check_dtypes(tmp_path):
+    with open(tmp_path / "test.h5", "w+b") as file:
+        with object_file.TableAppender(file, "table") as appender:
+            appender.append(pd.DataFrame({"a": [1], "b": ["x"]}))
+            with pytest.raises(ValueError):
+                appender.append(pd.DataFrame({"a": [1.7], "b": ["y"]}))
+            with pytest.raises(ValueError):
+                appender.append(pd.DataFrame({"a": [2], "b": [3]}))
+            appender.append(
+                pd.DataFrame({"a": np.array([2], dtype=np.int8), "b": ["z"]})
+            )
+        with object_file.ArrayAppender(file, "array") as appender:
+            appender.append([1, 2])
+            with pytest.raises(ValueError):
+                appender.append([1.5, 2.5])
+        with object_file.ArrayAppender(file, "floats", dtype=float) as appender:
+            appender.extend([1, 2])
+            appender.append(2.5)
+        pd.testing.assert_frame_equal(
+            object_file.read_table(file, "table"),
+            pd.DataFrame({"a": [1, 2], "b": ["x", "z"]}),
+        )
+        assert object_file.read_array(file, "array") == object_file.Array(
+            np.array([[1, 2]])
+        )
+        assert object_file.read_array(file, "floats") == object_file.Array(
+            np.array([1.0, 2.0, 2.5])
+        )
+
+
+def test_empty_appenders(tmp_path):
+    with open(tmp_path / "test.h5", "w+b") as file:
+        with pytest.raises(ValueError):
+            with object_file.TableAppender(file, "table"):
+                pass
+        with pytest.raises(ValueError):
+            object_file.ArrayAppender(file, "array").close()
+        with pytest.raises(RuntimeError):
+            with object_file.ArrayAppender(file, "array"):
+                raise RuntimeError
+        with object_file.ArrayAppender(
+            file, "array", units="array units", dtype=float, shape=(2,)
+        ):
+            pass
+        assert object_file.read_array(file, "array") == object_file.Array(
+            np.empty((0, 2)), units="array units"
+        )
@@ -1,6 +1,8 @@
 import pytest
 import numpy as np
+from scipy import stats
 from io import TextIOWrapper
+from unittest.mock import patch
 from data_pipeline_api.file_formats import parameter_file
 
 
@@ -23,6 +25,22 @@ def test_overwrite_parameter(tmp_path):
         parameter_file.write_parameter(TextIOWrapper(file), "test", "test")
 
 
+def test_write_parameters(tmp_path):
+    with open(tmp_path / "test.toml", "w+b") as file:
+        text_file = TextIOWrapper(file)
+        parameter_file.write_estimate(text_file, "a", 1)
+        parameter_file.write_parameters(
+            text_file,
+            {
+                "b": parameter_file.encode_estimate(2),
+                "c": parameter_file.encode_samples(np.array([3, 4])),
+            },
+        )
+        assert parameter_file.read_estimate(text_file, "a") == 1
+        assert parameter_file.read_estimate(text_file, "b") == 2
+        assert parameter_file.read_samples(text_file, "c").tolist() == [3, 4]
+
+
 def test_parameter_roundtrip(tmp_path):
     with open(tmp_path / "test.toml", "w+b") as file:
         parameter_file.write_parameter(TextIOWrapper(file), "test", "test")
@@ -70,6 +88,57 @@ def test_distribution_roundtrip(name, parameters):
     )
 
 
+@pytest.mark.parametrize(
+    ("name", "parameters", "expected"),
+    [
+        ("gamma", {"alpha": 2, "beta": 0.5}, stats.gamma(2, scale=2)),
+        ("gamma", {"shape": 2, "rate": 0.5}, stats.gamma(2, scale=2)),
+        ("normal", {"μ": 2, "σ²": 9}, stats.norm(2, 3)),
+        ("normal", {"mu": 2, "tau": 0.25}, stats.norm(2, 2)),
+        ("exponential", {"scale": 2}, stats.expon(scale=2)),
+    ],
+)
+def test_decode_distribution_parameterisations(name, parameters, expected):
+    distribution = parameter_file.decode_distribution(
+        dict(type="distribution", distribution=name, **parameters)
+    )
+    assert distribution.dist.name == expected.dist.name
+    assert distribution.mean() == pytest.approx(expected.mean())
+    assert distribution.var() == pytest.approx(expected.var())
+
+
+@pytest.mark.parametrize(
+    ("name", "parameters"),
+    [
+        ("categorical", {"bins": ["a", "b"], "weights": [0.2, 0.8]}),
+        ("gamma", {"k": 2, "theta": 3}),
+        ("poisson", {"lambda": 2}),
+        ("multinomial", {"n": 100, "p": [0.2, 0.8]}),
+    ],
+)
+def test_decode_distribution_returns_independent_copies(name, parameters):
+    parameter_file.clear_decoded_distribution_cache()
+    encoded_distribution = dict(type="distribution", distribution=name, **parameters)
+    distribution = parameter_file.decode_distribution(encoded_distribution)
+    distribution.random_state = 1
+    other_distribution = parameter_file.decode_distribution(
+        dict(encoded_distribution, summary={"mean": 0})
+    )
+    assert parameter_file._decode_canonical_distribution.cache_info().hits == 1
+    assert other_distribution is not distribution
+    assert other_distribution.random_state is not distribution.random_state
+    other_distribution.random_state = 1
+    assert np.array_equal(distribution.rvs(5), other_distribution.rvs(5))
+    assert distribution.mean() == pytest.approx(other_distribution.mean())
+
+
+def test_decode_distribution_without_matching_decoder():
+    with pytest.raises(KeyError):
+        parameter_file.decode_distribution(
+            {"type": "distribution", "distribution": "gamma", "mu": 1}
+        )
+
+
 @pytest.mark.parametrize(
     ("name", "parameters", "mean"),
     [
@@ -138,3 +207,81 @@ def test_samples_roundtrip(tmp_path):
             parameter_file.read_samples(TextIOWrapper(file), "test"), samples
         )
 
+
+@pytest.mark.parametrize(
+    "samples",
+    [np.array([1, 2, 3], dtype=np.int32), np.arange(6.0).reshape(2, 3), np.array([])],
+)
+def test_binary_samples_roundtrip(tmp_path, samples):
+    with open(tmp_path / "test.toml", "w+b") as file:
+        parameter_file.write_samples(TextIOWrapper(file), "test", samples, binary=True)
+    with open(tmp_path / "test.toml", "r+b") as file:
+        read_samples = parameter_file.read_samples(TextIOWrapper(file), "test")
+    np.testing.assert_array_equal(read_samples, samples)
+    assert read_samples.dtype == samples.dtype
+    assert read_samples.shape == samples.shape
+
+
+def test_unrecognised_samples_encoding():
+    with pytest.raises(ValueError):
+        parameter_file.decode_samples(
+            {"type": "samples", "encoding": "unknown", "samples": ""}
+        )
+
+
+def test_read_parameter_parses_each_version_once(tmp_path):
+    parameter_file.clear_parsed_document_cache()
+    with open(tmp_path / "test.toml", "w+b") as file:
+        parameter_file.write_estimate(TextIOWrapper(file), "a", 1)
+    with patch("toml.loads", wraps=parameter_file.toml.loads) as mock_loads:
+        for _ in range(3):
+            with open(tmp_path / "test.toml", "r+b") as file:
+                text_file = TextIOWrapper(file)
+                parameter_type = parameter_file.read_type(text_file, "a")
+                assert parameter_type is parameter_file.ParameterType.POINT_ESTIMATE
+                assert parameter_file.read_estimate(text_file, "a") == 1
+        assert mock_loads.call_count == 1
+        with open(tmp_path / "test.toml", "r+b") as file:
+            parameter_file.write_estimate(TextIOWrapper(file), "a", 2)
+        with open(tmp_path / "test.toml", "r+b") as file:
+            assert parameter_file.read_estimate(TextIOWrapper(file), "a") == 2
+        assert mock_loads.call_count == 2
+
+
+def test_read_parameter_returns_a_copy(tmp_path):
+    with open(tmp_path / "test.toml", "w+b") as file:
+        parameter_file.write_estimate(TextIOWrapper(file), "a", 1)
+    with open(tmp_path / "test.toml", "r+b") as file:
+        text_file = TextIOWrapper(file)
+        parameter_file.read_parameter(text_file, "a")["value"] = 2
+        assert parameter_file.read_estimate(text_file, "a") == 1
+
+
+def test_summary_roundtrip(tmp_path):
+    samples = np.array([1.0, 2.0, 3.0, 10.0])
+    with open(tmp_path / "test.toml", "w+b") as file:
+        text_file = TextIOWrapper(file)
+        parameter_file.write_samples(text_file, "samples", samples, summary=True)
+        parameter_file.write_distribution(
+            text_file, "distribution", stats.gamma(2, scale=3), summary=True
+        )
+        parameter_file.write_samples(text_file, "no-summary", samples)
+        samples_summary = parameter_file.read_summary(text_file, "samples")
+        distribution_summary = parameter_file.read_summary(text_file, "distribution")
+        assert parameter_file.read_summary(text_file, "no-summary") is None
+    assert samples_summary["mean"] == 4.0
+    assert samples_summary["variance"] == pytest.approx(np.var(samples))
+    assert parameter_file.summary_quantile(samples_summary, 0.5) == 2.5
+    assert parameter_file.summary_quantile(samples_summary, 0.3) is None
+    assert distribution_summary["mean"] == pytest.approx(6.0)
+    assert distribution_summary["variance"] == pytest.approx(18.0)
+    assert parameter_file.summary_quantile(
+        distribution_summary, 0.975
+    ) == pytest.approx(stats.gamma(2, scale=3).ppf(0.975))
+
+
+def test_categorical_distribution_cannot_be_summarised():
+    with pytest.raises(ValueError):
+        parameter_file.encode_distribution(
+            parameter_file.Categorical(["a", "b"], [0.5, 0.5]), summary=True
+        )
@@ -5,6 +5,7 @@ from typing import List
 from unittest.mock import patch, Mock
 
 import pytest
+import yaml
 
 from data_pipeline_api.registry.downloader import Downloader
 from data_pipeline_api.registry.common import DataRegistryTarget, DataRegistryField
@@ -647,3 +648,39 @@ def test_download_data_twice(downloader):
             downloader._download()
             fs_path.assert_called_once_with("http", "http://source_uri", "source_path")
             fs.get.assert_called_once_with("path", "output_path", block_size=0)
+
+
+def _resolved_data_product(version):
+    return {
+        (DataRegistryTarget.data_product, DataRegistryField.name): "name",
+        (DataRegistryTarget.namespace, DataRegistryField.name): "namespace",
+        (DataRegistryTarget.storage_root, DataRegistryField.accessibility): 0,
+        (DataRegistryTarget.data_product, DataRegistryField.version): version,
+        (DataRegistryTarget.storage_location, DataRegistryField.hash): "somehash",
+        "output_filename": "filename.ext",
+        "full_output_filename": "/filename.ext",
+        (DataRegistryTarget.object_component, DataRegistryField.name): "component",
+    }
+
+
+@pytest.mark.parametrize("existing", ["- {version: 0.0.1}", "[{version: 0.0.1}]"])
+def test_write_metadata_append(tmp_path, downloader, existing):
+    with open(tmp_path / "metadata.yaml", "w") as metadata_file:
+        metadata_file.write(existing)
+    downloader._resolved_data_products = [_resolved_data_product("1.0.0")]
+    downloader.write_metadata(append=True)
+    downloader._resolved_data_products = [_resolved_data_product("2.0.0")]
+    downloader.write_metadata(append=True)
+    with open(tmp_path / "metadata.yaml") as metadata_file:
+        metadata = yaml.safe_load(metadata_file)
+    assert [entry["version"] for entry in metadata] == ["0.0.1", "1.0.0", "2.0.0"]
+
+
+def test_write_metadata_replaces_by_default(tmp_path, downloader):
+    with open(tmp_path / "metadata.yaml", "w") as metadata_file:
+        metadata_file.write("- {version: 0.0.1}")
+    downloader._resolved_data_products = [_resolved_data_product("1.0.0")]
+    downloader.write_metadata()
+    with open(tmp_path / "metadata.yaml") as metadata_file:
+        metadata = yaml.safe_load(metadata_file)
+    assert [entry["version"] for entry in metadata] == ["1.0.0"]
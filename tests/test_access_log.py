@@ -0,0 +1,105 @@
+import json
+from datetime import datetime
+import pytest
+from data_pipeline_api.access_log import read_access_log
+from data_pipeline_api.file_api import FileAPI
+
+
+@pytest.fixture
+def configuration_file(tmp_path):
+    with open(tmp_path / "input.txt", "w") as file:
+        file.write("input")
+    with open(tmp_path / "metadata.yaml", "w") as file:
+        file.write(
+            f"""
+- data_product: input
+  version: 1.0.0
+  filename: input.txt
+  verified_hash: {FileAPI.calculate_hash(tmp_path / "input.txt")}
+"""
+        )
+    with open(tmp_path / "config.yaml", "w") as file:
+        file.write(
+            """
+run_id: test_run
+access_log: access.jsonl
+"""
+        )
+    return tmp_path / "config.yaml"
+
+
+def run(file_api):
+    file_api.open_for_read(data_product="input").close()
+    with file_api.open_for_write(data_product="output", extension="txt") as file:
+        file.write(b"output")
+
+
+def test_reads_are_streamed_as_they_happen(tmp_path, configuration_file):
+    file_api = FileAPI(configuration_file)
+    run(file_api)
+    with open(tmp_path / "access.jsonl") as access_file:
+        lines = [json.loads(line) for line in access_file]
+    assert [line.get("type") for line in lines] == [None, "read"]
+    access_log = read_access_log(tmp_path / "access.jsonl")
+    assert "close_timestamp" not in access_log["run_metadata"]
+    file_api.close()
+    records = list(read_access_log(tmp_path / "access.jsonl")["io"])
+    assert [record["type"] for record in records] == ["read", "write"]
+
+
+def test_writes_are_recorded_with_the_final_hash(tmp_path, configuration_file):
+    with FileAPI(configuration_file) as file_api:
+        for component in ("a", "b"):
+            with file_api.open_for_write(
+                data_product="output", component=component, extension="txt"
+            ) as file:
+                file.seek(0, 2)
+                file.write(component.encode())
+    records = list(read_access_log(tmp_path / "access.jsonl")["io"])
+    assert len(records) == 2
+    for record in records:
+        assert record["access_metadata"]["calculated_hash"] == (
+            FileAPI.calculate_hash(tmp_path / "output" / "test_run.txt")
+        )
+
+
+def test_read_access_log_matches_yaml_access_log(tmp_path, configuration_file):
+    with FileAPI(configuration_file) as file_api:
+        run(file_api)
+    with open(configuration_file, "a") as file:
+        file.write("access_log: access.yaml\n")
+    with FileAPI(configuration_file) as file_api:
+        run(file_api)
+    json_lines_log = read_access_log(tmp_path / "access.jsonl")
+    yaml_log = read_access_log(tmp_path / "access.yaml")
+    assert isinstance(json_lines_log["run_metadata"]["close_timestamp"], datetime)
+    assert json_lines_log["config"]["access_log"] == "access.jsonl"
+    assert json_lines_log["run_metadata"].keys() == yaml_log["run_metadata"].keys()
+    for json_lines_record, yaml_record in zip(json_lines_log["io"], yaml_log["io"]):
+        assert isinstance(json_lines_record.pop("timestamp"), datetime)
+        yaml_record.pop("timestamp")
+        assert json_lines_record == yaml_record
+    assert len(list(json_lines_log["io"])) == len(yaml_log["io"]) == 2
+
+
+def test_aggregated_reads_are_written_on_close(tmp_path, configuration_file):
+    with open(configuration_file, "a") as file:
+        file.write("aggregate_reads: true\n")
+    with FileAPI(configuration_file) as file_api:
+        run(file_api)
+        run(file_api)
+    records = list(read_access_log(tmp_path / "access.jsonl")["io"])
+    assert [record["type"] for record in records] == ["read", "write", "write"]
+    assert records[0]["count"] == 2
+    assert isinstance(records[0]["last_timestamp"], datetime)
+
+
+def test_truncated_last_line_is_ignored(tmp_path, configuration_file):
+    file_api = FileAPI(configuration_file)
+    run(file_api)
+    file_api.open_for_read(data_product="input").close()
+    with open(tmp_path / "access.jsonl", "r+b") as access_file:
+        access_file.truncate(access_file.seek(0, 2) - 10)
+    access_log = read_access_log(tmp_path / "access.jsonl")
+    assert "close_timestamp" not in access_log["run_metadata"]
+    assert [record["type"] for record in access_log["io"]] == ["read"]
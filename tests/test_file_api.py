@@ -1,8 +1,14 @@
+import gc
 import logging
+import os
+import sqlite3
+from hashlib import sha1
 from pathlib import Path
 from unittest.mock import Mock, patch
 import pytest
+from data_pipeline_api.access_log import read_access_log
 from data_pipeline_api.file_api import FileAPI, FileAccess, ReadAccess, WriteAccess
+from data_pipeline_api.metadata_store import MetadataStore
 
 logging.basicConfig(level="DEBUG")
 
@@ -67,6 +73,22 @@ def test_write(tmp_path: Path, configuration_file: Path):
             assert file.read() == "contents3"
 
 
+def test_record_write(configuration_file: Path):
+    with FileAPI(configuration_file) as api:
+        with api.open_for_write(data_product="test", extension="txt") as file:
+            file.write("contents3".encode())
+            api.record_write(file, data_product="test", component="a", extension="txt")
+            with pytest.raises(ValueError):
+                api.record_write(file, data_product="other", extension="txt")
+        with pytest.raises(ValueError):
+            api.record_write(file, data_product="test", extension="txt")
+    assert [access.call_metadata.get("component") for access in api._accesses] == [
+        None,
+        "a",
+    ]
+    assert api._accesses[0].path == api._accesses[1].path
+
+
 def test_read_hash_mismatch(configuration_file: Path):
     file_api = FileAPI(configuration_file)
 
@@ -275,3 +297,305 @@ def test_multiple_writes_to_same_file_record_same_hash(configuration_file):
         access_log["io"][0]["access_metadata"]["calculated_hash"]
         == access_log["io"][1]["access_metadata"]["calculated_hash"]
     )
+
+
+def test_hash_block_size_from_config(tmp_path, configuration_file):
+    with open(configuration_file, "a") as file:
+        file.write("hash_block_size: 3\n")
+    file_api = FileAPI(configuration_file)
+    with file_api.open_for_read(data_product="test") as file:
+        assert file.read().decode() == "contents2"
+    with open(configuration_file, "a") as file:
+        file.write("hash_block_size: 0\n")
+    with pytest.raises(ValueError):
+        FileAPI(configuration_file)
+
+
+def test_hash_cache_can_be_disabled(tmp_path, configuration_file):
+    with open(configuration_file, "a") as file:
+        file.write("use_hash_cache: False\n")
+    with FileAPI(configuration_file) as file_api:
+        file_api.open_for_read(data_product="test").close()
+    assert not (tmp_path / "hash_cache.json").exists()
+
+
+def test_hash_cache_is_saved_on_close(tmp_path, configuration_file):
+    os.utime(tmp_path / "version2.txt", ns=(0, 0))
+    with FileAPI(configuration_file) as file_api:
+        file_api.open_for_read(data_product="test").close()
+    assert (tmp_path / "hash_cache.json").exists()
+
+
+@pytest.mark.parametrize("hash_verification", ["close", "session"])
+def test_hash_while_reading(configuration_file, hash_verification):
+    with open(configuration_file, "a") as file:
+        file.write(f"hash_verification: {hash_verification}\n")
+    with FileAPI(configuration_file) as file_api:
+        with file_api.open_for_read(data_product="test") as file:
+            assert file.read(3).decode() == "con"
+        access_log = file_api._generate_access_log()
+    assert access_log["io"][0]["access_metadata"]["calculated_hash"] == (
+        FileAPI.calculate_hash(configuration_file.parent / "version2.txt")
+    )
+
+
+def test_hash_while_reading_raises_on_file_close(configuration_file):
+    with open(configuration_file, "a") as file:
+        file.write("hash_verification: close\n")
+    with open(configuration_file.parent / "version2.txt", "w") as file:
+        file.write("modified")
+    file_api = FileAPI(configuration_file)
+    file = file_api.open_for_read(data_product="test")
+    assert file.read().decode() == "modified"
+    with pytest.raises(ValueError):
+        file.close()
+
+
+def test_hash_while_reading_raises_on_session_close_if_file_is_not_closed(
+    configuration_file,
+):
+    with open(configuration_file, "a") as file:
+        file.write("hash_verification: close\n")
+    with open(configuration_file.parent / "version2.txt", "w") as file:
+        file.write("modified")
+    file_api = FileAPI(configuration_file)
+    file = file_api.open_for_read(data_product="test")
+    assert file.read().decode() == "modified"
+    del file
+    gc.collect()
+    with pytest.raises(ValueError):
+        file_api.close()
+
+
+def test_hash_while_reading_raises_on_session_close(configuration_file):
+    with open(configuration_file, "a") as file:
+        file.write("hash_verification: session\n")
+    with open(configuration_file.parent / "version2.txt", "w") as file:
+        file.write("modified")
+    file_api = FileAPI(configuration_file)
+    file_api.open_for_read(data_product="test").close()
+    with pytest.raises(ValueError):
+        file_api.close()
+    assert (configuration_file.parent / "access.yaml").exists()
+
+
+def test_invalid_hash_verification(configuration_file):
+    with open(configuration_file, "a") as file:
+        file.write("hash_verification: never\n")
+    with pytest.raises(ValueError):
+        FileAPI(configuration_file)
+
+
+def test_writes_are_hashed_while_writing(configuration_file):
+    file_api = FileAPI(configuration_file)
+    with file_api.open_for_write(data_product="test", extension="txt") as file:
+        file.write("foo".encode())
+        file.write("bar".encode())
+    with patch("data_pipeline_api.file_api.FileAPI.calculate_hash") as mock_hash:
+        access_log = file_api._generate_access_log()
+        mock_hash.assert_not_called()
+    assert access_log["io"][0]["access_metadata"]["calculated_hash"] == (
+        sha1(b"foobar").hexdigest()
+    )
+
+
+def test_overwrites_are_hashed_again(configuration_file):
+    file_api = FileAPI(configuration_file)
+    with file_api.open_for_write(data_product="test", extension="txt") as file:
+        file.write("foobar".encode())
+        file.seek(0)
+        file.write("baz".encode())
+    access_log = file_api._generate_access_log()
+    assert access_log["io"][0]["access_metadata"]["calculated_hash"] == (
+        sha1(b"bazbar").hexdigest()
+    )
+
+
+def test_generate_access_log_with_hash_workers(tmp_path, configuration_file):
+    with open(configuration_file, "a") as file:
+        file.write("hash_workers: 4\n")
+    file_api = FileAPI(configuration_file)
+    for version in ("1.0.0", "2.0.0", "1.0.0"):
+        file_api.open_for_read(data_product="test", version=version).close()
+    for name in ("a", "b"):
+        with file_api.open_for_write(data_product=name, extension="txt") as file:
+            # Overwrite, so that the file must be hashed again.
+            file.write(name.encode())
+            file.seek(0)
+            file.write(name.encode())
+    paths = [
+        tmp_path / "version1.txt",
+        tmp_path / "version2.txt",
+        tmp_path / "version1.txt",
+        tmp_path / "a" / "test_run.txt",
+        tmp_path / "b" / "test_run.txt",
+    ]
+    assert [
+        record["access_metadata"]["calculated_hash"]
+        for record in file_api._generate_access_log()["io"]
+    ] == [FileAPI.calculate_hash(path) for path in paths]
+
+
+def test_aggregate_reads(configuration_file):
+    with open(configuration_file, "a") as file:
+        file.write("aggregate_reads: true\n")
+    file_api = FileAPI(configuration_file)
+    for version in ("1.0.0", "2.0.0", "1.0.0", "1.0.0"):
+        file_api.open_for_read(data_product="test", version=version).close()
+    records = file_api._generate_access_log()["io"]
+    assert [record["call_metadata"]["version"] for record in records] == [
+        "1.0.0",
+        "2.0.0",
+    ]
+    assert records[0]["count"] == 3
+    assert records[0]["last_timestamp"] >= records[0]["timestamp"]
+    assert "count" not in records[1]
+
+
+def test_metadata_snapshot(tmp_path, configuration_file):
+    metadata_file = tmp_path / "metadata.yaml"
+    os.utime(metadata_file, ns=(0, 0))
+    FileAPI(configuration_file).load_metadata_store()
+    assert (tmp_path / "metadata.snapshot").exists()
+    with patch("data_pipeline_api.file_api.MetadataStore") as mock_store:
+        file_api = FileAPI(configuration_file)
+        file_api.load_metadata_store()
+        mock_store.assert_not_called()
+    assert file_api.get_read_metadata({"data_product": "test"})["version"] == "2.0.0"
+    with open(metadata_file, "a") as file:
+        file.write("- {data_product: test, version: 3.0.0, filename: version1.txt}\n")
+    os.utime(metadata_file, ns=(0, 1))
+    file_api = FileAPI(configuration_file)
+    assert file_api.get_read_metadata({"data_product": "test"})["version"] == "3.0.0"
+
+
+def test_metadata_snapshot_not_written_for_recently_modified_metadata(
+    tmp_path, configuration_file
+):
+    FileAPI(configuration_file).load_metadata_store()
+    assert not (tmp_path / "metadata.snapshot").exists()
+
+
+def test_metadata_snapshot_can_be_disabled(tmp_path, configuration_file):
+    os.utime(tmp_path / "metadata.yaml", ns=(0, 0))
+    with open(configuration_file, "a") as file:
+        file.write("use_metadata_snapshot: False\n")
+    FileAPI(configuration_file).load_metadata_store()
+    assert not (tmp_path / "metadata.snapshot").exists()
+
+
+def test_metadata_store_is_loaded_lazily(configuration_file):
+    with patch("data_pipeline_api.file_api.FileAPI.construct_metadata_store") as mock:
+        mock.return_value = MetadataStore([{"data_product": "test"}])
+        file_api = FileAPI(configuration_file)
+        with file_api.open_for_write(data_product="output", extension="txt"):
+            pass
+        mock.assert_not_called()
+        file_api.get_read_metadata({"data_product": "test"})
+        file_api.get_read_metadata({"data_product": "test"})
+        mock.assert_called_once()
+        file_api.invalidate_metadata_store()
+        file_api.get_read_metadata({"data_product": "test"})
+        assert mock.call_count == 2
+
+
+def test_update_metadata_store_adds_appended_metadata(tmp_path, configuration_file):
+    file_api = FileAPI(configuration_file)
+    assert file_api.get_read_metadata({"data_product": "test"})["version"] == "2.0.0"
+    with open(tmp_path / "metadata.yaml", "a") as file:
+        file.write("- {data_product: test, version: 3.0.0, filename: version1.txt}\n")
+    with patch("data_pipeline_api.file_api.MetadataStore") as mock_store:
+        file_api.update_metadata_store()
+        mock_store.assert_not_called()
+    assert file_api.get_read_metadata({"data_product": "test"})["version"] == "3.0.0"
+
+
+def test_update_metadata_store_reloads_replaced_metadata(tmp_path, configuration_file):
+    file_api = FileAPI(configuration_file)
+    assert file_api.get_read_metadata({"data_product": "test"})["version"] == "2.0.0"
+    with open(tmp_path / "metadata.yaml", "w") as file:
+        file.write("- {data_product: test, version: 3.0.0, filename: version1.txt}\n")
+    file_api.update_metadata_store()
+    assert file_api.get_read_metadata({"data_product": "test"})["version"] == "3.0.0"
+
+
+def test_sqlite_metadata_backend(tmp_path, configuration_file):
+    os.utime(tmp_path / "metadata.yaml", ns=(0, 0))
+    with open(configuration_file, "a") as file:
+        file.write("metadata_backend: sqlite\n")
+    file_api = FileAPI(configuration_file)
+    assert file_api.get_read_metadata({"data_product": "test"})["version"] == "2.0.0"
+    assert (tmp_path / "metadata.sqlite").exists()
+    with patch("data_pipeline_api.file_api.yaml.load") as mock_load:
+        FileAPI.construct_sqlite_metadata_store(tmp_path / "metadata.yaml")
+        mock_load.assert_not_called()
+    with file_api.open_for_read(data_product="test", version="1.0.0") as file:
+        assert file.read() == b"contents1"
+    metadata_store = file_api.get_metadata_store()
+    file_api.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        len(metadata_store)
+
+
+def test_invalid_metadata_backend(configuration_file):
+    with open(configuration_file, "a") as file:
+        file.write("metadata_backend: invalid\n")
+    with pytest.raises(ValueError):
+        FileAPI(configuration_file)
+
+
+def test_read_metadata_is_cached(configuration_file):
+    file_api = FileAPI(configuration_file)
+    file_api.load_metadata_store()
+    with patch.object(
+        file_api._metadata_store, "find", wraps=file_api._metadata_store.find
+    ) as mock_find:
+        for _ in range(3):
+            read_metadata = file_api.get_read_metadata({"data_product": "test"})
+            assert read_metadata["version"] == "2.0.0"
+            read_metadata["version"] = "modified"
+        file_api.get_read_metadata({"data_product": "test", "version": "1.0.0"})
+        assert mock_find.call_count == 2
+    file_api.load_metadata_store()
+    assert file_api._read_metadata_cache == {}
+
+
+def test_get_path_for_read(configuration_file: Path):
+    with FileAPI(configuration_file) as api:
+        path = api.get_path_for_read(data_product="test", version="1.0.0")
+        assert path.read_text() == "contents1"
+    (access,) = api._accesses
+    assert access.access_metadata["calculated_hash"] == FileAPI.calculate_hash(path)
+
+
+def test_get_path_for_read_hash_mismatch(configuration_file: Path):
+    file_api = FileAPI(configuration_file)
+    with patch("data_pipeline_api.file_api.FileAPI.calculate_hash") as mock_hash:
+        mock_hash.return_value = "some_random_hash"
+        with pytest.raises(ValueError):
+            file_api.get_path_for_read(data_product="test", version="1.0.0")
+
+
+@pytest.mark.parametrize("access_log", ["access.yaml", "access.jsonl"])
+def test_get_path_for_write(tmp_path: Path, configuration_file: Path, access_log):
+    configuration_file.write_text(
+        configuration_file.read_text().replace("access.yaml", access_log)
+    )
+    with FileAPI(configuration_file) as api:
+        path = api.get_path_for_write(data_product="test", extension="txt")
+        assert path == tmp_path / "test" / "test_run.txt"
+        path.write_text("contents3")
+    (write,) = read_access_log(tmp_path / access_log)["io"]
+    assert write["type"] == "write"
+    assert write["access_metadata"]["calculated_hash"] == sha1(b"contents3").hexdigest()
+
+
+def test_close_callbacks_run_before_writes_are_hashed(
+    tmp_path: Path, configuration_file: Path
+):
+    api = FileAPI(configuration_file)
+    path = api.get_path_for_write(data_product="test", extension="txt")
+    api.add_close_callback(lambda: path.write_text("contents3"))
+    api.close()
+    (write,) = read_access_log(tmp_path / "access.yaml")["io"]
+    assert write["access_metadata"]["calculated_hash"] == sha1(b"contents3").hexdigest()
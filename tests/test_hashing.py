@@ -0,0 +1,111 @@
+import json
+import os
+from hashlib import sha1
+from io import BufferedReader, BufferedRandom
+import pytest
+from data_pipeline_api.hashing import (
+    hash_file,
+    calculate_file_hash,
+    HashCache,
+    HashingFileIO,
+)
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 1024, 1 << 20])
+def test_calculate_file_hash_is_independent_of_block_size(tmp_path, block_size):
+    contents = bytes(range(256)) * 17
+    (tmp_path / "test.bin").write_bytes(contents)
+    assert (
+        calculate_file_hash(tmp_path / "test.bin", block_size=block_size)
+        == sha1(contents).hexdigest()
+    )
+
+
+def test_calculate_file_hash_appends_extra_bytes(tmp_path):
+    (tmp_path / "test.bin").write_bytes(b"hello")
+    assert (
+        calculate_file_hash(tmp_path / "test.bin", b"world")
+        == sha1(b"helloworld").hexdigest()
+    )
+
+
+def test_hash_file_rejects_invalid_block_size(tmp_path):
+    (tmp_path / "test.bin").write_bytes(b"hello")
+    with open(tmp_path / "test.bin", "rb") as file:
+        with pytest.raises(ValueError):
+            hash_file(file, block_size=0)
+
+
+@pytest.fixture
+def old_file(tmp_path):
+    path = tmp_path / "test.bin"
+    path.write_bytes(b"hello")
+    os.utime(path, ns=(0, 0))
+    return path
+
+
+def test_hash_cache_returns_cached_hash_of_unchanged_file(tmp_path, old_file):
+    hash_cache = HashCache(tmp_path / "hash_cache.json")
+    hexdigest = calculate_file_hash(old_file, hash_cache=hash_cache)
+    hash_cache.save()
+    with open(tmp_path / "hash_cache.json") as cache_file:
+        entries = json.load(cache_file)
+    entries[str(old_file.resolve())][-1] = "cached"
+    with open(tmp_path / "hash_cache.json", "w") as cache_file:
+        json.dump(entries, cache_file)
+    assert hexdigest == sha1(b"hello").hexdigest()
+    hash_cache = HashCache(tmp_path / "hash_cache.json")
+    assert calculate_file_hash(old_file, hash_cache=hash_cache) == "cached"
+
+
+def test_hash_cache_ignores_changed_file(tmp_path, old_file):
+    hash_cache = HashCache(tmp_path / "hash_cache.json")
+    calculate_file_hash(old_file, hash_cache=hash_cache)
+    old_file.write_bytes(b"goodbye")
+    assert hash_cache.get(old_file) is None
+    assert (
+        calculate_file_hash(old_file, hash_cache=hash_cache)
+        == sha1(b"goodbye").hexdigest()
+    )
+
+
+def test_hash_cache_does_not_cache_recently_modified_file(tmp_path):
+    (tmp_path / "test.bin").write_bytes(b"hello")
+    hash_cache = HashCache(tmp_path / "hash_cache.json")
+    calculate_file_hash(tmp_path / "test.bin", hash_cache=hash_cache)
+    assert hash_cache.get(tmp_path / "test.bin") is None
+
+
+def test_hashing_file_io_hashes_unread_and_out_of_order_parts_on_close(tmp_path):
+    contents = bytes(range(256)) * 100
+    (tmp_path / "test.bin").write_bytes(contents)
+    hexdigests = []
+    hashing_file = HashingFileIO(
+        tmp_path / "test.bin", lambda file: hexdigests.append(file.hexdigest()), 7
+    )
+    with BufferedReader(hashing_file, buffer_size=16) as file:
+        assert file.read(100) == contents[:100]
+        file.seek(1000)
+        assert file.read(100) == contents[1000:1100]
+        file.seek(50)
+        assert file.read(100) == contents[50:150]
+    assert hexdigests == [sha1(contents).hexdigest()]
+
+
+def test_hashing_file_io_hashes_sequential_writes(tmp_path):
+    (tmp_path / "test.bin").write_bytes(b"existing contents")
+    hashing_file = HashingFileIO(tmp_path / "test.bin", mode="r+b")
+    with BufferedRandom(hashing_file) as file:
+        assert file.read() == b"existing contents"
+        file.seek(0)
+        file.truncate()
+        file.write(b"new contents")
+    assert hashing_file.hexdigest() == sha1(b"new contents").hexdigest()
+
+
+def test_hashing_file_io_does_not_hash_partial_writes(tmp_path):
+    (tmp_path / "test.bin").write_bytes(b"existing contents")
+    hashing_file = HashingFileIO(tmp_path / "test.bin", mode="r+b")
+    with BufferedRandom(hashing_file) as file:
+        file.write(b"new")
+    assert hashing_file.hexdigest() is None
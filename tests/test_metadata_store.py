@@ -1,5 +1,15 @@
+import json
+import os
+from datetime import date
+from unittest.mock import patch
+
 import pytest
-from data_pipeline_api.metadata_store import MetadataStore
+from data_pipeline_api.metadata_store import (
+    SNAPSHOT_FORMAT,
+    MetadataStore,
+    read_snapshot,
+    write_snapshot,
+)
 
 
 def test_find_superset():
@@ -34,3 +44,124 @@ def test_missing_version_is_ok():
 
 def test_can_be_initalised_with_None():
     MetadataStore(None)
+
+
+def test_find_uses_index_for_literal_values():
+    store = MetadataStore(
+        [
+            {"data_product": "a", "component": "x", "version": "1.0.0"},
+            {"data_product": "a", "component": "y", "version": "2.0.0"},
+            {"data_product": "b", "component": "x", "version": "3.0.0"},
+        ]
+    )
+    assert store.find({"data_product": "a", "component": "x"})["version"] == "1.0.0"
+    assert store.find({"data_product": "a"})["version"] == "2.0.0"
+    assert store.find({"data_product": "c"}) is None
+
+
+def test_find_with_wildcards_matches_indexed_keys():
+    store = MetadataStore(
+        [
+            {"data_product": "a/b", "version": "1.0.0"},
+            {"data_product": "a/c", "version": "2.0.0"},
+            {"data_product": "[a]", "version": "3.0.0"},
+        ]
+    )
+    assert store.find({"data_product": "a/*"})["version"] == "2.0.0"
+    assert store.find({"data_product": "a/[b]"})["version"] == "1.0.0"
+    assert store.find({"data_product": "[[]a]"})["version"] == "3.0.0"
+
+
+def test_find_with_non_string_values():
+    store = MetadataStore([{"component": 1}, {"component": "1"}, {"component": [1]}])
+    assert store.find({"component": 1}) == {"component": 1}
+    assert store.find({"component": "1"}) == {"component": "1"}
+    assert store.find({"component": [1]}) == {"component": [1]}
+
+
+def test_find_with_prefix_glob():
+    store = MetadataStore(
+        [
+            {"data_product": "human/a", "version": "1.0.0"},
+            {"data_product": "human/b", "version": "2.0.0"},
+            {"data_product": "humans", "version": "3.0.0"},
+            {"data_product": 1, "version": "4.0.0"},
+        ]
+    )
+    assert store.find({"data_product": "human/*"})["version"] == "2.0.0"
+    assert store.find({"data_product": "human*"})["version"] == "3.0.0"
+    assert store.find({"data_product": "animal/*"}) is None
+
+
+def test_extend():
+    store = MetadataStore([{"data_product": "a", "version": "1.0.0"}])
+    assert store.find({"data_product": "a*"})["version"] == "1.0.0"
+    store.extend(
+        [
+            {"data_product": "a", "version": "2.0.0"},
+            {"data_product": "ab", "version": "3.0.0"},
+        ]
+    )
+    assert store.find({"data_product": "a"})["version"] == "2.0.0"
+    assert store.find({"data_product": "a*"})["version"] == "3.0.0"
+
+
+def test_extend_with_invalid_metadata():
+    with pytest.raises(ValueError):
+        MetadataStore().extend([{"version": 1}])
+
+
+def test_find_latest_version_of_component():
+    metadata = [
+        {"namespace": "n", "data_product": "a", "component": "c", "version": v}
+        for v in ("1.0.0", "3.0.0-rc1", "2.0.0", "3.0.0-rc2", "2.0.0+build")
+    ]
+    store = MetadataStore(metadata[:2])
+    store.extend(metadata[2:])
+    query = {"namespace": "n", "data_product": "a", "component": "c"}
+    assert store.find(query) is metadata[3]
+    assert store.find({**query, "version": "2.*"}) is metadata[2]
+
+
+def test_unversioned_records_rank_last():
+    store = MetadataStore([{"key": "value"}, {"key": "value", "version": "0.1.0"}])
+    assert store.find({"key": "value"}) == {"key": "value", "version": "0.1.0"}
+
+
+def test_snapshot_of_another_format_is_ignored(tmp_path):
+    source = tmp_path / "metadata.yaml"
+    source.touch()
+    os.utime(source, ns=(0, 0))
+    snapshot = tmp_path / "metadata.snapshot"
+    with patch(
+        "data_pipeline_api.metadata_store.SNAPSHOT_FORMAT", SNAPSHOT_FORMAT - 1
+    ):
+        write_snapshot(snapshot, source.stat(), MetadataStore([{"version": "1.0.0"}]))
+    assert snapshot.exists()
+    assert read_snapshot(snapshot, source.stat()) is None
+
+
+def test_snapshot_is_json(tmp_path):
+    source = tmp_path / "metadata.yaml"
+    source.touch()
+    os.utime(source, ns=(0, 0))
+    snapshot = tmp_path / "metadata.snapshot"
+    metadata = [
+        {"data_product": "a", "component": "b", "namespace": "c", "version": "1.0.0"},
+        {"data_product": "a", "component": "b", "namespace": "c", "version": "2.0.0"},
+    ]
+    write_snapshot(snapshot, source.stat(), MetadataStore(metadata))
+    with open(snapshot) as snapshot_file:
+        assert json.load(snapshot_file)["metadata"] == metadata
+    store = read_snapshot(snapshot, source.stat())
+    assert store.find({"data_product": "a"}) == metadata[1]
+
+
+def test_snapshot_not_written_for_metadata_json_cannot_represent(tmp_path):
+    source = tmp_path / "metadata.yaml"
+    source.touch()
+    os.utime(source, ns=(0, 0))
+    snapshot = tmp_path / "metadata.snapshot"
+    for metadata in ({"date": date(2020, 1, 1)}, {"values": (1, 2)}):
+        write_snapshot(snapshot, source.stat(), MetadataStore([metadata]))
+        assert not snapshot.exists()
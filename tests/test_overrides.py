@@ -24,3 +24,31 @@ def test_apply_in_order():
         )
     ).apply(metadata)
     assert metadata == {"key": "value", "override": 2}
+
+
+def test_find_with_globs():
+    overrides = [
+        Override(where={"key": "human/*"}, use={"override": 1}),
+        Override(where={"key": "human/[ab]"}, use={"override": 2}),
+        Override(where={"key": "human/a"}, use={"override": 3}),
+        Override(where={"key": "*"}, use={"override": 4}),
+        Override(where={"key": "animal/*"}, use={"override": 5}),
+    ]
+    assert list(Overrides(overrides).find({"key": "human/a"})) == overrides[:4]
+    assert list(Overrides(overrides).find({"key": "human/c"})) == [
+        overrides[0],
+        overrides[3],
+    ]
+    assert list(Overrides(overrides).find({"key": 1})) == []
+
+
+def test_apply_matches_updated_metadata():
+    metadata = {"key": "value"}
+    Overrides(
+        (
+            Override(where={"key": "value"}, use={"key": "other"}),
+            Override(where={"key": "value"}, use={"override": 1}),
+            Override(where={"key": "other"}, use={"override": 2}),
+        )
+    ).apply(metadata)
+    assert metadata == {"key": "other", "override": 2}
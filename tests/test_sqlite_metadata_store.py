@@ -0,0 +1,86 @@
+import json
+import sqlite3
+from datetime import date
+
+import pytest
+from data_pipeline_api.sqlite_metadata_store import SQLiteMetadataStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteMetadataStore(tmp_path / "metadata.sqlite")
+
+
+def test_find_superset(store):
+    store.extend([{"key": "value", "version": "1.0.0"}])
+    assert store.find({"key": "value"}) == {"key": "value", "version": "1.0.0"}
+
+
+def test_do_not_find_subset(store):
+    store.extend([{"key": "value", "version": "1.0.0"}])
+    assert store.find({"key": "value", "hello": "world"}) is None
+
+
+def test_find_highest_version(store):
+    store.extend(
+        [
+            {"data_product": "a", "version": "1.0.0-rc1"},
+            {"data_product": "a", "version": "1.0.0"},
+            {"data_product": "a", "version": "1.0.0-rc2"},
+            {"data_product": "b", "version": "2.0.0"},
+        ]
+    )
+    assert store.find({"data_product": "a"}) == {
+        "data_product": "a",
+        "version": "1.0.0",
+    }
+    assert store.find({})["version"] == "2.0.0"
+
+
+def test_find_with_globs(store):
+    store.extend(
+        [
+            {"data_product": "human/a", "version": "1.0.0"},
+            {"data_product": "human/b", "version": "2.0.0"},
+            {"data_product": "animal/b", "version": "3.0.0"},
+            {"data_product": 1, "version": "4.0.0"},
+        ]
+    )
+    assert store.find({"data_product": "human/*"})["version"] == "2.0.0"
+    assert store.find({"data_product": "human/[!b]"})["version"] == "1.0.0"
+    assert store.find({"data_product": "*/b"})["version"] == "3.0.0"
+    assert store.find({"data_product": 1})["version"] == "4.0.0"
+
+
+def test_versions_must_be_semver(store):
+    with pytest.raises(ValueError):
+        store.extend([{"version": 1}])
+
+
+def test_replace_records_source(tmp_path, store):
+    store.extend([{"data_product": "a"}])
+    store.replace([{"data_product": "b"}], [1, 2, 3])
+    reopened = SQLiteMetadataStore(tmp_path / "metadata.sqlite")
+    assert len(reopened) == 1
+    assert reopened.find({"data_product": "b"}) == {"data_product": "b"}
+    assert reopened.source == [1, 2, 3]
+
+
+def test_records_are_json(tmp_path, store):
+    metadata = {"data_product": "a", "released": date(2020, 1, 2), "tags": ["x"]}
+    store.extend([metadata])
+    assert store.find({"data_product": "a"}) == metadata
+    (record,) = sqlite3.connect(str(tmp_path / "metadata.sqlite")).execute(
+        "SELECT record FROM metadata"
+    ).fetchone()
+    assert json.loads(record)["tags"] == ["x"]
+
+
+def test_store_of_another_schema_version_is_emptied(tmp_path, store):
+    store.replace([{"data_product": "a"}], [1, 2, 3])
+    store.close()
+    with sqlite3.connect(str(tmp_path / "metadata.sqlite")) as connection:
+        connection.execute("PRAGMA user_version = 0")
+    reopened = SQLiteMetadataStore(tmp_path / "metadata.sqlite")
+    assert len(reopened) == 0
+    assert reopened.source is None
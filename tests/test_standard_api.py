@@ -1,12 +1,21 @@
 # pylint: disable=redefined-outer-name,missing-function-docstring,import-error
 import os
+import shutil
 from pathlib import Path
+from unittest.mock import patch
+import h5py
 import pytest
+import toml
 import yaml
 import numpy as np
 import pandas as pd
 from scipy import stats
 from data_pipeline_api.file_api import RunMetadata
+from data_pipeline_api.file_formats.object_file import read_array, read_table
+from data_pipeline_api.file_formats.parameter_file import (
+    encode_distribution,
+    encode_samples,
+)
 from data_pipeline_api.standard_api import StandardAPI, Array, Issue
 
 DATA_ROOT = Path(__file__).parent / "data"
@@ -160,3 +169,294 @@ def test_description(tmp_path, standard_api):
         assert (
             access_yaml["io"][0]["access_metadata"]["description"] == "test description"
         )
+
+
+def test_parameter_writer(tmp_path, standard_api):
+    with standard_api as api:
+        with api.parameter_writer("output-parameter") as writer:
+            writer.write_estimate("example-estimate", 1.0, description="estimate")
+            writer.write_distribution("example-distribution", stats.gamma(1, scale=2))
+            writer.write_samples("example-samples", np.array([1, 2, 3]))
+    with open(tmp_path / "access-example.yaml") as access_log_file:
+        access_log = yaml.safe_load(access_log_file)
+    writes = [access for access in access_log["io"] if access["type"] == "write"]
+    assert [write["call_metadata"]["component"] for write in writes] == [
+        "example-estimate",
+        "example-distribution",
+        "example-samples",
+    ]
+    assert writes[0]["call_metadata"]["description"] == "estimate"
+    assert len({write["access_metadata"]["filename"] for write in writes}) == 1
+    assert len({write["access_metadata"]["calculated_hash"] for write in writes}) == 1
+    parameters = toml.load(tmp_path / writes[0]["access_metadata"]["filename"])
+    assert parameters["example-estimate"] == {"type": "point-estimate", "value": 1.0}
+    assert parameters["example-distribution"]["distribution"] == "gamma"
+    assert parameters["example-samples"]["samples"] == [1, 2, 3]
+
+
+def test_parameter_writer_discards_components_on_exception(tmp_path, standard_api):
+    with pytest.raises(RuntimeError):
+        with standard_api as api:
+            with api.parameter_writer("output-parameter") as writer:
+                writer.write_estimate("example-estimate", 1.0)
+                raise RuntimeError
+    assert not (tmp_path / "output-parameter").exists()
+
+
+def test_read_quantile(standard_api):
+    with standard_api as api:
+        assert api.read_quantile(
+            "parameter", "example-distribution", 0.5
+        ) == pytest.approx(stats.gamma(1, scale=2).ppf(0.5))
+        samples = api.read_samples("parameter", "example-samples")
+        assert api.read_quantile(
+            "parameter", "example-samples", 0.25
+        ) == pytest.approx(np.quantile(samples, 0.25))
+        with pytest.raises(ValueError):
+            api.read_quantile("parameter", "example-estimate", 0.5)
+
+
+def test_read_summary_statistics(tmp_path):
+    with open(tmp_path / "config.yaml", "w") as config_file:
+        config_file.write(
+            "data_directory: .\nrun_id: test\nfail_on_hash_mismatch: False\n"
+        )
+    with open(tmp_path / "metadata.yaml", "w") as metadata_file:
+        yaml.safe_dump(
+            [
+                {
+                    "data_product": "summary",
+                    "component": component,
+                    "filename": "summary.toml",
+                }
+                for component in ("distribution", "samples")
+            ],
+            metadata_file,
+        )
+    with open(tmp_path / "summary.toml", "w") as parameter_file:
+        toml.dump(
+            {
+                "distribution": encode_distribution(stats.norm(1, 2), summary=True),
+                "samples": encode_samples(np.array([1.0, 2.0, 6.0]), summary=True),
+            },
+            parameter_file,
+        )
+    api = StandardAPI.from_config(tmp_path / "config.yaml", "repo", "sha")
+    with patch(
+        "data_pipeline_api.standard_api.read_distribution"
+    ) as mock_read_distribution, patch(
+        "data_pipeline_api.standard_api.read_samples"
+    ) as mock_read_samples:
+        assert api.read_estimate("summary", "distribution") == 1.0
+        assert api.read_estimate("summary", "samples") == 3.0
+        assert api.read_quantile("summary", "distribution", 0.5) == pytest.approx(1)
+        assert api.read_quantile("summary", "samples", 0.5) == 2.0
+        mock_read_distribution.assert_not_called()
+        mock_read_samples.assert_not_called()
+    assert api.read_quantile("summary", "distribution", 0.3) == pytest.approx(
+        stats.norm(1, 2).ppf(0.3)
+    )
+
+
+def test_native_hdf5(tmp_path, standard_api):
+    native_api = StandardAPI(
+        standard_api.file_api, "test_git_repo", "test_git_sha", native_hdf5=True
+    )
+    table = pd.DataFrame({"a": [1, 2], "b": [3, 4]})
+    with native_api as api:
+        pd.testing.assert_frame_equal(api.read_table("object", "example-table"), table)
+        assert api.read_array("object", "example-array") == Array(np.array([1, 2, 3]))
+        api.write_table("output-object", "example-table", table)
+        api.write_array("output-object", "example-array", Array(np.array([1, 2, 3])))
+    with open(tmp_path / "access-example.yaml") as access_log_file:
+        access_log = yaml.safe_load(access_log_file)
+    filename = tmp_path / "output-object" / "example.h5"
+    assert [access["type"] for access in access_log["io"]] == [
+        "read",
+        "read",
+        "write",
+        "write",
+    ]
+    for access in access_log["io"][2:]:
+        assert access["access_metadata"]["filename"] == "output-object/example.h5"
+        assert access["access_metadata"]["calculated_hash"] == (
+            standard_api.file_api.calculate_hash(filename)
+        )
+    with open(filename, "rb") as file:
+        pd.testing.assert_frame_equal(read_table(file, "example-table"), table)
+
+
+def test_native_hdf5_reuses_object_files(tmp_path, standard_api):
+    native_api = StandardAPI(
+        standard_api.file_api, "test_git_repo", "test_git_sha", native_hdf5=True
+    )
+    with native_api as api:
+        with api.open_object_file_for_read(
+            "object", "example-table"
+        ) as table_file, api.open_object_file_for_read(
+            "object", "example-array"
+        ) as array_file:
+            assert table_file is array_file
+        api.read_array("object", "example-array")
+        api.write_table("output-object", "example-table", pd.DataFrame({"a": [1]}))
+        api.write_array("output-object", "example-array", Array(np.array([1])))
+        with api.open_object_file_for_write("output-object", "example-array") as file:
+            assert read_array(file, "example-array") == Array(np.array([1]))
+        object_files = list(api._object_files.values())
+    assert len(object_files) == 2
+    assert not any(object_file.id.valid for object_file in object_files)
+    with open(tmp_path / "access-example.yaml") as access_log_file:
+        access_log = yaml.safe_load(access_log_file)
+    assert [access["type"] for access in access_log["io"]] == ["read"] * 3 + [
+        "write"
+    ] * 3
+    assert access_log["io"][-1]["access_metadata"]["calculated_hash"] == (
+        standard_api.file_api.calculate_hash(tmp_path / "output-object" / "example.h5")
+    )
+
+
+def test_read_array_selection(standard_api):
+    with standard_api as api:
+        assert api.read_array(
+            "object", "example-array", selection=[2, 0]
+        ) == Array(np.array([3, 1]))
+
+
+def test_dataset_options(tmp_path, standard_api):
+    with open(DATA_ROOT / "config.yaml") as config_file:
+        config = yaml.safe_load(config_file)
+    config["dataset_options"] = {"compression": "gzip", "compression_opts": 9}
+    with open(tmp_path / "compressed-config.yaml", "w") as config_file:
+        yaml.safe_dump(config, config_file)
+    with StandardAPI.from_config(
+        tmp_path / "compressed-config.yaml", "test_git_repo", "test_git_sha"
+    ) as api:
+        api.write_array("output-object", "gzip-array", Array(np.arange(10)))
+        api.write_array(
+            "output-object",
+            "lzf-array",
+            Array(np.arange(10)),
+            dataset_options={"chunks": (5,), "compression": "lzf"},
+        )
+    with h5py.File(tmp_path / "output-object" / "example.h5", "r") as file:
+        assert file["gzip-array/array"].compression == "gzip"
+        assert file["gzip-array/array"].compression_opts == 9
+        assert file["lzf-array/array"].compression == "lzf"
+        assert file["lzf-array/array"].chunks == (5,)
+    with open(tmp_path / "access-example.yaml") as access_log_file:
+        access_log = yaml.safe_load(access_log_file)
+    assert [
+        access["access_metadata"]["dataset_options"] for access in access_log["io"]
+    ] == [
+        {
+            "chunks": True,
+            "compression": "gzip",
+            "compression_opts": 9,
+            "shuffle": False,
+        },
+        {"chunks": [5], "compression": "lzf", "shuffle": False},
+    ]
+
+
+@pytest.mark.parametrize("native_hdf5", [False, True])
+def test_appenders(tmp_path, standard_api, native_hdf5):
+    api = StandardAPI(
+        standard_api.file_api,
+        "test_git_repo",
+        "test_git_sha",
+        native_hdf5=native_hdf5,
+    )
+    with api:
+        with api.open_table_appender("output-object", "example-table") as appender:
+            for i in range(3):
+                appender.append(pd.DataFrame({"a": [i], "b": [str(i) * (i + 1)]}))
+        with api.open_array_appender(
+            "output-object", "example-array", units="array units"
+        ) as appender:
+            for i in range(3):
+                appender.append([i, i])
+    with open(tmp_path / "access-example.yaml") as access_log_file:
+        access_log = yaml.safe_load(access_log_file)
+    assert [access["type"] for access in access_log["io"]] == ["write", "write"]
+    with open(tmp_path / "output-object" / "example.h5", "rb") as file:
+        pd.testing.assert_frame_equal(
+            read_table(file, "example-table"),
+            pd.DataFrame({"a": [0, 1, 2], "b": ["0", "11", "222"]}),
+        )
+        assert read_array(file, "example-array") == Array(
+            np.array([[0, 0], [1, 1], [2, 2]]), units="array units"
+        )
+
+
+def test_native_hdf5_read_after_write_is_hashed_as_read(tmp_path, standard_api):
+    with open(DATA_ROOT / "config.yaml") as config_file:
+        config = yaml.safe_load(config_file)
+    config["read"] = [
+        {
+            "where": {"data_product": "output-object"},
+            "use": {"filename": "output-object/example.h5"},
+        }
+    ]
+    with open(tmp_path / "read-output-config.yaml", "w") as config_file:
+        yaml.safe_dump(config, config_file)
+    with StandardAPI.from_config(
+        tmp_path / "read-output-config.yaml",
+        "test_git_repo",
+        "test_git_sha",
+        native_hdf5=True,
+    ) as api:
+        api.write_array("output-object", "example-array", Array(np.arange(1000)))
+        assert api.read_array("output-object", "example-array") == Array(
+            np.arange(1000)
+        )
+        # The file as it was hashed when the read was recorded.
+        shutil.copy(tmp_path / "output-object" / "example.h5", tmp_path / "read.h5")
+    with open(tmp_path / "access-example.yaml") as access_log_file:
+        access_log = yaml.safe_load(access_log_file)
+    assert [access["type"] for access in access_log["io"]] == ["write", "read"]
+    assert access_log["io"][1]["access_metadata"]["calculated_hash"] == (
+        standard_api.file_api.calculate_hash(tmp_path / "read.h5")
+    )
+    with open(tmp_path / "read.h5", "rb") as file:
+        assert read_array(file, "example-array") == Array(np.arange(1000))
+
+
+def test_native_hdf5_cannot_write_a_file_being_read(tmp_path, standard_api):
+    with h5py.File(tmp_path / "test.h5", "w") as file:
+        file["a"] = 1
+    native_api = StandardAPI(
+        standard_api.file_api, "test_git_repo", "test_git_sha", native_hdf5=True
+    )
+    with native_api as api:
+        with api._open_object_file(tmp_path / "test.h5", "r") as read_file:
+            with pytest.raises(ValueError):
+                with api._open_object_file(tmp_path / "test.h5", "a"):
+                    pass
+            assert read_file["a"][()] == 1
+        with api._open_object_file(tmp_path / "test.h5", "a") as write_file:
+            assert not read_file.id.valid
+            write_file["b"] = 2
+        with api._open_object_file(tmp_path / "test.h5", "r") as file:
+            assert file is write_file
+
+
+def test_empty_array_appender(tmp_path, standard_api):
+    with standard_api as api:
+        with api.open_array_appender(
+            "output-object", "example-array", dtype=int, shape=(2,)
+        ):
+            pass
+    with open(tmp_path / "output-object" / "example.h5", "rb") as file:
+        assert read_array(file, "example-array") == Array(np.empty((0, 2), int))
+
+
+def test_invalid_config_dataset_options(tmp_path, standard_api):
+    with open(DATA_ROOT / "config.yaml") as config_file:
+        config = yaml.safe_load(config_file)
+    config["dataset_options"] = {"compression_opts": 4}
+    with open(tmp_path / "invalid-config.yaml", "w") as config_file:
+        yaml.safe_dump(config, config_file)
+    with pytest.raises(ValueError):
+        StandardAPI.from_config(
+            tmp_path / "invalid-config.yaml", "test_git_repo", "test_git_sha"
+        )